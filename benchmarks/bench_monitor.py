@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+Measure the CPU overhead of the job monitor (novacula.popen.Monitor).
+
+The benchmark starts a job made of N sleeping processes and monitors it for the given
+duration. The monitor runs in a thread of this process while the main thread only waits
+for it, so the CPU time consumed by this process during the run is the monitor overhead.
+
+usage:
+    python benchmarks/bench_monitor.py --processes 1 10 100 --duration 20
+    python benchmarks/bench_monitor.py --accounting cgroup --interval 1
+"""
+
+import sys
+import time
+import psutil
+import argparse
+import subprocess
+
+from novacula.popen import Monitor
+from novacula.gpu   import NullSampler
+
+
+def run( processes : int, duration : float, accounting : str, interval : float=None ) -> dict:
+    # NOTE: a fixed interval disables the adaptive sampling (same min and max, no backoff)
+    intervals = {"min_interval":interval, "max_interval":interval} if interval else {}
+    command   = f"for i in $(seq {processes}); do sleep {duration} & done; wait"
+    proc      = subprocess.Popen(command, shell=True)
+    monitor   = Monitor(proc, accounting=accounting, gpu_sampler=NullSampler(), **intervals)
+    this      = psutil.Process()
+    before    = this.cpu_times()
+    start     = time.time()
+    monitor.start()
+    monitor.join()
+    after     = this.cpu_times()
+    wall      = time.time() - start
+    cpu       = (after.user - before.user) + (after.system - before.system)
+    samples   = max(monitor.num_samples, 1)
+    return {
+        "processes"            : processes,
+        "accounting"           : type(monitor.accounting).__name__,
+        "samples"              : monitor.num_samples,
+        "cpu_ms"               : 1e3 * cpu,
+        "overhead_percent"     : 100 * cpu / wall,
+        "cpu_us_per_sample"    : 1e6 * cpu / samples,
+        "cpu_us_per_process"   : 1e6 * cpu / samples / (processes + 1), # the shell plus the sleeps
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Measure the CPU overhead of the job monitor.')
+    parser.add_argument('--processes', nargs='+', type=int, default=[1, 10, 100],
+                        help = "The number of processes of the monitored job.")
+    parser.add_argument('--duration', type=float, default=20,
+                        help = "The job duration (seconds).")
+    parser.add_argument('--accounting', default="psutil", choices=["auto", "cgroup", "psutil"],
+                        help = "The accounting backend.")
+    parser.add_argument('--interval', type=float, default=None,
+                        help = "Use a fixed sampling interval (seconds) instead of the adaptive one.")
+    args = parser.parse_args()
+
+    header = ["processes", "accounting", "samples", "cpu_ms", "overhead_percent", "cpu_us_per_sample", "cpu_us_per_process"]
+    print(" ".join(f"{name:>20}" for name in header))
+    for processes in args.processes:
+        result = run(processes, args.duration, args.accounting, args.interval)
+        print(" ".join(f"{result[name]:>20.2f}" if type(result[name])==float else f"{result[name]:>20}" for name in header))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -68,22 +68,82 @@ def symlink(target, linkpath):
         else:
             raise e
       
+from . import retry
+__all__.extend( retry.__all__ )
+from .retry import *
+
 from . import sbatch 
 __all__.extend( sbatch.__all__ )
 from .sbatch import *
          
-from . import popen 
+from . import gpu
+__all__.extend( gpu.__all__ )
+from .gpu import *
+
+from . import accounting
+__all__.extend( accounting.__all__ )
+from .accounting import *
+
+from . import series
+__all__.extend( series.__all__ )
+from .series import *
+
+from . import runtime
+__all__.extend( runtime.__all__ )
+from .runtime import *
+
+from . import popen
 __all__.extend( popen.__all__ )
 from .popen import *
 
-from . import db
-__all__.extend( db.__all__ )
-from .db import *
+from . import status
+__all__.extend( status.__all__ )
+from .status import *
+
+from . import jobspec
+__all__.extend( jobspec.__all__ )
+from .jobspec import *
+
+from . import board
+__all__.extend( board.__all__ )
+from .board import *
+
+from . import client
+__all__.extend( client.__all__ )
+from .client import *
+
+from . import agent
+__all__.extend( agent.__all__ )
+from .agent import *
+
+# NOTE: the database, flow and provider modules depend on SQLAlchemy. They are only
+# imported on the first access to one of their names, so the job runtime (njob) does
+# not load the ORM stack. The names are listed here to keep them in __all__ and dir().
+__lazy_modules__ = {
+    "db"       : ["Base", "Task", "DBTask", "TaskStatus", "Job", "DBJob", "JobStatus", "job_status", "job_metrics",
+                  "TaskCounter", "add_to_counter", "move_counter", "rebuild_counters", "SchemaVersion",
+                  "Journal", "record_event", "fetch_events", "fetch_counters", "fetch_task_statuses",
+                  "JobArchive", "archive_jobs", "fetch_archived_jobs", "fetch_archived_summary",
+                  "fetch_archived_filenames", "fetch_next_job_id", "JobSeries", "store_series", "fetch_series",
+                  "SCHEMA_VERSION", "fetch_schema_version", "upgrade_db", "DBService", "get_db_service",
+                  "create_db", "get_db_url", "JOB_COLUMNS", "iter_job_columns", "fetch_job_arrays",
+                  "fetch_job_frame", "export_jobs"],
+    "models"   : ["get_context", "Task", "load", "dump", "Dataset", "Image"],
+    "provider" : ["Flow", "Session"],
+}
+# NOTE: keep the star import semantics, names from later modules override the earlier ones
+__lazy_names__ = { name : module_name for module_name, names in __lazy_modules__.items() for name in names }
+__all__.extend( name for name in __lazy_names__ if name not in __all__ )
 
-from . import models
-__all__.extend( models.__all__ )
-from .models import *
+def __getattr__(name):
+    import importlib
+    if name in __lazy_modules__:
+        return importlib.import_module(f".{name}", __name__)
+    if name not in __lazy_names__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr( importlib.import_module(f".{__lazy_names__[name]}", __name__), name )
+    globals()[name] = value
+    return value
 
-from . import provider
-__all__.extend( provider.__all__ )
-from .provider import *
\ No newline at end of file
+def __dir__():
+    return sorted( set(globals()) | set(__lazy_modules__) | set(__lazy_names__) )
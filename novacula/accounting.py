@@ -0,0 +1,241 @@
+"""
+This module implements the resource accounting backends used by the job monitor.
+
+When Slurm places the job into its own cgroup (cgroup v2), the kernel already keeps
+the exact memory peak, the CPU time and the I/O bytes of every process of the job,
+including the short-lived children which exist between two samples. Reading a few
+files of the cgroup is then enough to sample the job at a near-zero cost. Otherwise,
+the psutil backend walks the process tree of the job at each sample.
+
+Backends:
+- `CgroupAccounting`: reads memory.current, memory.peak, cpu.stat and io.stat.
+- `PsutilAccounting`: sums the usage of the job process and all its children.
+
+Each sample is a dictionary with the keys cpu_percent, cpu_time (seconds), sys_memory_mb,
+sys_memory_mb_peak (None if not tracked by the backend), io_read_mb and io_write_mb.
+
+The cgroup selected under Slurm is the one of the job step, which also holds the runner
+and, for bundles and pilots, the jobs executed before. The cumulative counters (cpu time
+and io) are then reported from a baseline taken when the job starts. The memory peak is
+reset when the kernel supports it (a write into memory.peak, linux 6.12+, only seen by
+the same file descriptor). Otherwise it is only used when the cgroup is not shared with
+other jobs, the monitor keeping the highest sampled usage instead.
+"""
+
+__all__ = [
+    "CgroupAccounting",
+    "PsutilAccounting",
+    "get_accounting",
+    "cgroup_path",
+]
+
+import os
+import psutil
+
+from time   import time
+from typing import Dict, List, Union
+from loguru import logger
+
+
+CGROUP_ROOTS = ["/sys/fs/cgroup", "/sys/fs/cgroup/unified"] # unified and hybrid hierarchies
+MB           = 1024**2
+
+
+def cgroup_path( pid : int ) -> Union[str, None]:
+    """
+    Return the cgroup v2 directory of the process.
+
+    Returns:
+        Union[str, None]: The cgroup directory or None if the process is not in a cgroup v2
+                          with the memory controller enabled.
+    """
+    try:
+        with open(f"/proc/{pid}/cgroup", 'r') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    for line in lines:
+        hierarchy, controllers, path = line.split(":", 2)
+        if hierarchy == "0" and controllers == "":
+            for root in CGROUP_ROOTS:
+                if os.path.exists(f"{root}{path}/memory.current"):
+                    return f"{root}{path}"
+    return None
+
+
+
+class CgroupAccounting:
+
+    def __init__(self, path : str, shared : bool=False):
+        """
+        Initializes the cgroup v2 accounting of the job.
+
+        Parameters:
+        ----------
+        path : str
+            The cgroup directory of the job.
+        shared : bool, optional
+            The cgroup holds other jobs of the allocation (bundles and pilots), so its memory
+            peak can not be used unless it is reset for this job. Defaults to False.
+        """
+        self.path      = path
+        self.__last    = None
+        # NOTE: the counters accumulated before the job start (runner and previous jobs)
+        io             = self.__io()
+        self.__base    = {
+            "cpu_time" : self.__stat("cpu.stat").get("usage_usec", 0) / 1e6,
+            "rbytes"   : io["rbytes"],
+            "wbytes"   : io["wbytes"],
+        }
+        self.__peak_fd = self.__reset_peak()
+        self.__peak    = self.__peak_fd is not None or not shared
+
+    def __reset_peak(self) -> Union[int, None]:
+        try:
+            fd = os.open(f"{self.path}/memory.peak", os.O_RDWR)
+        except OSError:
+            return None
+        try:
+            os.write(fd, b"reset")
+            int(os.pread(fd, 64, 0))
+            return fd
+        except (OSError, ValueError):
+            # NOTE: read-only before linux 6.12
+            os.close(fd)
+            return None
+
+    def __read_peak(self) -> Union[int, None]:
+        try:
+            content = os.pread(self.__peak_fd, 64, 0).decode() if self.__peak_fd is not None else self.__read("memory.peak")
+            return int(content) if content else None
+        except (OSError, ValueError):
+            return None
+
+    def __read(self, name : str) -> Union[str, None]:
+        try:
+            with open(f"{self.path}/{name}", 'r') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def __stat(self, name : str) -> Dict[str, int]:
+        content = self.__read(name) or ""
+        return { key : int(value) for key, value in (line.split() for line in content.splitlines() if line) }
+
+    def __io(self) -> Dict[str, int]:
+        total = {"rbytes":0, "wbytes":0}
+        for line in (self.__read("io.stat") or "").splitlines():
+            for field in line.split()[1:]:
+                key, value = field.split("=")
+                if key in total:
+                    total[key] += int(value)
+        return total
+
+    def pids(self) -> List[int]:
+        return [ int(pid) for pid in (self.__read("cgroup.procs") or "").split() ]
+
+    def sample(self) -> Dict[str, float]:
+        now         = time()
+        cpu_time    = self.__stat("cpu.stat").get("usage_usec", 0) / 1e6 - self.__base["cpu_time"]
+        cpu_percent = 0
+        if self.__last:
+            last_time, last_cpu_time = self.__last
+            cpu_percent = 100 * (cpu_time - last_cpu_time) / max(now - last_time, 1e-6)
+        self.__last = (now, cpu_time)
+        peak = self.__read_peak() if self.__peak else None
+        io   = self.__io()
+        return {
+            "cpu_percent"        : cpu_percent,
+            "cpu_time"           : cpu_time,
+            "sys_memory_mb"      : int(self.__read("memory.current") or 0) / MB,
+            "sys_memory_mb_peak" : peak / MB if peak else None,
+            "io_read_mb"         : (io["rbytes"] - self.__base["rbytes"]) / MB,
+            "io_write_mb"        : (io["wbytes"] - self.__base["wbytes"]) / MB,
+        }
+
+    def close(self):
+        if self.__peak_fd is not None:
+            os.close(self.__peak_fd)
+            self.__peak_fd = None
+
+
+
+class PsutilAccounting:
+
+    def __init__(self, proc_stat : psutil.Process):
+        """
+        Initializes the process tree accounting of the job.
+
+        Parameters:
+        ----------
+        proc_stat : psutil.Process
+            The job process.
+        """
+        self.proc_stat = proc_stat
+        # NOTE: the handles are kept between samples, since cpu_percent is measured from the
+        # cpu times of the previous call on the same handle
+        self.__procs   = { proc_stat.pid : proc_stat }
+
+    def children(self) -> List[psutil.Process]:
+        children = self.proc_stat.children(recursive=True)
+        # NOTE: if not children, use the parent for measurements...
+        if len(children)==0:
+            children = [self.proc_stat]
+        self.__procs = { child.pid : self.__procs.get(child.pid, child) for child in children }
+        return list(self.__procs.values())
+
+    def pids(self) -> List[int]:
+        # NOTE: the processes found by the last sample, to avoid walking the tree twice
+        return list(self.__procs)
+
+    def sample(self) -> Dict[str, float]:
+        sample   = {"cpu_percent":0, "cpu_time":0, "sys_memory_mb":0, "sys_memory_mb_peak":None, "io_read_mb":0, "io_write_mb":0}
+        for child in self.children():
+            try:
+                # NOTE: one read of /proc/<pid>/stat and status for all values below
+                with child.oneshot():
+                    sample["sys_memory_mb"] += child.memory_info().rss / MB
+                    sample["cpu_percent"]   += child.cpu_percent()
+                    cpu_times = child.cpu_times()
+                    sample["cpu_time"]      += cpu_times.user + cpu_times.system
+                    try:
+                        io = child.io_counters()
+                        sample["io_read_mb"]  += io.read_bytes  / MB
+                        sample["io_write_mb"] += io.write_bytes / MB
+                    except (psutil.AccessDenied, AttributeError):
+                        pass
+            except psutil.NoSuchProcess:
+                # NOTE: finished between the tree walk and the sample
+                self.__procs.pop(child.pid, None)
+        return sample
+
+    def close(self):
+        pass
+
+
+
+def get_accounting( proc_stat : psutil.Process, backend : str="auto", shared : bool=False ) -> Union[CgroupAccounting, PsutilAccounting]:
+    """
+    Return the accounting backend of the job process.
+
+    Parameters:
+        proc_stat (psutil.Process): The job process.
+        backend (str): "cgroup", "psutil" or "auto". The auto mode uses the cgroup of the job
+                       when Slurm placed the job into its own cgroup v2, and psutil otherwise.
+        shared (bool): The cgroup also holds other jobs of the allocation (see CgroupAccounting).
+
+    Returns:
+        Union[CgroupAccounting, PsutilAccounting]: The accounting backend.
+    """
+    if backend not in ("auto", "cgroup", "psutil"):
+        raise ValueError(f"accounting backend {backend} is not supported. use auto, cgroup or psutil.")
+    if backend != "psutil":
+        path   = cgroup_path(proc_stat.pid)
+        job_id = os.environ.get("SLURM_JOB_ID")
+        # NOTE: outside of a Slurm job cgroup, the cgroup is shared with other processes (user session)
+        if path and (backend == "cgroup" or (job_id and f"job_{job_id}" in path)):
+            logger.debug(f"using the cgroup v2 accounting from {path}.")
+            return CgroupAccounting(path, shared=shared)
+        if backend == "cgroup":
+            logger.warning("cgroup v2 accounting not available for the job process. using psutil instead.")
+    return PsutilAccounting(proc_stat)
@@ -0,0 +1,232 @@
+"""
+This module implements the optional per-node status aggregation agent (nagent).
+
+Many njob processes running on the same node would otherwise open one connection
+each and write their start, status and heartbeat events separately into the shared
+flow database. When an agent is running, the jobs send these events as datagrams
+through a local Unix socket instead. The agent coalesces the events of each job
+(the last status and the last heartbeat win) and writes them into the database in
+one batched transaction per interval. The updates of a failed transaction are kept and
+written in the next interval.
+
+Final statuses (completed, failed and killed) are always written directly by the job
+to guarantee that they are persisted even if the agent is stopped, and kill requests
+are always polled directly from the database. Batched status updates never overwrite
+a final status or a kill request.
+"""
+
+__all__ = [
+    "Agent",
+    "AgentClient",
+    "AgentJob",
+    "AGENT_SOCKET",
+]
+
+import os
+import json
+import socket
+import threading
+
+from typing          import Dict, List, Tuple
+from loguru          import logger
+from novacula.client import StatusClient, StatusJob, now
+from novacula.status import JobStatus
+
+
+AGENT_SOCKET   = os.environ.get("NOVACULA_AGENT_SOCKET", f"/tmp/novacula-agent-{os.getuid()}.sock")
+AGENT_INTERVAL = 5 # seconds
+FINAL_STATUS   = [JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.KILLED]
+
+
+class Agent:
+
+    def __init__(self, path : str=AGENT_SOCKET, interval : float=AGENT_INTERVAL):
+        """
+        Initializes the status aggregation agent.
+
+        Parameters:
+        ----------
+        path : str, optional
+            The Unix socket path used to receive the job events.
+        interval : float, optional
+            The time (seconds) between two batched transactions. Defaults to 5.
+        """
+        self.path     = path
+        self.interval = interval
+        self.__lock    = threading.Lock()
+        self.__stop    = threading.Event()
+        self.__pending = {}
+        self.__clients = {}
+        self.__socket  = None
+
+    def receive(self, event : Dict):
+        """
+        Coalesce one job event into the pending updates.
+        """
+        key = (event['db_file'], event['task_name'], event['job_id'])
+        with self.__lock:
+            update = self.__pending.setdefault(key, {"task_name":event['task_name'], "job_id":event['job_id']})
+            if event['event'] == "start":
+                update['starts']     = update.get('starts', 0) + 1
+                update['start_time'] = event['time']
+            elif event['event'] == "status":
+                update['status']     = event['status']
+            update['updated_time'] = event['time']
+
+    def flush(self):
+        """
+        Write all pending updates, one transaction per database.
+        """
+        with self.__lock:
+            pending, self.__pending = self.__pending, {}
+        batches = {}
+        for (db_file, _, _), update in pending.items():
+            batches.setdefault(db_file, []).append(update)
+        for db_file, updates in batches.items():
+            try:
+                if db_file not in self.__clients:
+                    self.__clients[db_file] = StatusClient(db_file)
+                self.__clients[db_file].apply(updates)
+                logger.debug(f"flushed {len(updates)} job updates into {db_file}.")
+            except Exception as e:
+                logger.error(f"not possible to flush {len(updates)} job updates into {db_file}: {e}. retrying in the next interval.")
+                client = self.__clients.pop(db_file, None)
+                if client:
+                    client.close()
+                self.__restore(db_file, updates)
+
+    def __restore(self, db_file : str, updates : List[Dict]):
+        """
+        Put back the updates of a failed flush, under the events received since then.
+        """
+        with self.__lock:
+            for update in updates:
+                key   = (db_file, update['task_name'], update['job_id'])
+                newer = self.__pending.get(key, {})
+                # NOTE: the newer status, start and heartbeat win, the start events are added
+                merged = {**update, **newer}
+                if update.get('starts') or newer.get('starts'):
+                    merged['starts'] = update.get('starts', 0) + newer.get('starts', 0)
+                self.__pending[key] = merged
+
+    def __flush_loop(self):
+        while not self.__stop.wait(self.interval):
+            self.flush()
+
+    def serve(self):
+        """
+        Listen for job events until the agent is stopped.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.__socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.__socket.bind(self.path)
+        self.__socket.settimeout(1)
+        flusher = threading.Thread(target=self.__flush_loop, daemon=True)
+        flusher.start()
+        logger.info(f"agent listening on {self.path} with a flush interval of {self.interval}s.")
+        try:
+            while not self.__stop.is_set():
+                try:
+                    message = self.__socket.recv(65536)
+                except socket.timeout:
+                    continue
+                try:
+                    self.receive(json.loads(message))
+                except Exception as e:
+                    logger.warning(f"discarding malformed event: {e}")
+        finally:
+            self.__stop.set()
+            flusher.join()
+            self.__socket.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.flush()
+            [client.close() for client in self.__clients.values()]
+            logger.info("agent stopped.")
+
+    def stop(self):
+        self.__stop.set()
+
+
+
+class AgentClient:
+
+    def __init__(self, client : StatusClient, path : str=AGENT_SOCKET):
+        """
+        Initializes the agent client used by the jobs.
+
+        Parameters:
+        ----------
+        client : StatusClient
+            The direct database client used as fallback.
+        path : str, optional
+            The Unix socket path of the agent.
+        """
+        self.path      = path
+        self.client    = client
+        self.db_file   = os.path.abspath(client.db_file)
+        self.available = os.path.exists(path)
+        self.__socket  = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) if self.available else None
+
+    def send(self, event : Dict) -> bool:
+        """
+        Send one event to the agent.
+
+        Returns:
+            bool: False if the agent is not available, then the caller must write directly.
+        """
+        if not self.available:
+            return False
+        try:
+            event['db_file'] = self.db_file
+            event['time']    = now()
+            self.__socket.sendto(json.dumps(event).encode(), self.path)
+            return True
+        except OSError as e:
+            logger.warning(f"agent not available anymore ({e}). falling back to direct database writes.")
+            self.available = False
+            return False
+
+    def job(self, task_name : str, job_id : int) -> 'AgentJob':
+        return AgentJob(task_name, job_id, self)
+
+
+
+class AgentJob:
+
+    def __init__(self, task_name : str, job_id : int, agent : AgentClient):
+        self.task_name = task_name
+        self.job_id    = job_id
+        self.__agent   = agent
+        self.__direct  = agent.client.job(task_name, job_id)
+
+    def __event(self, name : str, **kwargs) -> Dict:
+        return {"event":name, "task_name":self.task_name, "job_id":self.job_id, **kwargs}
+
+    def start(self):
+        if not self.__agent.send(self.__event("start")):
+            self.__direct.start()
+
+    def update_status(self, status : JobStatus) -> bool:
+        """
+        Send the status to the agent, or write it directly if final or if the agent is not available.
+
+        Returns:
+            bool: False if the status was deferred to the agent (not in the database yet).
+        """
+        if (status in FINAL_STATUS) or (not self.__agent.send(self.__event("status", status=status.name))):
+            self.__direct.update_status(status)
+            return True
+        return False
+
+    def ping(self):
+        if not self.__agent.send(self.__event("ping")):
+            self.__direct.ping()
+
+    def update_metrics(self, metrics : Dict, exitcode : int=None, series : bytes=None):
+        # NOTE: written once at the end of the job, always direct
+        self.__direct.update_metrics(metrics, exitcode, series)
+
+    def fetch_status(self) -> JobStatus:
+        return self.__direct.fetch_status()
@@ -0,0 +1,195 @@
+"""
+This module implements the memory-mapped job status board of a task.
+
+The state of a job fits in a single byte, so a task keeps an optional board file
+with one byte per job id holding the position of the job status in `job_status`.
+A zero byte is an ASSIGNED job, so new jobs are added by growing the file. Status
+histograms and the list of job ids with a given status are computed by scanning the
+memory-mapped board in C (bytes.count and a translate mask) instead of loading one
+row per job from the database.
+
+The board is a cache of the `job` table, which remains the source of truth. Each job
+runner writes its own byte once the status is in the database (the statuses batched by
+the node agent reach the board with the next reconciliation), with a single positioned
+write (never a dirty page from a shared mapping, which could overwrite the bytes of
+other jobs on network file systems) and the board is reconciled with the database when the task is submitted and closed,
+when the tasks are printed from the board and periodically by `ntask watch`. The
+reconciliation only writes the bytes which differ from the database, and skips the
+bytes written by a runner since the board snapshot, which are newer than the database
+read (see `StatusBoard.reconcile`).
+"""
+
+__all__ = [
+    "StatusBoard",
+    "BoardJob",
+    "BOARD_FILE",
+]
+
+import os, mmap
+
+from typing          import Dict, List, Iterable, Tuple
+from itertools       import compress
+from novacula.status import JobStatus, job_status
+
+
+BOARD_FILE  = "status.board"
+STATUS_CODE = { status : code for code, status in enumerate(job_status) }
+
+
+class StatusBoard:
+
+    def __init__(self, path : str):
+            """
+            Initializes the status board stored at the given file.
+
+            Parameters:
+            path (str): The board file, one byte per job id.
+            """
+            self.path = path
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def __len__(self) -> int:
+        return os.path.getsize(self.path) if self.exists() else 0
+
+    def resize(self, size : int):
+            """
+            Grow (or shrink) the board to hold `size` jobs. New jobs are ASSIGNED.
+
+            Parameters:
+                size (int): The number of jobs of the task.
+            """
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'ab') as f:
+                f.truncate(size)
+
+    def __setitem__(self, job_id : int, status : JobStatus):
+            """
+            Write the status of one job with a single positioned write of one byte.
+            """
+            if job_id < 0 or job_id >= len(self):
+                raise IndexError(f"job {job_id} not found in the status board located at {self.path}.")
+            fd = os.open(self.path, os.O_WRONLY)
+            try:
+                os.pwrite(fd, bytes([STATUS_CODE[status]]), job_id)
+            finally:
+                os.close(fd)
+
+    def __getitem__(self, job_id : int) -> JobStatus:
+        return job_status[ self.load()[job_id] ]
+
+    def load(self) -> bytes:
+            """
+            Read a snapshot of the whole board.
+
+            Returns:
+                bytes: One status code per job id.
+            """
+            if len(self) == 0:
+                return b""
+            with open(self.path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    return m[:]
+
+    def histogram(self) -> Dict[str, int]:
+            """
+            Count the jobs in each status.
+
+            Returns:
+                Dict[str, int]: The number of jobs per status value, same format of the task summary.
+            """
+            data = self.load()
+            return { status.value : data.count(STATUS_CODE[status]) for status in job_status }
+
+    def job_ids(self, status : JobStatus) -> List[int]:
+            """
+            Return the ids of all jobs with the given status, in job id order.
+            """
+            data = self.load()
+            mask = bytes( int(code == STATUS_CODE[status]) for code in range(256) )
+            return list( compress( range(len(data)), data.translate(mask) ) )
+
+    def reconcile(self, statuses : Iterable[Tuple[int, JobStatus]], before : bytes=None) -> int:
+            """
+            Write the statuses stored in the database into the board.
+
+            Only the bytes which differ are written, one positioned write per contiguous run, and a
+            byte changed by a runner since the snapshot is left untouched: the runner only writes its
+            byte once the status is in the database (see `BoardJob`), so its byte is at least as new as
+            the statuses given here.
+
+            Parameters:
+                statuses (Iterable[Tuple[int, JobStatus]]): The (job id, status) pairs of all jobs of the task.
+                before (bytes, optional): The board snapshot taken before the database read. Defaults to
+                                          a snapshot taken now.
+
+            Returns:
+                int: The number of jobs whose board status was out of date.
+            """
+            before = self.load() if before is None else before
+            data   = bytearray(before)
+            for job_id, status in statuses:
+                if job_id >= len(data):
+                    data.extend( bytes(job_id + 1 - len(data)) )
+                data[job_id] = STATUS_CODE[status]
+            # NOTE: the bytes beyond the snapshot are ASSIGNED (zero) once the board is grown
+            changed = [ job_id for job_id in range(len(data)) if data[job_id] != (before[job_id] if job_id < len(before) else 0) ]
+            if not changed:
+                return 0
+            if len(data) > len(self):
+                self.resize(len(data))
+            current = self.load()
+            runs    = []
+            for job_id in changed:
+                expected = before[job_id] if job_id < len(before) else 0
+                if current[job_id] != expected:
+                    continue
+                if runs and runs[-1][1] == job_id:
+                    runs[-1][1] = job_id + 1
+                else:
+                    runs.append([job_id, job_id + 1])
+            # NOTE: written in place, the runners keep writing into the same file
+            fd = os.open(self.path, os.O_WRONLY)
+            try:
+                for first, last in runs:
+                    os.pwrite(fd, bytes(data[first:last]), first)
+            finally:
+                os.close(fd)
+            return len(changed)
+
+
+
+class BoardJob:
+
+    def __init__(self, job, board : StatusBoard):
+            """
+            Wrap a job status service to mirror every status update into the status board, once
+            written into the database.
+
+            Parameters:
+            job: The job status service (database, client or agent job).
+            board (StatusBoard): The status board of the task.
+            """
+            self.task_name = job.task_name
+            self.job_id    = job.job_id
+            self.__job     = job
+            self.__board   = board
+
+    def start(self):
+        self.__job.start()
+
+    def update_status(self, status : JobStatus):
+        # NOTE: a status deferred by the agent reaches the board with the next reconciliation, once
+        # in the database, so the board is never newer than a database row it could be reconciled with
+        if self.__job.update_status(status) is not False:
+            self.__board[self.job_id] = status
+
+    def ping(self):
+        self.__job.ping()
+
+    def update_metrics(self, metrics : Dict, exitcode : int=None, series : bytes=None):
+        self.__job.update_metrics(metrics, exitcode, series)
+
+    def fetch_status(self) -> JobStatus:
+        return self.__job.fetch_status()
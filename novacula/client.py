@@ -0,0 +1,242 @@
+"""
+This module implements a lightweight, ORM-free status client used by the job runtime.
+
+The `njob` runner only needs to flag its job as started, move it through the status
+machine, send heartbeats and poll for kill requests. Doing this through the ORM means
+a new session, an ORM query and a full row load for every call. The `StatusClient`
+keeps a single SQLite connection for the lifetime of the runner, resolves the primary
+key of each (task_name, job_id) pair once and reuses the same statements, which are
+compiled once and kept in the statement cache of the connection.
+
+This module does not depend on SQLAlchemy. It must be kept in sync with the `job`,
+`task_counter`, `journal` and `job_series` tables defined in `novacula.db.models`.
+"""
+
+__all__ = [
+    "StatusClient",
+    "StatusJob",
+    "sqlite_file",
+]
+
+import sqlite3
+import threading
+
+from datetime        import datetime
+from typing          import Tuple, List, Dict, Union, Callable
+from novacula.retry  import retry_on_lock
+from novacula.status import JobStatus, job_metrics
+
+
+SQLITE_BUSY_TIMEOUT = 30 # seconds
+DATETIME_FORMAT     = "%Y-%m-%d %H:%M:%S.%f" # same storage format used by SQLAlchemy
+
+SELECT_JOB          = "SELECT id FROM job WHERE task_name=? AND job_id=?"
+SELECT_STATUS       = "SELECT status FROM job WHERE id=?"
+SELECT_NEXT         = "SELECT id, job_id FROM job WHERE task_name=? AND status='ASSIGNED' ORDER BY id LIMIT 1"
+UPDATE_STATUS       = "UPDATE job SET status=?, updated_time=? WHERE id=?"
+UPDATE_PING         = "UPDATE job SET updated_time=? WHERE id=?"
+UPDATE_START        = "UPDATE job SET start_time=?, retry=retry+1 WHERE id=?"
+UPDATE_STARTS       = "UPDATE job SET start_time=?, retry=retry+? WHERE id=?"
+UPDATE_COUNTER      = "UPDATE task_counter SET {old}={old}-1, {new}={new}+1 WHERE task_name=?"
+UPDATE_METRICS      = "UPDATE job SET end_time=?, exitcode=?, " + ", ".join(f"{name}=?" for name in job_metrics) + " WHERE id=?"
+DELETE_SERIES       = "DELETE FROM job_series WHERE task_name=? AND job_id=?"
+INSERT_SERIES       = "INSERT INTO job_series (task_name, job_id, data, created_time) VALUES (?, ?, ?, ?)"
+INSERT_JOURNAL      = "INSERT INTO journal (kind, task_name, job_id, old_status, new_status, count, time) SELECT 'job', task_name, job_id, ?, ?, 1, ? FROM job WHERE id=?"
+# NOTE: deferred (batched) status updates must never overwrite a final status or a kill request
+PROTECTED_STATUS    = ['COMPLETED','FAILED','KILL','KILLED']
+
+
+def now() -> str:
+    return datetime.now().strftime(DATETIME_FORMAT)
+
+
+def sqlite_file( db : str ) -> Union[str, None]:
+    """
+    Return the SQLite file of a database given as a file or as a SQLAlchemy URL.
+
+    Returns:
+        Union[str, None]: The database file or None if the URL points to a server database.
+    """
+    if "://" not in db:
+        return db
+    if db.startswith("sqlite:///"):
+        return db[len("sqlite:///"):]
+    return None
+
+
+def set_status( conn, task_name : str, id : int, status : str, time : str, late : bool=False ) -> bool:
+    """
+    Set the job status, move the task counter and append the transition into the journal
+    inside the current transaction.
+
+    Parameters:
+        conn: The connection holding the write transaction.
+        status (str): The status name (as stored by SQLAlchemy).
+        late (bool): Deferred update, which is skipped if the job reached a protected status.
+
+    Returns:
+        bool: True if the status was written.
+    """
+    old = conn.execute(SELECT_STATUS, (id,)).fetchone()[0]
+    if late and old in PROTECTED_STATUS:
+        return False
+    conn.execute(UPDATE_STATUS, (status, time, id))
+    if old != status:
+        old_value, new_value = JobStatus[old].value, JobStatus[status].value
+        conn.execute(UPDATE_COUNTER.format(old=old_value, new=new_value), (task_name,))
+        conn.execute(INSERT_JOURNAL, (old_value, new_value, time, id))
+    return True
+
+
+class StatusClient:
+
+    def __init__(self, db_file : str, busy_timeout : float=SQLITE_BUSY_TIMEOUT):
+        """
+        Initializes the status client with one connection to the SQLite database.
+
+        Parameters:
+        ----------
+        db_file : str
+            The SQLite database file (or its sqlite:/// URL).
+        busy_timeout : float, optional
+            The time (seconds) a connection waits for a lock before failing. Defaults to 30.
+        """
+        self.db_file = sqlite_file(db_file)
+        if not self.db_file:
+            raise ValueError(f"the status client only supports SQLite databases, got {db_file}.")
+        self.__lock  = threading.Lock()
+        self.__ids   = {}
+        self.__conn  = sqlite3.connect(self.db_file, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self.__conn.execute(f"PRAGMA busy_timeout={int(busy_timeout*1000)}")
+        if self.__conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal":
+            self.__conn.execute("PRAGMA synchronous=NORMAL")
+
+    def job(self, task_name : str, job_id : int) -> 'StatusJob':
+        return StatusJob(task_name, job_id, self)
+
+    @retry_on_lock
+    def execute(self, statement : str, params : Tuple=()):
+        """
+        Execute one statement in autocommit mode and return all rows.
+        """
+        with self.__lock:
+            return self.__conn.execute(statement, params).fetchall()
+
+    @retry_on_lock
+    def transaction(self, func : Callable):
+        """
+        Call `func(connection)` inside one write transaction and return its result.
+
+        The write lock is taken when the transaction begins (BEGIN IMMEDIATE), so the
+        rows read inside the transaction can not be changed by another writer.
+        """
+        with self.__lock:
+            try:
+                self.__conn.execute("BEGIN IMMEDIATE")
+                result = func(self.__conn)
+                self.__conn.execute("COMMIT")
+                return result
+            except Exception as e:
+                if self.__conn.in_transaction:
+                    self.__conn.execute("ROLLBACK")
+                raise e
+
+    def apply(self, updates : List[Dict]):
+        """
+        Apply a batch of coalesced job updates in a single transaction.
+
+        Each update is a dictionary with the task_name and job_id keys plus the optional
+        keys: starts (number of start events) and start_time, status (the last status
+        name sent) and updated_time (the last heartbeat or status time).
+
+        Parameters:
+            updates (List[Dict]): The coalesced updates, one per job.
+        """
+        ids = [ self.id(update['task_name'], update['job_id']) for update in updates ]
+        def batch(conn):
+            for id, update in zip(ids, updates):
+                if update.get('starts'):
+                    conn.execute(UPDATE_STARTS, (update['start_time'], update['starts'], id))
+                if update.get('status'):
+                    set_status(conn, update['task_name'], id, update['status'], update['updated_time'], late=True)
+                elif update.get('updated_time'):
+                    conn.execute(UPDATE_PING, (update['updated_time'], id))
+        if updates:
+            self.transaction(batch)
+
+    def claim(self, task_name : str) -> Union[int, None]:
+        """
+        Claim the next assigned job of the task, moving it to PENDING.
+
+        The job is selected and moved inside one write transaction (BEGIN IMMEDIATE), so
+        concurrent runners can never claim the same job.
+
+        Returns:
+            Union[int, None]: The claimed job id or None if no assigned job is left.
+        """
+        def claim(conn):
+            row = conn.execute(SELECT_NEXT, (task_name,)).fetchone()
+            if not row:
+                return None
+            id, job_id = row
+            set_status(conn, task_name, id, JobStatus.PENDING.name, now())
+            return id, job_id
+        claimed = self.transaction(claim)
+        if not claimed:
+            return None
+        id, job_id = claimed
+        self.__ids[(task_name, job_id)] = id
+        return job_id
+
+    def id(self, task_name : str, job_id : int) -> int:
+        """
+        Return the primary key of the job, resolved once per (task_name, job_id).
+        """
+        key = (task_name, job_id)
+        if key not in self.__ids:
+            rows = self.execute(SELECT_JOB, key)
+            if not rows:
+                raise RuntimeError(f"job {job_id} from task {task_name} not found in the database {self.db_file}.")
+            self.__ids[key] = rows[0][0]
+        return self.__ids[key]
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
+
+
+class StatusJob:
+
+    def __init__(self, task_name : str, job_id : int, client : StatusClient):
+        self.task_name = task_name
+        self.job_id    = job_id
+        self.__client  = client
+
+    @property
+    def id(self) -> int:
+        return self.__client.id(self.task_name, self.job_id)
+
+    def start(self):
+        self.__client.execute(UPDATE_START, (now(), self.id))
+
+    def update_status(self, status : JobStatus):
+        id = self.id
+        self.__client.transaction( lambda conn : set_status(conn, self.task_name, id, status.name, now()) )
+
+    def ping(self):
+        self.__client.execute(UPDATE_PING, (now(), self.id))
+
+    def update_metrics(self, metrics : Dict[str, float], exitcode : int=None, series : bytes=None):
+        id     = self.id
+        values = tuple( metrics.get(name) for name in job_metrics )
+        def store(conn):
+            time = now()
+            conn.execute(UPDATE_METRICS, (time, exitcode, *values, id))
+            if series:
+                conn.execute(DELETE_SERIES, (self.task_name, self.job_id))
+                conn.execute(INSERT_SERIES, (self.task_name, self.job_id, series, time))
+        self.__client.transaction(store)
+
+    def fetch_status(self) -> JobStatus:
+        rows = self.__client.execute(SELECT_STATUS, (self.id,))
+        return JobStatus[rows[0][0]]
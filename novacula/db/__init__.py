@@ -4,6 +4,14 @@ from . import models
 __all__.extend( models.__all__ )
 from .models import *
 
+from . import migrations
+__all__.extend( migrations.__all__ )
+from .migrations import *
+
 from . import db_client
 __all__.extend( db_client.__all__ )
-from .db_client import *
\ No newline at end of file
+from .db_client import *
+
+from . import export
+__all__.extend( export.__all__ )
+from .export import *
\ No newline at end of file
@@ -0,0 +1,169 @@
+"""
+This module implements the columnar export of the job table of a flow.
+
+The jobs (live and archived) are streamed from each job database in bounded chunks
+of plain columns, one list per field, without building ORM objects. The chunks can
+be written into a Parquet or Arrow file, or concatenated into NumPy arrays or a
+pandas DataFrame to compute statistics (percentiles of the execution time, peak
+memory, ...) across millions of jobs.
+
+pyarrow, numpy and pandas are optional dependencies, only required by the function
+which uses each one of them.
+"""
+
+__all__ = [
+    "JOB_COLUMNS",
+    "iter_job_columns",
+    "fetch_job_arrays",
+    "fetch_job_frame",
+    "export_jobs",
+]
+
+import importlib
+
+from typing     import Dict, List, Iterator
+from loguru     import logger
+from sqlalchemy import select
+from .models    import Job, Task, fetch_archived_jobs
+from .models.archive import ARCHIVE_COLUMNS
+
+
+JOB_COLUMNS     = ["task_name", *ARCHIVE_COLUMNS]
+INTEGER_COLUMNS = ["id", "job_id", "retry", "taskid"]
+TIME_COLUMNS    = ["start_time", "updated_time", "end_time"]
+STRING_COLUMNS  = ["task_name", "status", "filename"]
+EXPORT_CHUNK    = 100000
+
+
+def _require( module : str ):
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ImportError(f"{module} is required by this operation. please install it (pip install {module.split('.')[0]}).")
+
+
+def _columns( rows : List[Dict] ) -> Dict[str, List]:
+    columns = { name : [row[name] for row in rows] for name in JOB_COLUMNS }
+    columns["status"] = [ status.value if status else None for status in columns["status"] ]
+    return columns
+
+
+def iter_job_columns( db_service, tasks : List[str]=None, chunk_size : int=EXPORT_CHUNK ) -> Iterator[Dict[str, List]]:
+    """
+    Stream all jobs of the flow (or of the given tasks) in chunks of columns.
+
+    Parameters:
+        db_service (DBService): The database service of the flow.
+        tasks (List[str], optional): The task names to export. Defaults to all tasks.
+        chunk_size (int, optional): The maximum number of jobs per chunk.
+
+    Yields:
+        Dict[str, List]: One list of values per column of `JOB_COLUMNS`.
+    """
+    with db_service() as session:
+        names = [ name for (name,) in session.query(Task.name).order_by(Task.id) ]
+    if tasks:
+        names = [ name for name in names if name in tasks ]
+
+    # NOTE: one pass per database holding jobs (the main database or one shard per task)
+    databases = {}
+    for name in names:
+        databases.setdefault( db_service.job_db_file(name), [] ).append(name)
+
+    fields = [ getattr(Job, name) for name in JOB_COLUMNS ]
+    for task_names in databases.values():
+        with db_service.job_session(task_names[0]) as session:
+            for name in task_names:
+                rows = []
+                for row in fetch_archived_jobs(session, name):
+                    rows.append( {"task_name":name, **row} )
+                    if len(rows) == chunk_size:
+                        yield _columns(rows)
+                        rows = []
+                if rows:
+                    yield _columns(rows)
+            last = 0
+            while True:
+                rows = session.execute(
+                    select(*fields).where(Job.task_name.in_(task_names), Job.id > last).order_by(Job.id).limit(chunk_size)
+                ).all()
+                if not rows:
+                    break
+                last = rows[-1].id
+                yield _columns( [row._asdict() for row in rows] )
+
+
+def fetch_job_arrays( db_service, tasks : List[str]=None, chunk_size : int=EXPORT_CHUNK ) -> Dict[str, 'numpy.ndarray']:
+    """
+    Fetch all jobs of the flow (or of the given tasks) as NumPy arrays, one per column.
+
+    Integer columns are int64, metrics and the exit code are float64 (NaN when missing),
+    times are datetime64[us] (NaT when missing) and the other columns are object arrays.
+
+    Returns:
+        Dict[str, numpy.ndarray]: The column arrays, all with the same length.
+    """
+    np = _require("numpy")
+    columns = { name : [] for name in JOB_COLUMNS }
+    for chunk in iter_job_columns(db_service, tasks, chunk_size):
+        for name in JOB_COLUMNS:
+            columns[name].extend(chunk[name])
+    arrays = {}
+    for name, values in columns.items():
+        if name in INTEGER_COLUMNS:
+            arrays[name] = np.array(values, dtype=np.int64)
+        elif name in TIME_COLUMNS:
+            arrays[name] = np.array(values, dtype="datetime64[us]")
+        elif name in STRING_COLUMNS:
+            arrays[name] = np.array(values, dtype=object)
+        else:
+            arrays[name] = np.array(values, dtype=np.float64)
+    return arrays
+
+
+def fetch_job_frame( db_service, tasks : List[str]=None, chunk_size : int=EXPORT_CHUNK ) -> 'pandas.DataFrame':
+    """
+    Fetch all jobs of the flow (or of the given tasks) as a pandas DataFrame.
+    """
+    pd = _require("pandas")
+    return pd.DataFrame( fetch_job_arrays(db_service, tasks, chunk_size) )
+
+
+def export_jobs( db_service, path : str, tasks : List[str]=None, chunk_size : int=EXPORT_CHUNK ) -> int:
+    """
+    Export all jobs of the flow (or of the given tasks) into a Parquet or Arrow file.
+
+    The jobs are written chunk by chunk (one row group or record batch per chunk), so the
+    memory footprint does not depend on the number of jobs. Files ending with .arrow,
+    .feather or .ipc are written in the Arrow IPC file format, any other file as Parquet.
+
+    Parameters:
+        db_service (DBService): The database service of the flow.
+        path (str): The output file.
+        tasks (List[str], optional): The task names to export. Defaults to all tasks.
+        chunk_size (int, optional): The maximum number of jobs per chunk.
+
+    Returns:
+        int: The number of exported jobs.
+    """
+    pa = _require("pyarrow")
+    schema = pa.schema([
+        (name, pa.int64()  if name in INTEGER_COLUMNS else
+               pa.timestamp("us") if name in TIME_COLUMNS else
+               pa.string() if name in STRING_COLUMNS else
+               pa.float64())
+        for name in JOB_COLUMNS
+    ])
+    if path.endswith((".arrow", ".feather", ".ipc")):
+        writer = pa.ipc.new_file(path, schema)
+    else:
+        writer = _require("pyarrow.parquet").ParquetWriter(path, schema)
+    exported = 0
+    try:
+        for chunk in iter_job_columns(db_service, tasks, chunk_size):
+            writer.write_table( pa.Table.from_pydict(chunk, schema=schema) )
+            exported += len(chunk["id"])
+            logger.debug(f"exported {exported} jobs into {path}.")
+    finally:
+        writer.close()
+    return exported
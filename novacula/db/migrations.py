@@ -0,0 +1,122 @@
+"""
+This module implements the versioned schema migrations of the novacula database.
+
+Each migration is a (version, description, function) entry applied in order on top
+of the version stamped into the `schema_version` table. A fresh database is created
+with the latest schema and stamped directly, while an existing flow database is
+upgraded in place, so jobs and tasks of previous runs are preserved.
+
+Migrations must be idempotent since a database created before the versioning was
+introduced does not carry any version (version 0).
+"""
+
+__all__ = [
+    "SCHEMA_VERSION",
+    "fetch_schema_version",
+    "upgrade_db",
+]
+
+from typing     import List, Tuple, Callable
+from loguru     import logger
+from sqlalchemy import inspect, text
+from .models    import Base, Job, Task, Journal, JobArchive, JobSeries, SchemaVersion, rebuild_counters, job_metrics
+
+
+
+#
+# migrations
+#
+
+def _add_columns(connection, table, names : List[str]):
+    existing = [ column['name'] for column in inspect(connection).get_columns(table.name) ]
+    for name in names:
+        if name not in existing:
+            column = table.columns[name]
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.execute( text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column_type}") )
+
+
+def _create_job_indexes(connection):
+    for index in Job.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def _add_task_shard(connection):
+    _add_columns(connection, Task.__table__, ["shard"])
+
+
+def _build_task_counters(connection):
+    rebuild_counters(connection)
+
+
+def _create_journal(connection):
+    Journal.__table__.create(connection, checkfirst=True)
+
+
+def _create_job_archive(connection):
+    JobArchive.__table__.create(connection, checkfirst=True)
+
+
+def _add_job_metrics(connection):
+    _add_columns(connection, Job.__table__, ["end_time", "exitcode", *job_metrics])
+
+
+def _add_job_accounting(connection):
+    _add_columns(connection, Job.__table__, ["cpu_time", "io_read_mb", "io_write_mb"])
+
+
+def _create_job_series(connection):
+    JobSeries.__table__.create(connection, checkfirst=True)
+
+
+def _add_job_startup_time(connection):
+    _add_columns(connection, Job.__table__, ["startup_time"])
+
+
+MIGRATIONS : List[Tuple[int, str, Callable]] = [
+    (1, "composite indexes on the job access paths", _create_job_indexes),
+    (2, "task shard routing column"                , _add_task_shard),
+    (3, "materialized task status counters"        , _build_task_counters),
+    (4, "append-only status journal"               , _create_journal),
+    (5, "archive of finished job rows"             , _create_job_archive),
+    (6, "job resource metrics"                     , _add_job_metrics),
+    (7, "job cpu time and io accounting"           , _add_job_accounting),
+    (8, "job resource time series"                 , _create_job_series),
+    (9, "job runtime startup latency"              , _add_job_startup_time),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def fetch_schema_version(connection) -> int:
+    """
+    Fetch the schema version stamped into the database.
+
+    Returns:
+        int: The current schema version or 0 if the database was never versioned.
+    """
+    row = connection.execute( SchemaVersion.__table__.select().order_by(SchemaVersion.id.desc()) ).first()
+    return row.version if row else 0
+
+
+def upgrade_db( engine ):
+    """
+    Create or upgrade the database schema in place.
+
+    This function creates every missing table and applies the pending migrations
+    in a single transaction, stamping the new version at the end.
+
+    Parameters:
+        engine: The SQLAlchemy engine bound to the database.
+    """
+    with engine.begin() as connection:
+        fresh = not inspect(connection).has_table(Job.__tablename__)
+        Base.metadata.create_all(connection)
+        version = SCHEMA_VERSION if fresh else fetch_schema_version(connection)
+        for migration_version, description, migrate in MIGRATIONS:
+            if migration_version > version:
+                logger.info(f"applying schema migration {migration_version}: {description}.")
+                migrate(connection)
+                version = migration_version
+        connection.execute( SchemaVersion.__table__.delete() )
+        connection.execute( SchemaVersion.__table__.insert().values(version=version) )
@@ -11,3 +11,23 @@ from .task import *
 from . import job
 __all__.extend( job.__all__ )
 from .job import *
+
+from . import counter
+__all__.extend( counter.__all__ )
+from .counter import *
+
+from . import schema
+__all__.extend( schema.__all__ )
+from .schema import *
+
+from . import journal
+__all__.extend( journal.__all__ )
+from .journal import *
+
+from . import archive
+__all__.extend( archive.__all__ )
+from .archive import *
+
+from . import series
+__all__.extend( series.__all__ )
+from .series import *
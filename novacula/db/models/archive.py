@@ -0,0 +1,157 @@
+__all__ = [
+    "JobArchive",
+    "archive_jobs",
+    "fetch_archived_jobs",
+    "fetch_archived_summary",
+    "fetch_archived_filenames",
+    "fetch_next_job_id",
+    ]
+
+import json, zlib
+
+from datetime import datetime
+from typing import Dict, List, Iterator, Set
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, TEXT, select, delete, insert, func
+
+from . import Base
+from novacula.status import JobStatus, job_status, job_metrics
+
+
+ARCHIVE_COLUMNS = ["id", "job_id", "retry", "taskid", "status", "start_time", "updated_time", "filename", "end_time", "exitcode", *job_metrics]
+ARCHIVE_TIMES   = ["start_time", "updated_time", "end_time"]
+
+
+class JobArchive (Base):
+
+    # NOTE: the job rows of finished tasks, moved out of the job table by `ntask compact`. Each
+    # row holds a chunk of jobs encoded column by column (one JSON list per column) and compressed
+    # with zlib. This table lives in the same database of the jobs (main database or task shard).
+    __tablename__       = 'job_archive'
+    id                  = Column(Integer, primary_key=True)
+    task_name           = Column(String, index=True)
+    first_job_id        = Column(Integer)
+    last_job_id         = Column(Integer)
+    count               = Column(Integer)
+    summary             = Column(TEXT) # number of jobs per status value (JSON)
+    data                = Column(LargeBinary)
+    archived_time       = Column(DateTime, default=datetime.now)
+
+
+def _encode( rows : List[Dict] ) -> bytes:
+    columns = { name : [row[name] for row in rows] for name in ARCHIVE_COLUMNS }
+    columns["status"] = [ status.name for status in columns["status"] ]
+    for name in ARCHIVE_TIMES:
+        columns[name] = [ value.isoformat() if value else None for value in columns[name] ]
+    return zlib.compress( json.dumps(columns, separators=(',', ':')).encode() )
+
+
+def _decode( data : bytes ) -> List[Dict]:
+    columns = json.loads( zlib.decompress(data) )
+    size    = len(columns["job_id"])
+    # NOTE: chunks archived before a column was added do not carry it
+    for name in ARCHIVE_COLUMNS:
+        columns.setdefault(name, [None] * size)
+    columns["status"] = [ JobStatus[name] for name in columns["status"] ]
+    for name in ARCHIVE_TIMES:
+        columns[name] = [ datetime.fromisoformat(value) if value else None for value in columns[name] ]
+    return [ dict(zip(ARCHIVE_COLUMNS, values)) for values in zip(*[columns[name] for name in ARCHIVE_COLUMNS]) ]
+
+
+def archive_jobs( session, task_name : str, chunk_size : int=100000 ) -> int:
+    """
+    Move all job rows of the task into the archive table inside the current transaction.
+
+    The task counters are kept untouched, so the task summary does not change. The job
+    events of the task are kept in the journal, which is append-only: a reader whose cursor
+    is behind (e.g. `ntask watch`) still pulls the last transitions of the archived jobs.
+
+    Returns:
+        int: The number of archived jobs.
+    """
+    from .job import Job
+    archived = 0
+    last     = -1
+    while True:
+        rows = [ row._asdict() for row in session.execute(
+            select(*[getattr(Job, name) for name in ARCHIVE_COLUMNS])
+            .where(Job.task_name==task_name, Job.job_id > last)
+            .order_by(Job.job_id)
+            .limit(chunk_size)
+        )]
+        if not rows:
+            break
+        summary = { status.value : 0 for status in job_status }
+        for row in rows:
+            summary[row["status"].value] += 1
+        session.execute( insert(JobArchive).values(
+            task_name     = task_name,
+            first_job_id  = rows[0]["job_id"],
+            last_job_id   = rows[-1]["job_id"],
+            count         = len(rows),
+            summary       = json.dumps(summary),
+            data          = _encode(rows),
+            archived_time = datetime.now(),
+        ))
+        last      = rows[-1]["job_id"]
+        archived += len(rows)
+    session.execute( delete(Job).where(Job.task_name==task_name) )
+    return archived
+
+
+def fetch_archived_jobs( session, task_name : str, status : JobStatus=None ) -> Iterator[Dict]:
+    """
+    Iterate over the archived job rows of the task, in job id order.
+
+    Parameters:
+        status (JobStatus, optional): Only the jobs with this status. The chunks without any
+                                      job with this status (see their summary) are not decoded.
+
+    Yields:
+        Dict: One job row, with the same fields of the job table.
+    """
+    chunks = session.execute(
+        select(JobArchive.id, JobArchive.summary).where(JobArchive.task_name==task_name).order_by(JobArchive.first_job_id)
+    ).all()
+    for id, summary in chunks:
+        if status and not json.loads(summary).get(status.value):
+            continue
+        rows = _decode( session.execute(select(JobArchive.data).where(JobArchive.id==id)).scalar() )
+        yield from ( row for row in rows if not status or row["status"] == status )
+
+
+def fetch_archived_summary( session, task_name : str=None ) -> Dict[str, Dict[str, int]]:
+    """
+    Fetch the number of archived jobs per status of each task (all tasks if no task name is given).
+    """
+    query = select(JobArchive.task_name, JobArchive.summary)
+    if task_name:
+        query = query.where(JobArchive.task_name==task_name)
+    summaries = {}
+    for name, summary in session.execute(query):
+        table = summaries.setdefault(name, { status.value : 0 for status in job_status })
+        for key, value in json.loads(summary).items():
+            table[key] += value
+    return summaries
+
+
+def fetch_archived_filenames( session, task_name : str ) -> Set[str]:
+    """
+    Fetch the input filenames of the archived jobs of the task.
+    """
+    filenames = set()
+    chunks    = session.execute( select(JobArchive.id).where(JobArchive.task_name==task_name) ).scalars().all()
+    for id in chunks:
+        data = session.execute( select(JobArchive.data).where(JobArchive.id==id) ).scalar()
+        filenames.update( json.loads(zlib.decompress(data))["filename"] )
+    return filenames
+
+
+def fetch_next_job_id( session, task_name : str ) -> int:
+    """
+    Return the next free job id of the task, after the live and the archived jobs.
+    """
+    from .job import Job
+    last_live     = session.execute( select(func.max(Job.job_id)).where(Job.task_name==task_name) ).scalar()
+    last_archived = session.execute( select(func.max(JobArchive.last_job_id)).where(JobArchive.task_name==task_name) ).scalar()
+    last          = max( [ value for value in (last_live, last_archived) if value is not None ], default=-1 )
+    return last + 1
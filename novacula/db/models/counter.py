@@ -0,0 +1,83 @@
+__all__ = [
+    "TaskCounter",
+    "add_to_counter",
+    "move_counter",
+    "rebuild_counters",
+    ]
+
+from typing import Dict
+from sqlalchemy import Column, Integer, String, func, select, update, insert, delete
+
+from . import Base
+from novacula.status import JobStatus, job_status
+
+
+
+class TaskCounter (Base):
+
+    # NOTE: one row per task with the number of jobs in each status. This table lives in the
+    # same database of the jobs (main database or task shard) and it is updated in the same
+    # transaction of each job status transition.
+    __tablename__       = 'task_counter'
+    task_name           = Column(String, primary_key=True)
+    assigned            = Column(Integer, default=0)
+    pending             = Column(Integer, default=0)
+    running             = Column(Integer, default=0)
+    completed           = Column(Integer, default=0)
+    failed              = Column(Integer, default=0)
+    kill                = Column(Integer, default=0)
+    killed              = Column(Integer, default=0)
+
+    def summary(self) -> Dict[str, int]:
+        return { status.value : getattr(self, status.value) or 0 for status in job_status }
+
+
+
+def add_to_counter( session, task_name : str, status : JobStatus, count : int ):
+    """
+    Add `count` jobs into the given status of the task counter, creating the row if needed.
+
+    Parameters:
+        session: An ORM session or a Core connection inside the current transaction.
+    """
+    column = TaskCounter.__table__.c[status.value]
+    result = session.execute(
+        update(TaskCounter).where(TaskCounter.task_name==task_name).values({column: column + count})
+    )
+    if result.rowcount == 0:
+        session.execute( insert(TaskCounter).values({"task_name": task_name, column.name: count}) )
+
+
+def move_counter( session, task_name : str, old : JobStatus, new : JobStatus ):
+    """
+    Move one job from the old status to the new status in the task counter.
+    """
+    if old == new:
+        return
+    add_to_counter(session, task_name, old, -1)
+    add_to_counter(session, task_name, new, +1)
+
+
+def rebuild_counters( session, task_name : str=None ):
+    """
+    Rebuild the task counters from the job table (all tasks if no task name is given).
+
+    The archived jobs are counted as well, so the counters of compacted tasks are preserved.
+    """
+    from .job import Job
+    from .archive import fetch_archived_summary
+    query = select(Job.task_name, Job.status, func.count(Job.id)).group_by(Job.task_name, Job.status)
+    stmt  = delete(TaskCounter)
+    if task_name:
+        query = query.where(Job.task_name==task_name)
+        stmt  = stmt.where(TaskCounter.task_name==task_name)
+    session.execute(stmt)
+    rows = {}
+    for name, status, count in session.execute(query):
+        rows.setdefault(name, {"task_name": name, **{ value.value : 0 for value in job_status }})[status.value] = count
+    for name, summary in fetch_archived_summary(session, task_name).items():
+        row = rows.setdefault(name, {"task_name": name, **{ value.value : 0 for value in job_status }})
+        for key, count in summary.items():
+            row[key] += count
+    if rows:
+        session.execute( insert(TaskCounter), list(rows.values()) )
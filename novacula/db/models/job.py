@@ -2,16 +2,21 @@ __all__ = [
     "Job" , 
     "DBJob", 
     "JobStatus",
-    "job_status"
+    "job_status",
+    "job_metrics",
     ]
 
-import enum 
-
 from datetime import datetime
+from typing import Dict, List, Union
 from sqlalchemy.orm import load_only, relationship
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Enum
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Float, Enum, Index, update
 
 from . import Base
+from novacula.retry import retry_on_lock
+from novacula.status import JobStatus, job_status, job_metrics
+from .counter import move_counter
+from .journal import record_event
+from .series import store_series, fetch_series
 
 
 minutes=60 # seconds
@@ -19,18 +24,6 @@ minutes=60 # seconds
 
 
 
-class JobStatus(enum.Enum):
-
-    ASSIGNED    = "assigned"
-    PENDING     = "pending"
-    RUNNING     = "running"
-    COMPLETED   = "completed"
-    FAILED      = "failed"
-    KILL        = "kill"
-    KILLED      = "killed"
-    
-job_status = [JobStatus.ASSIGNED, JobStatus.PENDING, JobStatus.RUNNING, JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.KILL, JobStatus.KILLED]
-
 class Job (Base):
 
     __tablename__       = 'job'
@@ -44,6 +37,28 @@ class Job (Base):
     updated_time        = Column(DateTime, default=datetime.now())
     task_name           = Column(String)
     filename            = Column(String)
+    end_time            = Column(DateTime, nullable=True)
+    exitcode            = Column(Integer , nullable=True)
+    # resource metrics measured by the job runner
+    exec_time           = Column(Float, nullable=True) # seconds
+    cpu_percent_avg     = Column(Float, nullable=True)
+    cpu_percent_peak    = Column(Float, nullable=True)
+    sys_memory_mb_avg   = Column(Float, nullable=True)
+    sys_memory_mb_peak  = Column(Float, nullable=True)
+    gpu_memory_mb_avg   = Column(Float, nullable=True)
+    gpu_memory_mb_peak  = Column(Float, nullable=True)
+    cpu_time            = Column(Float, nullable=True) # seconds
+    io_read_mb          = Column(Float, nullable=True)
+    io_write_mb         = Column(Float, nullable=True)
+    startup_time        = Column(Float, nullable=True) # seconds between the job launch and its entrypoint (runtime latency)
+
+    # NOTE: composite indexes matching the job access paths (heartbeats, status updates and job materialization)
+    __table_args__      = (
+        Index("ix_job_task_name_job_id"  , "task_name", "job_id"  ),
+        Index("ix_job_task_name_filename", "task_name", "filename"),
+        Index("ix_job_task_name_status"  , "task_name", "status"  ),
+        Index("ix_job_taskid"            , "taskid"               ),
+    )
 
     
     def ping(self):
@@ -61,16 +76,70 @@ class DBJob:
         self.task_name = task_name
         self.__session = session
 
+    @retry_on_lock
     def update_status(self, status : JobStatus):
         session = self.__session()
         try:
-            job = session.query(Job).filter_by(task_name=self.task_name).filter_by(job_id=self.job_id).one()
-            setattr(job, "status", status)
-            job.ping()
+            # NOTE: compare-and-set on the current status, so the task counter is moved from the
+            # status really replaced by this transaction even with concurrent writers.
+            while True:
+                id, old = (
+                    session.query(Job.id, Job.status)
+                    .filter_by(task_name=self.task_name)
+                    .filter_by(job_id=self.job_id)
+                    .one()
+                )
+                result = session.execute(
+                    update(Job).where(Job.id==id, Job.status==old).values(status=status, updated_time=datetime.now())
+                )
+                if result.rowcount == 1:
+                    break
+                session.rollback()
+            move_counter(session, self.task_name, old, status)
+            record_event(session, "job", self.task_name, old, status, job_id=self.job_id)
+            session.commit()
+        finally:
+            session.close()
+
+    @retry_on_lock
+    def update_metrics(self, metrics : Dict[str, float], exitcode : int=None, series : bytes=None):
+        """
+        Store the resource metrics measured by the job runner, flagging the end of the job.
+
+        Parameters:
+            metrics (Dict[str, float]): The metrics returned by Popen.metrics().
+            exitcode (int, optional): The exit code of the job process.
+            series (bytes, optional): The resource time series returned by Popen.series().
+        """
+        session = self.__session()
+        try:
+            values = { name : metrics[name] for name in job_metrics if name in metrics }
+            session.execute(
+                update(Job).where(Job.task_name==self.task_name, Job.job_id==self.job_id)
+                .values(end_time=datetime.now(), exitcode=exitcode, **values)
+            )
+            if series:
+                store_series(session, self.task_name, self.job_id, series)
             session.commit()
         finally:
             session.close()
 
+    @retry_on_lock
+    def fetch_series(self) -> Union[Dict[str, List[float]], None]:
+        """
+        Fetch the resource time series recorded while the job was running.
+
+        Returns:
+            Union[Dict[str, List[float]], None]: The time (seconds since the job start) plus one
+                                                 list per field or None if no series was stored.
+        """
+        session = self.__session()
+        try:
+            return fetch_series(session, self.task_name, self.job_id)
+        finally:
+            session.close()
+
+    @retry_on_lock
     def fetch_status(self) -> JobStatus:
         session = self.__session()
         try:
@@ -86,6 +155,7 @@ class DBJob:
         finally:
             session.close()
 
+    @retry_on_lock
     def ping(self):
         session = self.__session()
         try:
@@ -95,6 +165,7 @@ class DBJob:
         finally:
             session.close()
             
+    @retry_on_lock
     def start(self):
         session = self.__session()
         try:
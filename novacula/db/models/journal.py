@@ -0,0 +1,99 @@
+__all__ = [
+    "Journal",
+    "record_event",
+    "fetch_events",
+    "fetch_counters",
+    "fetch_task_statuses",
+    ]
+
+import enum
+
+from datetime import datetime
+from typing import Dict, List, Tuple, Union
+from sqlalchemy import Column, Integer, String, DateTime, func, select, insert
+
+from . import Base
+from .counter import TaskCounter
+
+
+
+class Journal (Base):
+
+    # NOTE: append-only log of every job and task status transition. The sequence number
+    # is monotonically increasing (never reused), so readers can keep a cursor and pull
+    # only the new events. Job events live in the same database of the jobs (main database
+    # or task shard) and task events live in the main database.
+    __tablename__       = 'journal'
+    __table_args__      = {"sqlite_autoincrement": True}
+    seq                 = Column(Integer, primary_key=True)
+    kind                = Column(String) # job or task
+    task_name           = Column(String)
+    job_id              = Column(Integer, nullable=True) # null for task events and bulk job events
+    old_status          = Column(String, nullable=True)  # null for new jobs
+    new_status          = Column(String)
+    count               = Column(Integer, default=1)     # number of jobs moved by this event
+    time                = Column(DateTime, default=datetime.now)
+
+
+
+def record_event( session, kind : str, task_name : str, old : Union[enum.Enum, None], new : enum.Enum, job_id : int=None, count : int=1 ):
+    """
+    Append one status transition into the journal inside the current transaction.
+    """
+    if old == new:
+        return
+    session.execute( insert(Journal).values(
+        kind       = kind,
+        task_name  = task_name,
+        job_id     = job_id,
+        old_status = old.value if old else None,
+        new_status = new.value,
+        count      = count,
+        time       = datetime.now(),
+    ))
+
+
+def fetch_events( session, kind : str, cursor : int, limit : int=10000 ) -> List[Journal]:
+    """
+    Fetch the events of the given kind with a sequence number greater than the cursor.
+    """
+    return session.query(Journal).filter(Journal.kind==kind, Journal.seq > cursor).order_by(Journal.seq).limit(limit).all()
+
+
+def _last_seq():
+    return select(func.coalesce(func.max(Journal.seq), 0)).scalar_subquery()
+
+
+def fetch_counters( session ) -> Tuple[int, Dict[str, Dict[str, int]]]:
+    """
+    Fetch all task counters of the database together with the journal cursor.
+
+    Both are read by a single statement, so the counters are consistent with the cursor.
+
+    Returns:
+        Tuple[int, Dict[str, Dict[str, int]]]: The cursor and the summary per task name.
+    """
+    cursor, counters = 0, {}
+    for counter, seq in session.query(TaskCounter, _last_seq()):
+        cursor = seq
+        counters[counter.task_name] = counter.summary()
+    if not counters:
+        cursor = session.execute(select(_last_seq())).scalar()
+    return cursor, counters
+
+
+def fetch_task_statuses( session ) -> Tuple[int, Dict[str, str]]:
+    """
+    Fetch the status of all tasks together with the journal cursor, using a single statement.
+
+    Returns:
+        Tuple[int, Dict[str, str]]: The cursor and the status value per task name.
+    """
+    from .task import Task
+    cursor, statuses = 0, {}
+    for name, status, seq in session.query(Task.name, Task.status, _last_seq()):
+        cursor = seq
+        statuses[name] = status.value
+    if not statuses:
+        cursor = session.execute(select(_last_seq())).scalar()
+    return cursor, statuses
@@ -0,0 +1,16 @@
+__all__ = [
+    "SchemaVersion",
+    ]
+
+from datetime import datetime
+from sqlalchemy import Column, Integer, DateTime
+
+from . import Base
+
+
+class SchemaVersion (Base):
+
+    __tablename__       = 'schema_version'
+    id                  = Column(Integer, primary_key=True)
+    version             = Column(Integer, default=0)
+    updated_time        = Column(DateTime, default=datetime.now)
@@ -0,0 +1,54 @@
+__all__ = [
+    "JobSeries",
+    "store_series",
+    "fetch_series",
+    ]
+
+from datetime import datetime
+from typing import Dict, List, Union
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, Index, select, delete, insert
+
+from . import Base
+from novacula.series import decode_series
+
+
+
+class JobSeries (Base):
+
+    # NOTE: the resource time series recorded by the job monitor (see novacula.series), one
+    # row per job, linked by (task_name, job_id) so the series is kept when the job rows are
+    # archived. A retry of the job replaces the series of the previous run. This table lives
+    # in the same database of the jobs (main database or task shard).
+    __tablename__       = 'job_series'
+    id                  = Column(Integer, primary_key=True)
+    task_name           = Column(String)
+    job_id              = Column(Integer)
+    data                = Column(LargeBinary)
+    created_time        = Column(DateTime, default=datetime.now)
+
+    __table_args__      = (
+        Index("ix_job_series_task_name_job_id", "task_name", "job_id", unique=True),
+    )
+
+
+
+def store_series( session, task_name : str, job_id : int, data : bytes ):
+    """
+    Store the encoded series of the job inside the current transaction.
+    """
+    session.execute( delete(JobSeries).where(JobSeries.task_name==task_name, JobSeries.job_id==job_id) )
+    session.execute( insert(JobSeries).values(task_name=task_name, job_id=job_id, data=data, created_time=datetime.now()) )
+
+
+def fetch_series( session, task_name : str, job_id : int ) -> Union[Dict[str, List[float]], None]:
+    """
+    Fetch the resource time series of the job.
+
+    Returns:
+        Union[Dict[str, List[float]], None]: The time (seconds since the job start) plus one
+                                             list per field or None if no series was stored.
+    """
+    data = session.execute(
+        select(JobSeries.data).where(JobSeries.task_name==task_name, JobSeries.job_id==job_id)
+    ).scalar()
+    return decode_series(data) if data else None
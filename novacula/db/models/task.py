@@ -4,13 +4,17 @@ __all__ = [
     "TaskStatus",
     ]
 
-import enum 
 from datetime import datetime
-from typing import List, Dict
-from sqlalchemy import Column, Integer, String, Enum, Float, DateTime, TEXT
+from typing import List, Dict, Tuple, Union
+from sqlalchemy import Column, Integer, String, Enum, Float, DateTime, TEXT, update
 from sqlalchemy.orm import load_only, relationship
 from . import Base
-from .job  import job_status
+from novacula.retry import retry_on_lock
+from novacula.status import TaskStatus, JobStatus, job_status
+from .job import Job
+from .counter import TaskCounter, rebuild_counters, move_counter
+from .journal import record_event
+from .archive import ARCHIVE_COLUMNS, archive_jobs, fetch_archived_jobs
 
 
 minutes=60 # seconds
@@ -20,19 +24,6 @@ minutes=60 # seconds
 #
 # tasks and jobs
 #
-class TaskStatus(enum.Enum):
-
-    ASSIGNED       = "assigned"
-    RUNNING        = "running"
-    COMPLETED      = "completed"
-    FINALIZED      = "finalized"
-    FAILED         = "failed"
-    CANCELED       = "canceled"
-    
-
-
-    
-
 class Task (Base):
 
     __tablename__    = 'task'
@@ -43,6 +34,7 @@ class Task (Base):
     status           = Column(Enum(TaskStatus), default=TaskStatus.ASSIGNED )
     start_time       = Column(DateTime, default=datetime.now())
     updated_time     = Column(DateTime, default=datetime.now())
+    shard            = Column(String, nullable=True) # database file holding the jobs of this task (sharded mode)
 
     def __add__ (self, exp):
       self.jobs.append(exp)
@@ -54,34 +46,43 @@ class Task (Base):
     
 class DBTask:
 
-    def __init__(self, name : str, session):
+    def __init__(self, name : str, session, job_session=None):
       self.name = name
       self.__session = session
+      # NOTE: the jobs may live in another database (sharded mode)
+      self.__job_session = job_session or session
+
+    def __fetch_status(self, session) -> TaskStatus:
+        fields = [Task.status]
+        task = (
+            session.query(Task)
+            .filter_by(name=self.name)
+            .options(load_only(*fields))
+            .one()
+        )
+        return task.status
 
+    @retry_on_lock
     def fetch_status(self) -> TaskStatus:
         session = self.__session()
         try:
-            fields = [Task.status]
-            task = (
-                session.query(Task)
-                .filter_by(name=self.name)
-                .options(load_only(*fields))
-                .one()
-            )
-            return task.status
+            return self.__fetch_status(session)
         finally:
             session.close()
      
+    @retry_on_lock
     def update_status(self, status : TaskStatus):
         session = self.__session()
         try:
             task = session.query(Task).filter_by(name=self.name).one()
+            record_event(session, "task", self.name, task.status, status)
             setattr(task, "status", status)
             task.ping()
             session.commit()
         finally:
             session.close()
      
+    @retry_on_lock
     def check_existence(self) -> bool:
         session = self.__session()
         try:
@@ -91,13 +92,130 @@ class DBTask:
             session.close()
         
         
+    @retry_on_lock
+    def fetch_id(self) -> int:
+        session = self.__session()
+        try:
+            return session.query(Task.id).filter_by(name=self.name).scalar()
+        finally:
+            session.close()
+        
+    @retry_on_lock
     def fetch_summary(self) -> Dict[str,Dict[str,int]]:
         session = self.__session()
+        # NOTE: one retry loop for both reads, the counters live in the shard of the task (if any)
+        job_session = self.__job_session() if self.__job_session is not self.__session else session
+        try:
+           status = self.__fetch_status(session)
+           counter = job_session.query(TaskCounter).filter_by(task_name=self.name).one_or_none()
+           table = counter.summary() if counter else {status.value:0 for status in job_status}
+           return {'status':status.value, 'summary':table}
+        finally:
+            if job_session is not session:
+                job_session.close()
+            session.close()
+
+    @retry_on_lock
+    def rebuild_counters(self):
+        """
+        Rebuild the status counters of this task from its job table.
+        """
+        session = self.__job_session()
+        try:
+            rebuild_counters(session, self.name)
+            session.commit()
+        finally:
+            session.close()
+
+    @retry_on_lock
+    def fetch_job_ids(self, status : JobStatus) -> List[int]:
+        session = self.__job_session()
+        try:
+            rows = (
+                session.query(Job.job_id)
+                .filter_by(task_name=self.name, status=status)
+                .order_by(Job.job_id)
+            )
+            archived = [job['job_id'] for job in fetch_archived_jobs(session, self.name, status)]
+            return archived + [job_id for (job_id,) in rows]
+        finally:
+            session.close()
+
+    @retry_on_lock
+    def claim_job(self) -> Union[int, None]:
+        """
+        Claim the next assigned job of this task, moving it to PENDING with a compare-and-set
+        on the job status, so concurrent runners can never claim the same job.
+
+        Returns:
+            Union[int, None]: The claimed job id or None if no assigned job is left.
+        """
+        session = self.__job_session()
+        try:
+            while True:
+                row = (
+                    session.query(Job.id, Job.job_id)
+                    .filter_by(task_name=self.name, status=JobStatus.ASSIGNED)
+                    .order_by(Job.id)
+                    .first()
+                )
+                if not row:
+                    return None
+                result = session.execute(
+                    update(Job).where(Job.id==row.id, Job.status==JobStatus.ASSIGNED)
+                    .values(status=JobStatus.PENDING, updated_time=datetime.now())
+                )
+                if result.rowcount == 1:
+                    break
+                # NOTE: claimed by another runner in between, try the next one
+                session.rollback()
+            move_counter(session, self.name, JobStatus.ASSIGNED, JobStatus.PENDING)
+            record_event(session, "job", self.name, JobStatus.ASSIGNED, JobStatus.PENDING, job_id=row.job_id)
+            session.commit()
+            return row.job_id
+        finally:
+            session.close()
+
+    @retry_on_lock
+    def fetch_job_statuses(self) -> List[Tuple[int, JobStatus]]:
+        """
+        Fetch the (job id, status) pairs of all jobs of this task, used to reconcile the status board.
+        """
+        session = self.__job_session()
+        try:
+            archived = [(job['job_id'], job['status']) for job in fetch_archived_jobs(session, self.name)]
+            return archived + session.query(Job.job_id, Job.status).filter_by(task_name=self.name).all()
+        finally:
+            session.close()
+
+    @retry_on_lock
+    def fetch_jobs(self) -> List[Dict]:
+        """
+        Fetch the history of all jobs of this task, including the archived ones.
+
+        Returns:
+            List[Dict]: One dictionary per job with the fields of the job table, in job id order.
+        """
+        session = self.__job_session()
         try:
-           task_db = session.query(Task).filter_by(name=self.name).one()
-           table = {status.value:0 for status in job_status}
-           for job_db in task_db.jobs:
-               table[job_db.status.value] += 1           
-           return {'status':task_db.status.value, 'summary':table}
+            columns = [getattr(Job, name) for name in ARCHIVE_COLUMNS]
+            rows    = session.query(*columns).filter_by(task_name=self.name).order_by(Job.job_id)
+            return list(fetch_archived_jobs(session, self.name)) + [row._asdict() for row in rows]
         finally:
-            session.close()
\ No newline at end of file
+            session.close()
+
+    @retry_on_lock
+    def archive(self) -> int:
+        """
+        Move the jobs of this task into the archive table.
+
+        Returns:
+            int: The number of archived jobs.
+        """
+        session = self.__job_session()
+        try:
+            archived = archive_jobs(session, self.name)
+            session.commit()
+            return archived
+        finally:
+            session.close()
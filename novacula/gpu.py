@@ -0,0 +1,138 @@
+"""
+This module implements the GPU samplers used by the job monitor.
+
+A sampler returns the GPU memory used by each process (pid) running on the devices
+of the node. The monitor adds the memory of the processes which belong to the job.
+
+Samplers:
+- `NVMLSampler`: queries the driver through NVML (nvidia-ml-py). The library is
+  initialized once per process and the device handles are kept, so each sample costs
+  one library call per device instead of one nvidia-smi process.
+- `NullSampler`: no GPU. Chosen automatically when the job has no visible device
+  (CUDA_VISIBLE_DEVICES=-1) or when NVML or the driver is not available.
+- `FakeSampler`: returns the usage given by the caller, to exercise the monitor on
+  machines without a GPU.
+"""
+
+__all__ = [
+    "GPUSampler",
+    "NVMLSampler",
+    "NullSampler",
+    "FakeSampler",
+    "get_gpu_sampler",
+]
+
+import os
+import atexit
+import threading
+
+from abc    import ABC, abstractmethod
+from typing import Dict, Union
+from loguru import logger
+
+
+MB = 1024**2
+
+
+class GPUSampler(ABC):
+
+    @abstractmethod
+    def processes(self) -> Dict[int, float]:
+        """
+        Return the GPU memory (MB) used by each process running on the node devices.
+        """
+
+
+
+class NullSampler(GPUSampler):
+
+    def processes(self) -> Dict[int, float]:
+        return {}
+
+
+
+class FakeSampler(GPUSampler):
+
+    def __init__(self, usage : Dict[int, float]={}):
+        """
+        Initializes a fake sampler.
+
+        Parameters:
+        ----------
+        usage : Dict[int, float], optional
+            The GPU memory (MB) used by each pid.
+        """
+        self.usage = dict(usage)
+
+    def set(self, pid : int, memory_mb : float):
+        self.usage[pid] = memory_mb
+
+    def processes(self) -> Dict[int, float]:
+        return dict(self.usage)
+
+
+
+class NVMLSampler(GPUSampler):
+
+    def __init__(self):
+        """
+        Initializes NVML and keeps one handle per device.
+
+        Raises:
+            ImportError: If nvidia-ml-py is not installed.
+            pynvml.NVMLError: If the driver is not available.
+        """
+        import pynvml
+        self.__nvml    = pynvml
+        pynvml.nvmlInit()
+        atexit.register(pynvml.nvmlShutdown)
+        self.__handles = [ pynvml.nvmlDeviceGetHandleByIndex(index) for index in range(pynvml.nvmlDeviceGetCount()) ]
+
+    def processes(self) -> Dict[int, float]:
+        usage = {}
+        for handle in self.__handles:
+            for proc in self.__nvml.nvmlDeviceGetComputeRunningProcesses(handle):
+                # NOTE: the used memory is not available on some platforms (e.g. windows or MIG)
+                usage[proc.pid] = usage.get(proc.pid, 0) + (proc.usedGpuMemory or 0) / MB
+        return usage
+
+
+
+__nvml_sampler = None
+__nvml_error   = None
+__nvml_lock    = threading.Lock()
+
+
+def get_gpu_sampler( kind : str="auto", visible_devices : Union[str, None]=None ) -> GPUSampler:
+    """
+    Return the GPU sampler of the job.
+
+    Parameters:
+        kind (str): "nvml", "null" or "auto". The auto mode returns the null sampler when no
+                    device is visible to the job or when NVML is not available.
+        visible_devices (str, optional): The CUDA_VISIBLE_DEVICES of the job. Defaults to the
+                                         value of the current environment.
+
+    Returns:
+        GPUSampler: The sampler. The NVML sampler is shared by all jobs of the process.
+    """
+    global __nvml_sampler, __nvml_error
+    if kind not in ("auto", "nvml", "null"):
+        raise ValueError(f"gpu sampler {kind} is not supported. use auto, nvml or null.")
+    if visible_devices is None:
+        visible_devices = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if kind == "null" or (kind == "auto" and visible_devices is not None and visible_devices.strip() in ("-1", "")):
+        return NullSampler()
+    with __nvml_lock:
+        # NOTE: initialized (or failed) once per process
+        if not __nvml_sampler and not __nvml_error:
+            try:
+                __nvml_sampler = NVMLSampler()
+            except Exception as e:
+                __nvml_error = e
+                logger.debug(f"nvml not available ({e}). gpu usage will not be monitored.")
+        if __nvml_error:
+            if kind == "nvml":
+                raise __nvml_error
+            return NullSampler()
+        return __nvml_sampler
@@ -0,0 +1,230 @@
+"""
+This module defines the packed job-spec store used by tasks to describe their jobs.
+
+Instead of one JSON file per job (which repeats the command, image, binds and
+outputs for every input file), a task keeps a single header with the shared fields
+plus a compact record file holding only the per-job fields. An offset index with
+one fixed-size entry per job id allows a job runner to fetch its record with a
+single seek into the index and a slice of the memory-mapped record file.
+
+Layout of the store directory:
+- header.json  : the fields shared by all jobs of the task.
+- records.jsonl: one compact JSON record per job, in job id order.
+- records.idx  : (offset, length) pairs packed as little-endian uint64, one per job id.
+"""
+
+__all__ = [
+    "JobSpecStore",
+    "load_job_spec",
+]
+
+import os, json, mmap, struct
+
+from typing import Dict, List
+
+
+HEADER_FILE = "header.json"
+RECORD_FILE = "records.jsonl"
+INDEX_FILE  = "records.idx"
+INDEX_ENTRY = struct.Struct("<QQ")
+
+
+class JobSpecStore:
+
+    def __init__(self, path : str):
+            """
+            Initializes a packed job-spec store located at the given directory.
+
+            Parameters:
+            path (str): The directory where the header, record and index files are stored.
+            """
+            self.path = path
+
+    @property
+    def header_file(self) -> str:
+        return f"{self.path}/{HEADER_FILE}"
+
+    @property
+    def record_file(self) -> str:
+        return f"{self.path}/{RECORD_FILE}"
+
+    @property
+    def index_file(self) -> str:
+        return f"{self.path}/{INDEX_FILE}"
+
+    def write_header(self, header : Dict):
+            """
+            Write the fields shared by all jobs of the task.
+
+            Parameters:
+                header (Dict): The shared job fields (command, image, binds, outputs, ...).
+            """
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.header_file, 'w') as f:
+                json.dump(header, f, indent=2)
+
+    def header(self) -> Dict:
+        with open(self.header_file, 'r') as f:
+            return json.load(f)
+
+    def __len__(self) -> int:
+        if not os.path.exists(self.index_file):
+            return 0
+        return os.path.getsize(self.index_file) // INDEX_ENTRY.size
+
+    def truncate(self, size : int):
+            """
+            Drop every index entry beyond the first `size` records.
+
+            This is used before appending new records to guarantee that the record
+            index matches the job id, even if a previous materialization wrote records
+            which were never committed into the database.
+
+            Parameters:
+                size (int): The number of records to keep.
+            """
+            if len(self) > size:
+                with open(self.index_file, 'r+b') as f:
+                    f.truncate(size * INDEX_ENTRY.size)
+
+    def align(self, size : int):
+            """
+            Make the index hold exactly the records of the first `size` job ids, before appending
+            the records of the next ones.
+
+            A longer index is truncated (see `truncate`). A shorter one (e.g. an append interrupted
+            between the record and the index writes) is rebuilt from the record file.
+
+            Parameters:
+                size (int): The number of jobs committed into the database (the next job id).
+
+            Raises:
+                ValueError: If the record of a committed job is not in the record file.
+            """
+            if len(self) > size:
+                self.truncate(size)
+            elif len(self) < size:
+                self.rebuild(size)
+
+    def rebuild(self, size : int):
+            """
+            Rebuild the index of the first `size` job ids from the job id of each record. When
+            a job was written more than once, the last record wins.
+
+            Raises:
+                ValueError: If the record of a job id is not in the record file.
+            """
+            entries = {}
+            if os.path.exists(self.record_file):
+                with open(self.record_file, 'rb') as f:
+                    offset = 0
+                    for line in f:
+                        try:
+                            job_id = json.loads(line)["job_id"]
+                        except (ValueError, KeyError):
+                            # NOTE: a partial line left by an interrupted append
+                            job_id = None
+                        if job_id is not None and job_id < size:
+                            entries[job_id] = INDEX_ENTRY.pack(offset, len(line))
+                        offset += len(line)
+            missing = [ job_id for job_id in range(size) if job_id not in entries ]
+            if missing:
+                raise ValueError(f"the records of {len(missing)} jobs (first {missing[0]}) are missing from the store located at {self.path}.")
+            with open(self.index_file, 'wb') as f:
+                f.write( b"".join( entries[job_id] for job_id in range(size) ) )
+                f.flush()
+                os.fsync(f.fileno())
+
+    def append(self, records : List[Dict]):
+            """
+            Append job records to the store.
+
+            Each record is serialized as one compact JSON line and its (offset, length)
+            pair is appended into the index, so the n-th record written is the record
+            of the n-th job id.
+
+            Parameters:
+                records (List[Dict]): The per-job fields (job id, input data, ...).
+            """
+            if not records:
+                return
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.record_file, 'a+b') as data, open(self.index_file, 'ab') as index:
+                offset  = data.seek(0, os.SEEK_END)
+                if offset and os.pread(data.fileno(), 1, offset - 1) != b"\n":
+                    # NOTE: end the partial line of an interrupted append, so every record stays on its own line
+                    offset += data.write(b"\n")
+                entries = []
+                for record in records:
+                    line = (json.dumps(record, separators=(',', ':')) + "\n").encode()
+                    data.write(line)
+                    entries.append( INDEX_ENTRY.pack(offset, len(line)) )
+                    offset += len(line)
+                data.flush()
+                os.fsync(data.fileno())
+                index.write(b"".join(entries))
+
+    def record(self, index : int) -> Dict:
+            """
+            Read the raw record stored at the given index.
+
+            Parameters:
+                index (int): The record index (the job id).
+
+            Returns:
+                Dict: The per-job fields of the record.
+
+            Raises:
+                IndexError: If the index is out of the range of the store.
+            """
+            if index < 0 or index >= len(self):
+                raise IndexError(f"job record {index} not found in the store located at {self.path}.")
+            with open(self.index_file, 'rb') as f:
+                f.seek(index * INDEX_ENTRY.size)
+                offset, length = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+            with open(self.record_file, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    return json.loads(m[offset:offset+length])
+
+    def __getitem__(self, index : int) -> Dict:
+            """
+            Read the complete job spec (header merged with the record) at the given index.
+
+            Returns:
+                Dict: The job spec in the same format of the per-job JSON files.
+            """
+            job = self.header()
+            job.update(self.record(index))
+            return job
+
+
+def load_job_spec( path : str, job_id : int=None) -> Dict:
+    """
+    Load a job spec from a packed store or from the per-job JSON files.
+
+    Parameters:
+        path (str): The packed store directory, the directory of the per-job JSON files or a per-job JSON file.
+        job_id (int, optional): The job id used to read a directory.
+
+    Returns:
+        Dict: The job spec.
+
+    Raises:
+        ValueError: If the spec read for the job id belongs to another job.
+    """
+    if os.path.isdir(path):
+        if job_id is None:
+            raise ValueError(f"a job id is required to read the job specs located at {path}.")
+        store = JobSpecStore(path)
+        if os.path.exists(store.header_file):
+            spec = store[job_id]
+        else:
+            # NOTE: one JSON file per job
+            with open(f"{path}/job_{job_id}.json", 'r') as f:
+                spec = json.load(f)
+        # NOTE: never run the spec of another job (e.g. a store index out of line with the job ids)
+        if spec.get("job_id") != job_id:
+            raise ValueError(f"the job spec read for job {job_id} from {path} belongs to job {spec.get('job_id')}.")
+        return spec
+    with open(path, 'r') as f:
+        return json.load(f)
@@ -22,14 +22,20 @@ __all__ = [
     "dump",
 ]
 
-import os, json
+import os, json, shlex, math
 
+from time                    import time
+from itertools               import islice
+from sqlalchemy              import insert
 from typing                  import Union, Dict, List
 from novacula.models         import get_context, Context
 from novacula.models.image   import Image 
 from novacula.models.dataset import Dataset
+from novacula.jobspec        import JobSpecStore
+from novacula.board          import StatusBoard, BOARD_FILE
+from novacula.runtime        import get_runtime
 from novacula.db             import get_db_service, models
-from novacula                import sbatch
+from novacula                import sbatch, scancel, array_ranges, split_array
 from loguru                  import logger
 
 # ... rest of the Task class code ...
@@ -39,14 +45,20 @@ __all__ = [
     "dump",
 ]
 
-import os, json
+import os, json, shlex, math
 
+from time                    import time
+from itertools               import islice
+from sqlalchemy              import insert
 from typing                  import Union, Dict, List
 from novacula.models         import get_context, Context
 from novacula.models.image   import Image 
 from novacula.models.dataset import Dataset
+from novacula.jobspec        import JobSpecStore
+from novacula.board          import StatusBoard, BOARD_FILE
+from novacula.runtime        import get_runtime
 from novacula.db             import get_db_service, models
-from novacula                import sbatch
+from novacula                import sbatch, scancel, array_ranges, split_array
 from loguru                  import logger
 
 
@@ -61,6 +73,15 @@ class Task:
                      partition      : str,
                      secondary_data : Dict[str, Union[str, Dataset]] = {},
                      binds          : Dict[str, str] = {},
+                     jobspec        : str = "packed",
+                     status_board   : bool = False,
+                     bundle_size    : int = 1,
+                     workers        : int = 1,
+                     pilots         : int = 0,
+                     walltime       : int = None,
+                     runtime        : str = "singularity",
+                     max_array_size : int = 1000,
+                     array_throttle : int = 0,
             ):
             """
             Initializes a new task with the given parameters.
@@ -74,9 +95,18 @@ class Task:
             - partition (str): The partition to which the task belongs.
             - secondary_data (Dict[str, Union[str, Dataset]], optional): A dictionary of secondary data for the task, defaults to an empty dictionary.
             - binds (Dict[str, str], optional): A dictionary of binds for the task, defaults to an empty dictionary.
+            - jobspec (str, optional): The job-spec layout, "packed" (one header and a record file with an offset index) or "files" (one JSON file per job), defaults to "packed".
+            - status_board (bool, optional): Keep a memory-mapped status board (one byte per job) written by the job runners, defaults to False.
+            - bundle_size (int, optional): The number of jobs (contiguous job ids) run sequentially by each array element, defaults to 1.
+            - workers (int, optional): The number of jobs of a bundle running at the same time inside each array element, zero for one job per CPU of the element (SLURM_CPUS_PER_TASK), defaults to 1.
+            - pilots (int, optional): Submit this number of pilot workers (njob worker) which pull the assigned jobs of the task until none is left, instead of one array element per job or bundle, defaults to 0 (disabled).
+            - walltime (int, optional): The time limit (seconds) of each array element. Pilots stop claiming jobs when the remaining time gets lower than the longest job they ran, defaults to None (partition limit).
+            - runtime (str, optional): The execution runtime of the jobs, "native" (the entrypoint runs directly with the flow virtualenv), "singularity", "apptainer" or a command template with the {entrypoint} placeholder and optionally {image} and {binds}, defaults to "singularity".
+            - max_array_size (int, optional): The Slurm MaxArraySize of the cluster. Larger tasks are submitted as several arrays with indices lower than this size, defaults to 1000.
+            - array_throttle (int, optional): The maximum number of array elements of the task running at the same time (the %N suffix of --array), zero for no limit, defaults to 0.
 
             Raises:
-            - ValueError: If the command does not contain the required placeholders for input, output, or secondary data.
+            - ValueError: If the command does not contain the required placeholders for input, output, or secondary data, if the job-spec layout is unknown or if the bundle size is lower than one, if workers are requested without bundles or pilots, or if pilots are combined with bundles, if the runtime is unknown, or if the maximum array size is lower than one.
             - Exception: If the input dataset or image is not found in the context, or if a task with the same name already exists.
             """
             
@@ -92,6 +122,27 @@ class Task:
                 if f"%{key}" not in command:
                     raise ValueError(f"command must contain the placeholder %{key} for secondary data.")
 
+            if jobspec not in ("packed", "files"):
+                raise ValueError(f"job-spec layout {jobspec} is not supported. use packed or files.")
+            self.jobspec = jobspec
+            self.status_board = status_board
+            if bundle_size < 1:
+                raise ValueError(f"bundle size must be at least 1, got {bundle_size}.")
+            self.bundle_size = bundle_size
+            if pilots and bundle_size > 1:
+                raise ValueError("pilots pull the jobs one by one, they can not be combined with bundles.")
+            if workers != 1 and bundle_size == 1 and not pilots:
+                raise ValueError("workers require a bundle size greater than one or pilots.")
+            self.workers = workers
+            self.pilots = pilots
+            self.walltime = walltime
+            get_runtime(runtime) # NOTE: fail at definition time instead of inside each job
+            self.runtime = runtime
+            if max_array_size < 1:
+                raise ValueError(f"max array size must be at least 1, got {max_array_size}.")
+            self.max_array_size = max_array_size
+            self.array_throttle = array_throttle
+
             ctx = get_context()
 
             if type(input_data) == str:
@@ -205,41 +256,95 @@ class Task:
             return self.outputs_data[key].name
     
 
-    def submit(self) -> int:
+    def submit(self) -> List[int]:
             """
             Submits a job to the job scheduler.
 
             This method performs the following steps:
             1. Retrieves the current context and database service.
             2. Updates the database with the current task information.
-            3. Constructs a script to run the task using sbatch.
-            4. Activates the virtual environment.
-            5. Prepares the njob command with necessary parameters.
-            6. Submits the job and returns the job ID.
+            3. Splits the array elements (jobs, bundles or pilots) into arrays accepted by Slurm,
+               with indices lower than the maximum array size and a base offset per array.
+            4. Constructs one script per array using sbatch, with the indices compressed into ranges.
+            5. Activates the virtual environment.
+            6. Prepares the njob command with necessary parameters.
+            7. Submits the arrays and returns their job IDs.
+
+            The logs of the elements of the first array are written into the works directory, the
+            ones of the next arrays into works/array_<base>, named after the index inside the array.
 
             Returns:
-                int: The ID of the submitted job.
+                List[int]: The IDs of the submitted jobs. Empty if a submission failed, in which case
+                           the arrays already submitted are cancelled.
             """
             
             ctx = get_context()
             db_service = get_db_service()
             self._update_db()   
-            script = sbatch( f"{self.path}/scripts/run_task_{self.task_id}.sh", 
-                            args = {
-                                "array"     : ",".join( [str(job_id) for job_id in self.get_array_of_jobs_with_status() ]),
-                                "output"    : f"{self.path}/works/job_%a/output.out",
-                                "error"     : f"{self.path}/works/job_%a/output.err",
-                                "partition" : self.partition,
-                                "job-name"  : f"run-{self.task_id}",
-                            })
-            script += f"source {ctx.virtualenv}/bin/activate"
-            command = f"njob "
-            command+= f" -i {self.path}/jobs/job_$SLURM_ARRAY_TASK_ID.json"
-            command+= f" -o {self.path}/works/job_$SLURM_ARRAY_TASK_ID"
-            command+= f" -d {ctx.path}/db/data.db"
-            script += command
-            job_id = script.submit() 
-            return int(job_id)
+            self.reconcile_board()
+            assigned = self.get_array_of_jobs_with_status()
+            if self.pilots:
+                # NOTE: pilots pull the assigned jobs, there is no need for more pilots than jobs
+                array = list(range( min(self.pilots, max(len(assigned), 1)) ))
+                name  = "pilot_%a"
+            else:
+                # NOTE: with bundles, each array element runs the assigned jobs of one bundle (job_id // bundle_size)
+                array = sorted( { job_id // self.bundle_size for job_id in assigned } )
+                name  = "bundle_%a" if self.bundle_size > 1 else "job_%a/output"
+
+            job_ids = []
+            for base, indices in split_array( array, self.max_array_size ):
+                works = f"{self.path}/works"
+                if base:
+                    works = f"{self.path}/works/array_{base}"
+                    os.makedirs(works, exist_ok=True)
+                    name  = name.replace("job_%a/output", "job_%a")
+                args = {
+                    "array"     : array_ranges( indices, self.array_throttle ),
+                    "output"    : f"{works}/{name}.out",
+                    "error"     : f"{works}/{name}.err",
+                    "partition" : self.partition,
+                    "job-name"  : f"run-{self.task_id}",
+                }
+                if self.walltime:
+                    args["time"] = math.ceil(self.walltime / 60) # minutes
+                if self.array_throttle and job_ids:
+                    # NOTE: one array at a time, so the throttle holds for the whole task
+                    args["dependency"] = f"afterany:{job_ids[-1]}"
+                path   = f"{self.path}/scripts/run_task_{self.task_id}.sh" if not base else f"{self.path}/scripts/run_task_{self.task_id}_{base}.sh"
+                script = sbatch( path, args = args )
+                script += f"source {ctx.virtualenv}/bin/activate"
+                script += f"JOB_INDEX=$((SLURM_ARRAY_TASK_ID + {base}))"
+                command = f"njob "
+                if self.pilots:
+                    command+= f" worker -i {self.path}/jobs -t {self.name} -o {self.path}/works"
+                    if self.walltime:
+                        command+= f" --walltime {self.walltime}"
+                elif self.bundle_size > 1:
+                    command+= f" -i {self.path}/jobs -j $JOB_INDEX --bundle-size {self.bundle_size}"
+                    command+= f" -o {self.path}/works"
+                elif self.jobspec == "packed":
+                    command+= f" -i {self.path}/jobs -j $JOB_INDEX"
+                    command+= f" -o {self.path}/works/job_$JOB_INDEX"
+                else:
+                    command+= f" -i {self.path}/jobs/job_$JOB_INDEX.json"
+                    command+= f" -o {self.path}/works/job_$JOB_INDEX"
+                if self.workers != 1:
+                    command+= f" --workers {self.workers}"
+                if self.runtime != "singularity":
+                    command+= f" --runtime {shlex.quote(self.runtime)}"
+                command+= f" -d {shlex.quote(db_service.job_db_file(self.name))}"
+                if self.status_board:
+                    command+= f" --board {self.board.path}"
+                script += command
+                job_id = script.submit()
+                if not job_id:
+                    # NOTE: the task is not closed without all its arrays, so none of them is left running
+                    logger.error(f"failed to submit the array with base {base} of task {self.name}. cancelling the arrays already submitted: {job_ids}.")
+                    scancel( job_ids )
+                    return []
+                job_ids.append( int(job_id) )
+            return job_ids
  
  
     def to_raw(self) -> Dict:
@@ -266,6 +371,15 @@ class Task:
                 "partition"         : self.partition,
                 "secondary_data"    : { key : value.name for key, value in self.secondary_data.items() },
                 "binds"             : self.binds,
+                "jobspec"           : self.jobspec,
+                "status_board"      : self.status_board,
+                "bundle_size"       : self.bundle_size,
+                "workers"           : self.workers,
+                "pilots"            : self.pilots,
+                "walltime"          : self.walltime,
+                "runtime"           : self.runtime,
+                "max_array_size"    : self.max_array_size,
+                "array_throttle"    : self.array_throttle,
                 "next"              : [ task.name for task in self._next ],
                 "prev"              : [ task.name for task in self._prev ],
             }
@@ -283,6 +397,15 @@ class Task:
             partition = data['partition'],
             secondary_data = { key : value for key, value in data['secondary_data'].items() },
             binds = data['binds'],
+            jobspec = data.get('jobspec', "packed"),
+            status_board = data.get('status_board', False),
+            bundle_size = data.get('bundle_size', 1),
+            workers = data.get('workers', 1),
+            pilots = data.get('pilots', 0),
+            walltime = data.get('walltime', None),
+            runtime = data.get('runtime', "singularity"),
+            max_array_size = data.get('max_array_size', 1000),
+            array_throttle = data.get('array_throttle', 0),
         )
         
     #
@@ -297,8 +420,8 @@ class Task:
             If the task does not exist, it creates a new Task object, adds it to
             the session, and commits the transaction.
 
-            Note: The task_id assignment is currently commented out and may need
-            to be implemented based on the application's requirements.
+            When the database service is sharded, a dedicated database file is created to
+            hold the jobs of this task and its path is stored into the task row.
             """
             
             db_service = get_db_service()
@@ -307,24 +430,33 @@ class Task:
                     task_db = models.Task()
                     task_db.task_id = self.task_id
                     task_db.name = self.name
+                    if db_service.sharded:
+                        task_db.shard = db_service.create_shard(self.name)
                     session.add(task_db)
                     session.commit()
 
-    def _update_db(self):
+    def _update_db(self, chunk_size : int=10000):
             """
             Updates the database with new job entries associated with the current task.
 
-            This method retrieves the task from the database using its name, checks for existing jobs,
-            and creates new job entries based on the input data provided. Each job is saved as a JSON file
-            in a specified directory, and the job information is stored in the database.
+            This method materializes one job per input file that is not yet registered
+            for the current task. The existing filenames are fetched once as a set and the
+            input dataset is streamed in bounded chunks, so the number of database round
+            trips and the memory footprint do not grow with one query/object per file.
+            Each job spec is appended into the packed job-spec store of the task (or saved
+            as a JSON file per job when the "files" layout is used) and the new rows are
+            inserted with a single executemany-style bulk insert per chunk.
 
             The following steps are performed:
             1. Retrieve the database session.
-            2. Query the task by name.
-            3. Iterate over the input data to create job entries.
-            4. Check if a job with the same filename already exists.
-            5. If not, create a new job entry and save it to the database and as a JSON file.
-            6. Commit the changes to the database.
+            2. Query the task id and the set of filenames already materialized (from the task shard, if any).
+            3. Stream the input data in chunks of at most `chunk_size` files.
+            4. Skip files which already have a job entry (live or archived).
+            5. Save each new job spec and bulk insert the chunk into the database.
+            6. Commit the changes to the database once per chunk.
+
+            Args:
+                chunk_size (int): The maximum number of input files handled per transaction.
 
             Note: This method assumes that the `self.input_data`, `self.outputs_data`, `self.image`, 
             `self.path`, `self.command`, and `self.binds` attributes are properly initialized before calling 
@@ -332,43 +464,70 @@ class Task:
             """
             
             db_service = get_db_service()
+            start      = time()
+            created    = 0
+            task_id    = db_service.task(self.name).fetch_id()
      
-            with db_service() as session:
+            with db_service.job_session(self.name) as session:
                 try:
-                 
-                    task_db = session.query(models.Task).filter_by(name=self.name).one()    
-                    job_id = len(task_db.jobs)
+                    # NOTE: the jobs moved into the archive by compact keep their ids and input files
+                    existing = { filename for (filename,) in session.query(models.Job.filename).filter_by(task_name=self.name) }
+                    existing|= models.fetch_archived_filenames(session, self.name)
+                    job_id   = models.fetch_next_job_id(session, self.name)
+                    files    = ( filepath for filepath in self.input_data )
+                    header   = {
+                        "outputs"       : { key : {"name":value.name.replace(f"{self.name}.",""), "target":value.path} for key, value in self.outputs_data.items() },
+                        "secondary_data": {},
+                        "image"         : self.image.path,
+                        "task_id"       : self.task_id,
+                        "command"       : self.command,
+                        "binds"         : self.binds,
+                        "job_name"      : "",
+                        "task_name"     : self.name,
+                    }
+                    store = JobSpecStore( f"{self.path}/jobs" )
+                    if self.jobspec == "packed":
+                        store.write_header(header)
+                        store.align(job_id)
                         
-                    for filepath in self.input_data:
-                        filename = filepath.split('/')[-1]
-                        if session.query(models.Job).filter_by(task_name=self.name, filename=filename).count() == 0:
-                                                
-                            path = f"{self.path}/jobs/job_{job_id}.json"
-                            with open( path, 'w') as f:
-                                d = {
-                                    "input_data"    : filepath,
-                                    "outputs"       : { key : {"name":value.name.replace(f"{self.name}.",""), "target":value.path} for key, value in self.outputs_data.items() },
-                                    "secondary_data": {},
-                                    "image"         : self.image.path,
-                                    "job_id"        : job_id,
-                                    "task_id"       : self.task_id,
-                                    "command"       : self.command,
-                                    "binds"         : self.binds,
-                                    "job_name"      : "",
-                                    "task_name"     : self.name,
-                                }
-                                json.dump(d, f, indent=2)
-
-                            job_db          = models.Job()
-                            job_db.job_id   = job_id 
-                            job_db.task_name= self.name
-                            job_db.filename = filename
-                            job_db.status   = models.JobStatus.ASSIGNED
-                            task_db        += job_db 
-                            job_id         += 1
+                    while chunk := list(islice(files, chunk_size)):
+                        rows    = []
+                        records = []
+                        for filepath in chunk:
+                            filename = filepath.split('/')[-1]
+                            if filename in existing:
+                                continue
+                            existing.add(filename)
                             
-                    logger.info(f"creating task with name {self.name}")
-                    session.commit()
+                            record = { "job_id" : job_id, "input_data" : filepath }
+                            if self.jobspec == "packed":
+                                records.append(record)
+                            else:
+                                path = f"{self.path}/jobs/job_{job_id}.json"
+                                with open( path, 'w') as f:
+                                    json.dump({**header, **record}, f, indent=2)
+
+                            rows.append({
+                                "job_id"    : job_id,
+                                "taskid"    : task_id,
+                                "task_name" : self.name,
+                                "filename"  : filename,
+                                "status"    : models.JobStatus.ASSIGNED,
+                            })
+                            job_id += 1
+                            
+                        if rows:
+                            store.append(records)
+                            session.execute(insert(models.Job), rows)
+                            models.add_to_counter(session, self.name, models.JobStatus.ASSIGNED, len(rows))
+                            models.record_event(session, "job", self.name, None, models.JobStatus.ASSIGNED, count=len(rows))
+                            session.commit()
+                            created += len(rows)
+                            
+                    if self.status_board:
+                        self.board.resize(job_id)
+                    elapsed = time() - start
+                    logger.info(f"created {created} jobs for task with name {self.name} in {elapsed:.2f}s ({created/max(elapsed,1e-9):.1f} jobs/s)")
                 finally:
                     session.close()
             
@@ -377,7 +536,8 @@ class Task:
             Retrieve an array of job IDs with a specified status.
 
             This method queries the database for jobs associated with the current task name
-            that match the given status. It returns a list of job IDs.
+            that match the given status. It returns a list of job IDs. When the task keeps a
+            status board, the ids are scanned from the board instead.
 
             Args:
                 status (models.JobStatus): The status of the jobs to retrieve. Defaults to
@@ -390,18 +550,31 @@ class Task:
                 Ensure that the database service is properly configured and accessible.
             """
             
+            if self.status_board:
+                return self.board.job_ids(status)
             db_service = get_db_service()
-            jobs = []
-            with db_service() as session:
-                try:
-                    task_db = session.query(models.Task).filter_by(name=self.name).one()
-                    for job_db in task_db.jobs:
-                        if job_db.status == status:
-                            jobs.append(job_db.job_id)
-                    
-                finally:
-                    session.close()
-            return jobs
+            return db_service.task(self.name).fetch_job_ids(status)
+
+    @property
+    def board(self) -> Union[StatusBoard, None]:
+        return StatusBoard(f"{self.path}/{BOARD_FILE}") if self.status_board else None
+
+    def reconcile_board(self) -> int:
+            """
+            Reconcile the status board with the job statuses stored in the database.
+
+            Returns:
+                int: The number of jobs whose board status was out of date.
+            """
+            if not self.status_board:
+                return 0
+            db_service = get_db_service()
+            # NOTE: the board snapshot is taken before the database read (see StatusBoard.reconcile)
+            before  = self.board.load()
+            changed = self.board.reconcile( db_service.task(self.name).fetch_job_statuses(), before )
+            if changed:
+                logger.info(f"reconciled {changed} job statuses of the task {self.name} status board.")
+            return changed
         
 #
 # read and write functions
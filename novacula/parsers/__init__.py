@@ -6,9 +6,10 @@ __all__ = []
 #__all__.extend( job.__all__ )
 #from .job import *
 
-from . import task
-__all__.extend( task.__all__ )
-from .task import *
+# NOTE: the task parser depends on SQLAlchemy, it is not imported here to keep the job runtime light.
+#from . import task
+#__all__.extend( task.__all__ )
+#from .task import *
 
 #from . import main
 #__all__.extend( main.__all__ )
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+import sys
+import signal
+import argparse
+
+from novacula       import get_argparser_formatter, setup_logs
+from novacula.agent import Agent, AGENT_SOCKET, AGENT_INTERVAL
+
+
+
+def agent( args ):
+
+    setup_logs( name = f"NodeAgent", level=args.message_level )
+    service = Agent( args.socket, interval=args.interval )
+    signal.signal( signal.SIGTERM, lambda signum, frame : service.stop() )
+    signal.signal( signal.SIGINT , lambda signum, frame : service.stop() )
+    service.serve()
+
+
+
+#
+# args 
+#
+def run():
+    formatter_class = get_argparser_formatter()
+
+    parser    = argparse.ArgumentParser(formatter_class=formatter_class)
+    parser.add_argument('-s','--socket', action='store', dest='socket', required = False, default=AGENT_SOCKET,
+                        help = "The local Unix socket used to receive the job events")
+    parser.add_argument('-t','--interval', action='store', dest='interval', required = False, default=AGENT_INTERVAL, type=float,
+                        help = "The time (seconds) between two batched database transactions")
+    parser.add_argument('-m','--message-level', action='store', dest='message_level', required = False, default='INFO',
+                        help = "The agent message level (DEBUG, INFO, WARNING, ERROR)")
+
+    args = parser.parse_args()
+    agent( args )
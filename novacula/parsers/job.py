@@ -9,40 +9,256 @@ import shutil
 import os, sys
 from loguru         import logger
 from pprint         import pprint
-from time           import sleep
+from time           import time
+from typing         import Callable, Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from loguru         import logger
 from novacula       import get_argparser_formatter
 from novacula       import setup_logs, Popen, symlink
-from novacula.db    import get_db_service
-from novacula.db    import JobStatus as status
+from novacula       import StatusClient, AgentClient, AGENT_SOCKET, load_job_spec, get_lock_stats, sqlite_file
+from novacula       import StatusBoard, BoardJob
+from novacula       import Runtime, RUNTIMES, get_runtime, startup_marker, startup_time
+from novacula       import JobStatus as status
+
+
+
+
+def job_services( args, workers : int=1 ) -> Tuple[Callable, Callable]:
+    """
+    Open the status backend of the runner, shared by all jobs it runs.
+
+    Parameters:
+        workers (int): The number of jobs running at the same time.
+
+    Returns:
+        Tuple[Callable, Callable]: A factory returning the status service of a job given its task name
+                                   and job id, and a function claiming the next assigned job of a task.
+    """
+    if sqlite_file(args.db_file):
+        db_client   = StatusClient(args.db_file)
+        agent       = AgentClient(db_client, args.agent_socket)
+        # NOTE: claims are always written directly, they must be atomic
+        claim       = db_client.claim
+        if agent.available:
+            logger.info(f"sending status and heartbeat events through the node agent at {args.agent_socket}.")
+            factory = agent.job
+        else:
+            factory = db_client.job
+    else:
+        # NOTE: server databases go through the ORM, one connection per concurrent job is enough
+        from novacula.db import DBService
+        db_service = DBService(args.db_file, pool_size=workers, max_overflow=0)
+        factory    = db_service.job
+        claim      = lambda task_name : db_service.task(task_name).claim_job()
+    if args.board:
+        board = StatusBoard(args.board)
+        return (lambda task_name, job_id : BoardJob( factory(task_name, job_id), board )), claim
+    return factory, claim
+
+
+def bundle_job_ids( args ) -> List[int]:
+    """
+    Return the job ids run by this runner. With a bundle size, the job id argument is the
+    bundle index and the runner owns the contiguous range of ids of that bundle.
+    """
+    if not args.bundle_size:
+        return [args.job_id]
+    first = args.job_id * args.bundle_size
+    return list(range(first, first + args.bundle_size))
+
+
+def allocation_cpus() -> int:
+    """
+    Return the number of CPUs of the allocation (SLURM_CPUS_PER_TASK), or of the node outside Slurm.
+    """
+    return max( int(os.environ.get("SLURM_CPUS_PER_TASK", os.cpu_count() or 1)), 1 )
+
+
+def pool_size( args ) -> int:
+    """
+    Return the number of jobs running at the same time. Zero workers means one job per
+    CPU of the allocation (SLURM_CPUS_PER_TASK).
+    """
+    if args.workers is None:
+        return 1
+    if args.workers == 0:
+        return allocation_cpus()
+    return args.workers
+
+
+def job_accounting( args, workers : int ) -> str:
+    """
+    Return the accounting backend of the jobs. Jobs running at the same time share the cgroup
+    of the allocation, so each one is then accounted over its own process tree (psutil), which
+    also restricts the GPU usage to the processes of the job.
+    """
+    if workers > 1 and args.accounting != "psutil":
+        if args.accounting == "cgroup":
+            logger.warning(f"the cgroup accounting can not be used by {workers} concurrent jobs. using psutil instead.")
+        return "psutil"
+    return args.accounting
+
+
+def job_runtime( args, many_jobs : bool ) -> Runtime:
+    """
+    Return the execution runtime of the runner, shared by all jobs it runs.
+
+    Parameters:
+        many_jobs (bool): True if the runner may execute more than one job. In the auto
+                          instance mode, the jobs then share one container instance per image.
+    """
+    instance = args.instance == "on" or (args.instance == "auto" and many_jobs)
+    return get_runtime( args.runtime, binary=args.runtime_binary, instance=instance )
 
 
-         
 def job( args ):
 
     setup_logs( name = f"JobRunner", level=args.message_level )
-    workarea = args.output
-
-    with open ( args.input , 'r') as f:
-        job          = json.load(f)
-        job_name     = job['job_name']
-        command      = job['command']
-        job_id       = job['job_id']
-        task_id      = job['task_id']
-        image        = job['image']
-        input_data   = job['input_data']
-        outputs_data = job['outputs']
-        task_binds   = job['binds']
-        task_name    = job['task_name']
-        task_envs    = {}
-
-
-    db_service  = get_db_service(args.db_file)
-    job_service = db_service.job( task_name, job_id )
+    workers     = pool_size( args )
+    services, _ = job_services( args, workers )
+    runtime     = job_runtime( args, bool(args.bundle_size) )
+    # NOTE: the jobs of a bundle run inside the same cgroup, one after the other
+    args.shared     = bool(args.bundle_size)
+    args.accounting = job_accounting( args, workers )
+    # NOTE: the CPUs of the allocation are shared by the jobs running at the same time
+    cpus        = max( allocation_cpus() // workers, 1 )
+
+    def run( job_id : int ) -> bool:
+        try:
+            spec = load_job_spec( args.input, job_id )
+        except (IndexError, FileNotFoundError):
+            if not args.bundle_size:
+                raise
+            # NOTE: the last bundle of the task may be shorter than the bundle size
+            logger.info(f"no job with id {job_id}. end of the task.")
+            return False
+        job_service = services( spec['task_name'], spec['job_id'] )
+        if args.bundle_size and job_service.fetch_status() != status.ASSIGNED:
+            logger.info(f"skipping job {job_id} since it is not assigned anymore.")
+            return True
+        workarea = f"{args.output}/job_{job_id}" if args.bundle_size else args.output
+        execute_job( spec, job_service, workarea, args, cpus, runtime )
+        return True
+
+    with runtime:
+        if workers > 1:
+            logger.info(f"running up to {workers} jobs at the same time with {cpus} cpus each.")
+            # NOTE: a new job starts as soon as one slot is released, until the id range is exhausted
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list( pool.map(run, bundle_job_ids(args)) )
+        else:
+            for job_id in bundle_job_ids( args ):
+                if not run( job_id ):
+                    break
+    logger.info(f"database lock waits: {get_lock_stats()}")
+    sys.exit(0)
+
+
+def worker( args ):
+
+    setup_logs( name = f"JobWorker", level=args.message_level )
+    workers         = pool_size( args )
+    services, claim = job_services( args, workers )
+    runtime         = job_runtime( args, True )
+    args.shared     = True
+    args.accounting = job_accounting( args, workers )
+    cpus            = max( allocation_cpus() // workers, 1 )
+    deadline        = time() + args.walltime if args.walltime else None
+    longest         = [0] # the longest job executed by this pilot (seconds)
+
+    def budget_low() -> bool:
+        # NOTE: a new job is only claimed if the longest job seen so far still fits into the remaining walltime
+        return deadline is not None and (deadline - time()) < max( args.reserve, longest[0] )
+
+    def loop( slot : int ) -> int:
+        executed = 0
+        while True:
+            if budget_low():
+                logger.info(f"slot {slot}: walltime budget running low. no more jobs will be claimed.")
+                return executed
+            job_id = claim( args.task_name )
+            if job_id is None:
+                logger.info(f"slot {slot}: no assigned job left for task {args.task_name}.")
+                return executed
+            logger.info(f"slot {slot}: claimed job {job_id}.")
+            start = time()
+            try:
+                spec = load_job_spec( args.input, job_id )
+                execute_job( spec, services(spec['task_name'], job_id), f"{args.output}/job_{job_id}", args, cpus, runtime )
+            except Exception:
+                # NOTE: the claimed job must reach a final status, otherwise no runner will ever pick it again
+                traceback.print_exc()
+                logger.error(f"slot {slot}: unexpected error while running the job {job_id}. flagging it as failed.")
+                fail_job( services, args.task_name, job_id )
+            longest[0] = max( longest[0], time() - start )
+            executed  += 1
+
+    if workers > 1:
+        logger.info(f"running up to {workers} jobs at the same time with {cpus} cpus each.")
+    with runtime, ThreadPoolExecutor(max_workers=workers) as pool:
+        executed = sum( pool.map(loop, range(workers)) )
+    logger.info(f"{executed} jobs executed by this worker.")
+    logger.info(f"database lock waits: {get_lock_stats()}")
+    sys.exit(0)
+
+
+def fail_job( services : Callable, task_name : str, job_id : int ):
+    """
+    Flag a job as failed, logging (instead of raising) any error of the status backend.
+    """
+    try:
+        services( task_name, job_id ).update_status(status.FAILED)
+    except Exception as e:
+        logger.error(f"not able to flag the job {job_id} as failed: {e}")
+
+
+def execute_job( spec : Dict, job_service, workarea : str, args, cpus : int=None, runtime : Runtime=None ) -> bool:
+    """
+    Run one job, flagging it as failed if it could not be prepared. A failed job never
+    stops the runner, which moves to the next job.
+
+    Returns:
+        bool: True if the job completed.
+    """
+    try:
+        return run_job( spec, job_service, workarea, args, cpus, runtime )
+    except:
+        traceback.print_exc()
+        logger.error(f"error while preparing the job {spec['job_id']}.")
+        job_service.update_status(status.FAILED)
+        return False
+
+
+def run_job( job : Dict, job_service, workarea : str, args, cpus : int=None, runtime : Runtime=None ) -> bool:
+    """
+    Run one job and track its status.
+
+    Parameters:
+        job (Dict): The job spec.
+        job_service: The status service of the job.
+        workarea (str): The job workarea.
+        args: The runner arguments.
+        cpus (int, optional): The number of threads given to the job (OMP_NUM_THREADS).
+        runtime (Runtime, optional): The execution runtime building the job command. Defaults to
+                                     the runtime of the runner arguments, without container instance.
+
+    Returns:
+        bool: True if the job completed.
+    """
+    job_name     = job['job_name']
+    command      = job['command']
+    job_id       = job['job_id']
+    task_id      = job['task_id']
+    image        = job['image']
+    input_data   = job['input_data']
+    outputs_data = job['outputs']
+    task_binds   = job['binds']
+    task_name    = job['task_name']
+    task_envs    = {}
+
     job_service.start()
     job_service.update_status(status.PENDING)
 
-
     logger.info("starting...")
     os.makedirs( workarea, exist_ok=True)
     logger.info(f"workarea {workarea} created.")
@@ -55,7 +271,7 @@ def job( args ):
 
 
     imagename = image.split('/')[-1]
-    logger.info(f"using singularity image with name {imagename}.")
+    logger.info(f"using image with name {imagename}.")
     linkpath  = symlink(image, f"{workarea}/{imagename}")
     image     = linkpath
 
@@ -88,17 +304,15 @@ def job( args ):
         
     entrypoint = f"{workarea}/entrypoint.sh"
     with open(entrypoint,'w') as f:
+        f.write(startup_marker(workarea) + "\n")
         f.write(f"cd {workarea}\n")
         f.write(command)
             
     ok=True
     try:
-        logger.info("preparing singularity command...")
-        binds   = f''
-        for key,value in task_binds.items():
-            binds+= f' --bind {key}:{value}'
-        command = f"singularity exec --nv --writable-tmpfs {binds} {image} bash {entrypoint}"
-        command = command.replace('  ',' ') 
+        runtime = runtime or job_runtime( args, False )
+        logger.info(f"preparing {runtime.name} command...")
+        command = runtime.command( entrypoint, image, task_binds )
 
         envs = {}
         envs["JOB_ID"]               = f"{job_id}"
@@ -107,7 +321,7 @@ def job( args ):
         envs["TF_CPP_MIN_LOG_LEVEL"] = "3"
         envs["CUDA_VISIBLE_ORDER"]   = "PCI_BUS_ID"
         envs["CUDA_VISIBLE_DEVICES"] = os.environ.get("CUDA_VISIBLE_DEVICES","-1")
-        envs["OMP_NUM_THREADS"]      = os.environ.get("SLURM_CPUS_PER_TASK", '4')
+        envs["OMP_NUM_THREADS"]      = str(cpus or allocation_cpus())
         envs["SLURM_CPUS_PER_TASK"]  = envs["OMP_NUM_THREADS"]
         envs["SLURM_MEM_PER_NODE"]   = os.environ.get("SLURM_MEM_PER_NODE", '2048')
         envs.update(task_envs)
@@ -118,37 +332,45 @@ def job( args ):
         logger.info(f"command: {command}")
         
         logger.info("starting the process...")
-        proc = Popen(command, envs = envs)
+        proc = Popen(command, envs = runtime.environ(envs), accounting = args.accounting, grace_period = args.grace_period,
+                     shared = getattr(args, "shared", False))
         logger.info("process started.")
-        proc.run_async()
+        launched = time()
+        if not proc.run_async():
+            logger.error(f"the job process failed within the first {args.grace_period} seconds.")
         
         logger.info("updating job status to running...")
         job_service.update_status(status.RUNNING)
-        proc.join()
-        while proc.is_alive():
-            sleep(10)
+        # NOTE: wake up as soon as the process exits, or every poll interval for the heartbeat and kill request
+        while not proc.wait(timeout=args.poll_interval):
             job_service.ping()
             db_status = job_service.fetch_status()
             if db_status == status.KILL:
+                logger.info("kill request received. killing the job process...")
                 proc.kill()
-                proc.join()                
                 job_service.update_status(status.KILLED)
                 ok=False
+                break
+        logger.info("storing the job metrics...")
+        metrics = proc.metrics()
+        metrics["startup_time"] = startup_time( workarea, launched )
+        logger.info(f"{runtime.name} startup time: {metrics['startup_time']} seconds.")
+        job_service.update_metrics( metrics, proc.exitcode, proc.series() )
     except:
         traceback.print_exc()
         logger.error("error during the job execution.")
         job_service.update_status(status.FAILED)
-        sys.exit(0)
+        return False
 
     if not ok:
         logger.error("job execution failed.")
-        sys.exit(0)
+        return False
     
     logger.info("job execution completed.")
     if proc.status()!="completed":
         logger.error(f"something happing during the job execution. exiting with status {proc.status()}")
         job_service.update_status(status.FAILED)
-        sys.exit(0)
+        return False
     
     
     logger.info("uploading output files into the storage...")
@@ -160,12 +382,12 @@ def job( args ):
         else:
             logger.error(f"output file {filename} not found in workarea {workarea}.")
             job_service.update_status(status.FAILED)
-            sys.exit(0)
+            return False
             
     logger.info("job completed successfully.")
     job_service.ping()
     job_service.update_status(status.COMPLETED)
-    sys.exit(0)
+    return True
 
 
 
@@ -173,25 +395,83 @@ def job( args ):
 #
 # args 
 #
-def run():
-    formatter_class = get_argparser_formatter()
+def runtime_parser():
 
-    parser    = argparse.ArgumentParser(formatter_class=formatter_class)
-    parser.add_argument('-i','--input', action='store', dest='input', required = True,
-                        help = "The job input file")
-    parser.add_argument('-o','--output', action='store', dest='output', required = False, default='circuit.json',
-                        help = "The job output")
+    parser = argparse.ArgumentParser(description = '', add_help = False)
+    parser.add_argument('--workers', action='store', dest='workers', required = False, default=None, type=int, nargs='?', const=0,
+                        help = "Run the jobs concurrently with a pool of workers. Without a value, one worker per CPU of the allocation (SLURM_CPUS_PER_TASK)")
     parser.add_argument('-d','--db-file', action='store', dest='db_file', required = True,
-                        help = "The database file")
+                        help = "The database file or a full SQLAlchemy URL")
+    parser.add_argument('--agent-socket', action='store', dest='agent_socket', required = False, default=AGENT_SOCKET,
+                        help = "The node agent socket. If no agent is running, the job writes directly into the database")
+    parser.add_argument('--board', action='store', dest='board', required = False, default=None,
+                        help = "The task status board. Each status update is also written into the board")
+    parser.add_argument('--accounting', action='store', dest='accounting', required = False, default='auto',
+                        help = "The resource accounting backend (auto, cgroup or psutil). The auto mode uses the Slurm job cgroup when available",
+                        choices=["auto","cgroup","psutil"])
+    parser.add_argument('--grace-period', action='store', dest='grace_period', required = False, default=2, type=float,
+                        help = "The window (seconds) used to detect a broken start. The command is not delayed by it")
+    parser.add_argument('--poll-interval', action='store', dest='poll_interval', required = False, default=10, type=float,
+                        help = "The interval (seconds) between two heartbeats and kill request checks while the job runs")
+    parser.add_argument('--runtime', action='store', dest='runtime', required = False, default='singularity',
+                        help = f"The execution runtime of the jobs ({', '.join(RUNTIMES)}) or a command template with the {{entrypoint}} placeholder and optionally {{image}} and {{binds}}")
+    parser.add_argument('--runtime-binary', action='store', dest='runtime_binary', required = False, default=None,
+                        help = "Override the container binary of the singularity and apptainer runtimes")
+    parser.add_argument('--instance', action='store', dest='instance', required = False, default='auto',
+                        help = "Run the jobs inside one persistent container instance per image, stopped when the runner exits. The auto mode uses it when the runner executes more than one job (bundles and workers)",
+                        choices=["auto","on","off"])
     parser.add_argument('-m','--message-level', action='store', dest='message_level', required = False, default='INFO',
                         help = "The job message level (DEBUG, INFO, WARNING, ERROR)")
+    return parser
+
 
+def job_parser():
+
+    parser = argparse.ArgumentParser(description = '', add_help = False, parents=[runtime_parser()])
+    parser.add_argument('-i','--input', action='store', dest='input', required = True,
+                        help = "The job input file or the packed job-spec directory")
+    parser.add_argument('-j','--job-id', action='store', dest='job_id', required = False, default=None, type=int,
+                        help = "The job id to read from the packed job-spec directory")
+    parser.add_argument('-o','--output', action='store', dest='output', required = False, default='circuit.json',
+                        help = "The job output. With a bundle size, the directory holding one workarea per job")
+    parser.add_argument('--bundle-size', action='store', dest='bundle_size', required = False, default=None, type=int,
+                        help = "Run a bundle of jobs sequentially. The job id is then the bundle index and the jobs from job_id*bundle_size to (job_id+1)*bundle_size-1 still assigned are executed")
+    return parser
+
+
+def worker_parser():
+
+    parser = argparse.ArgumentParser(description = '', add_help = False, parents=[runtime_parser()])
+    parser.add_argument('-i','--input', action='store', dest='input', required = True,
+                        help = "The job-spec directory of the task")
+    parser.add_argument('-t','--task-name', action='store', dest='task_name', required = True,
+                        help = "The task whose assigned jobs are claimed")
+    parser.add_argument('-o','--output', action='store', dest='output', required = True,
+                        help = "The directory holding one workarea per job")
+    parser.add_argument('--walltime', action='store', dest='walltime', required = False, default=None, type=float,
+                        help = "The time budget (seconds) of the worker. No job is claimed once the remaining time is lower than the longest job executed so far")
+    parser.add_argument('--reserve', action='store', dest='reserve', required = False, default=60, type=float,
+                        help = "The minimum remaining time (seconds) required to claim a new job")
+    return parser
+
+
+def run():
+    formatter_class = get_argparser_formatter()
+
+    # NOTE: njob runs the jobs given by id (push mode), njob worker pulls the assigned jobs of a task (pilot mode)
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        parser = argparse.ArgumentParser(prog="njob worker", formatter_class=formatter_class, parents=[worker_parser()])
+        if len(sys.argv)==2:
+            parser.print_help()
+            sys.exit(1)
+        args = parser.parse_args(sys.argv[2:])
+        worker( args )
+        return
+
+    parser = argparse.ArgumentParser(formatter_class=formatter_class, parents=[job_parser()])
     if len(sys.argv)==1:
         parser.print_help()
         sys.exit(1)
 
     args = parser.parse_args()
     job( args )
-    
-    
-
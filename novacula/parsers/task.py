@@ -9,11 +9,17 @@ It includes the following main functions:
 
 3. `args_parser()`: Creates and returns an argument parser for command-line arguments related to task management.
 
-4. `build_argparser()`: Builds the main argument parser with subparsers for the 'init' and 'close' modes.
+4. `watch(args)`: Shows a live table with the job status counters of all tasks. The table is loaded once and then kept up to date by reading only the new entries of the status journal. With the task file, the status boards of the running tasks are also reconciled with the database periodically.
 
-5. `run_parser(args)`: Executes the appropriate function (`init` or `close`) based on the parsed command-line arguments.
+5. `compact(args)`: Moves the jobs of finished tasks (completed, finalized or canceled) into the compressed job archive and vacuums the databases.
 
-6. `run()`: The entry point of the module that sets up the argument parser and processes command-line input.
+6. `export(args)`: Writes the job table of the flow (status, retry, timings and resource metrics) into a Parquet or Arrow file, streaming the jobs in chunks.
+
+7. `build_argparser()`: Builds the main argument parser with subparsers for the 'init', 'close', 'watch', 'compact' and 'export' modes.
+
+8. `run_parser(args)`: Executes the appropriate function (`init`, `close`, `watch`, `compact` or `export`) based on the parsed command-line arguments.
+
+9. `run()`: The entry point of the module that sets up the argument parser and processes command-line input.
 
 Usage:
     This module can be executed from the command line to manage tasks by providing the appropriate arguments.
@@ -21,24 +27,47 @@ Usage:
 __all__ = []
 
 import sys
+import time
+import shlex
 import argparse
+
+from typing import Dict
 from loguru import logger
+from datetime import datetime
+from rich.live import Live
+from rich.table import Table
 
 
 from novacula.models.task   import load
 from novacula               import get_context, sbatch, setup_logs
 from novacula               import get_argparser_formatter
-from novacula.db            import get_db_service, models 
+from novacula.db            import get_db_service, export_jobs, models 
 from novacula.db            import JobStatus as job_status
 from novacula.db            import TaskStatus as task_status
+from novacula.db.db_client  import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE
 
 
 
+def db_options(args) -> Dict:
+    return {
+        "pool_size"    : args.db_pool_size,
+        "max_overflow" : args.db_max_overflow,
+        "pool_recycle" : args.db_pool_recycle,
+    }
+
+def db_args(args) -> str:
+    command = f"--db-file {shlex.quote(args.db_file)}"
+    command+= f" --db-pool-size {args.db_pool_size}"
+    command+= f" --db-max-overflow {args.db_max_overflow}"
+    command+= f" --db-pool-recycle {args.db_pool_recycle}"
+    return command
+
+
 def init(args):
     
     setup_logs( name = f"TaskInit:{args.index}", level=args.message_level )
     ctx = get_context( clear=True )
-    db_service = get_db_service( args.db_file )
+    db_service = get_db_service( args.db_file, **db_options(args) )
     logger.info(f"Initializing task with index {args.index}.")
     logger.info(f"Loading task file {args.task_file}.")
     load( args.task_file , ctx)
@@ -52,11 +81,11 @@ def init(args):
     
     # create the main script
     logger.info(f"Submitting main script for task {task.name}.")
-    job_id = task.submit()
-    logger.info(f"Submitted task {task.name} with job ID {job_id}.")
+    job_ids = task.submit()
+    logger.info(f"Submitted task {task.name} with job IDs {job_ids}.")
     
     # check if the job submission was successful
-    if not job_id:
+    if not job_ids:
         logger.error(f"Failed to submit task {task.name}.")
         raise Exception(f"Failed to submit task {task.name}.")
     
@@ -67,11 +96,11 @@ def init(args):
                         "output"    : f"{task.path}/scripts/close_task_{task.task_id}.out",
                         "error"     : f"{task.path}/scripts/close_task_{task.task_id}.err",
                         "job-name"  : f"{task.task_id}-{task.task_id}",
-                        "dependency": f"afterok:{job_id}",
+                        "dependency": "afterok:" + ":".join( str(job_id) for job_id in job_ids ),
                     }
     )
     script += f"source {ctx.virtualenv}/bin/activate"
-    script += f"ntask close --task-file {ctx.path}/tasks.json --index {task.task_id} --db-file {ctx.path}/db/data.db"
+    script += f"ntask close --task-file {ctx.path}/tasks.json --index {task.task_id} {db_args(args)}"
     logger.info(f"Submitting closing script for task {task.name}.")
     script.submit()
         
@@ -81,7 +110,7 @@ def close(args):
     
     setup_logs( name = f"TaskCloser:{args.index}", level=args.message_level )
     ctx = get_context( clear=True )
-    db_service = get_db_service( args.db_file )
+    db_service = get_db_service( args.db_file, **db_options(args) )
 
     logger.info(f"Finalizing task with index {args.index}.")
     logger.info(f"Loading task file {args.task_file}.")
@@ -96,24 +125,22 @@ def close(args):
 
     ok = True
     logger.info(f"Checking job statuses for task {task.name}.")
-    with db_service() as session:
-        try:
-            task_db = session.query( models.Task ).filter( models.Task.name == task.name ).one()
-            if not task_db:
-                raise Exception(f"Task with index {args.index} not found in database.")
-            if all( job.status == job_status.COMPLETED for job in task_db.jobs ):
-                logger.info(f"All jobs for task {task.name} completed successfully.")
-                task_db.status = task_status.COMPLETED
-            elif sum([ job.status == job_status.FAILED for job in task_db.jobs ]) / len(task_db.jobs) > 0.1:
-                logger.info(f"More than 10% of jobs for task {task.name} failed.")
-                task_db.status = task_status.FAILED
-                ok = False
-            else:
-                logger.info(f"Some jobs for task {task.name} failed, but within acceptable limits.")
-                task_db.status = task_status.FINALIZED
-            session.commit()
-        finally:
-            session.close()
+    task_service = db_service.task( task.name )
+    if not task_service.check_existence():
+        raise Exception(f"Task with index {args.index} not found in database.")
+    task.reconcile_board()
+    summary = task_service.fetch_summary()['summary']
+    total   = sum(summary.values())
+    if summary[job_status.COMPLETED.value] == total:
+        logger.info(f"All jobs for task {task.name} completed successfully.")
+        task_service.update_status( task_status.COMPLETED )
+    elif summary[job_status.FAILED.value] / total > 0.1:
+        logger.info(f"More than 10% of jobs for task {task.name} failed.")
+        task_service.update_status( task_status.FAILED )
+        ok = False
+    else:
+        logger.info(f"Some jobs for task {task.name} failed, but within acceptable limits.")
+        task_service.update_status( task_status.FINALIZED )
             
     
     # if the current task is failed, we need to cancel the entire graph
@@ -124,6 +151,7 @@ def close(args):
                 for task_db in session.query( models.Task ).all():
                     if task_db.status == task_status.ASSIGNED:
                         logger.info(f"Canceling task {task_db.name}.")
+                        models.record_event(session, "task", task_db.name, task_db.status, task_status.CANCELED)
                         task_db.status = task_status.CANCELED
                 session.commit()
             finally:
@@ -142,22 +170,188 @@ def close(args):
                     }
             )
             script += f"source {ctx.virtualenv}/bin/activate"
-            script += f"ntask init --task-file {ctx.path}/tasks.json --index {task.task_id} --db-file {ctx.path}/db/data.db"
+            script += f"ntask init --task-file {ctx.path}/tasks.json --index {task.task_id} {db_args(args)}"
             logger.info(f"Submitting initialization script for task {task.name}.")
             script.submit()
     
 
-def args_parser():
+FINAL_TASK_STATUS = [task_status.COMPLETED.value, task_status.FAILED.value, task_status.FINALIZED.value, task_status.CANCELED.value]
+
+
+def watch(args):
+
+    setup_logs( name = "TaskWatch", level=args.message_level )
+    db_service = get_db_service( args.db_file, **db_options(args) )
+
+    # NOTE: the initial table is read from the task status and the task counters, each one in a
+    # single statement with the last journal sequence, so the table matches the journal cursor.
+    with db_service() as session:
+        task_cursor, statuses = models.fetch_task_statuses(session)
+
+    # one cursor per database holding jobs (the main database or one shard per task)
+    sources, cursors, summaries = {}, {}, {}
+    for name in statuses:
+        sources.setdefault( db_service.job_db_file(name), name )
+    for key, name in sources.items():
+        with db_service.job_session(name) as session:
+            cursors[key], counters = models.fetch_counters(session)
+            summaries.update(counters)
+
+    def pull( session, kind : str, cursor : int, apply ) -> int:
+        while True:
+            events = models.fetch_events(session, kind, cursor, limit=args.batch_size)
+            for event in events:
+                apply(event)
+                cursor = event.seq
+            if len(events) < args.batch_size:
+                return cursor
+
+    def apply_task(event):
+        statuses[event.task_name] = event.new_status
+
+    def apply_job(event):
+        summary = summaries.setdefault(event.task_name, {status.value:0 for status in job_status})
+        if event.old_status:
+            summary[event.old_status] -= event.count
+        summary[event.new_status] += event.count
+
+    def render() -> Table:
+        table = Table(title=f"{args.db_file}", caption=f"updated at {datetime.now().strftime('%H:%M:%S')}")
+        table.add_column("taskname")
+        [table.add_column(status.value, justify="right") for status in job_status]
+        table.add_column("status")
+        for name, status in statuses.items():
+            summary = summaries.get(name, {})
+            table.add_row( name, *[str(summary.get(value.value, 0)) for value in job_status], status )
+        return table
+
+    # NOTE: with the task file, the status boards of the running tasks are reconciled periodically
+    boards = []
+    if args.task_file:
+        ctx = get_context( clear=True )
+        load( args.task_file, ctx )
+        boards = [ task for task in ctx.tasks.values() if task.status_board ]
+    reconciled = 0
+
+    with Live(render(), auto_refresh=False) as live:
+        while True:
+            if boards and time.time() - reconciled >= args.reconcile_interval:
+                for task in boards:
+                    if statuses.get(task.name) == task_status.RUNNING.value:
+                        task.reconcile_board()
+                reconciled = time.time()
+            with db_service() as session:
+                task_cursor = pull(session, "task", task_cursor, apply_task)
+            for key, name in sources.items():
+                with db_service.job_session(name) as session:
+                    cursors[key] = pull(session, "job", cursors[key], apply_job)
+            live.update(render(), refresh=True)
+            if args.once or (not args.follow and all(status in FINAL_TASK_STATUS for status in statuses.values())):
+                break
+            time.sleep(args.interval)
+
+
+ARCHIVE_TASK_STATUS = [task_status.COMPLETED, task_status.FINALIZED, task_status.CANCELED]
+
+
+def compact(args):
+
+    setup_logs( name = "TaskCompact", level=args.message_level )
+    db_service = get_db_service( args.db_file, **db_options(args) )
+
+    with db_service() as session:
+        tasks = session.query(models.Task.name, models.Task.status).all()
+
+    databases = {}
+    for name, status in tasks:
+        if args.tasks and name not in args.tasks:
+            continue
+        if status not in ARCHIVE_TASK_STATUS:
+            logger.info(f"Skipping task {name} with status {status.value}.")
+            continue
+        archived = db_service.task(name).archive()
+        logger.info(f"Archived {archived} jobs of task {name}.")
+        if archived:
+            databases.setdefault( db_service.job_db_file(name), name )
+
+    if not args.skip_vacuum:
+        for db_file, name in databases.items():
+            logger.info(f"Vacuuming database {db_file}.")
+            db_service.vacuum(name)
+
+
+def export(args):
+
+    setup_logs( name = "TaskExport", level=args.message_level )
+    db_service = get_db_service( args.db_file, **db_options(args) )
+    logger.info(f"Exporting jobs into {args.output}.")
+    exported = export_jobs( db_service, args.output, tasks=args.tasks, chunk_size=args.chunk_size )
+    logger.info(f"Exported {exported} jobs into {args.output}.")
+
+
+def db_parser():
 
     parser = argparse.ArgumentParser(description = '', add_help = False)
+    parser.add_argument('--db-file', action='store', dest='db_file', required=True,
+                        help="The database file input or a full SQLAlchemy URL")
+    parser.add_argument('--db-pool-size', action='store', dest='db_pool_size', required=False, type=int, default=DB_POOL_SIZE,
+                        help="The connection pool size used with server databases")
+    parser.add_argument('--db-max-overflow', action='store', dest='db_max_overflow', required=False, type=int, default=DB_MAX_OVERFLOW,
+                        help="The number of connections allowed beyond the pool size")
+    parser.add_argument('--db-pool-recycle', action='store', dest='db_pool_recycle', required=False, type=int, default=DB_POOL_RECYCLE,
+                        help="The time (seconds) after which a pooled connection is replaced")
+    parser.add_argument('--message-level', action='store', dest='message_level', required=False,
+                        help="The logging message level", default="INFO", choices=["DEBUG","INFO","WARNING","ERROR","CRITICAL"])
+    return parser
+
+
+def args_parser():
+
+    parser = argparse.ArgumentParser(description = '', add_help = False, parents=[db_parser()])
     parser.add_argument('-i','--index', action='store', dest='index', required = True,
                         help = "The task index", type=int)   
     parser.add_argument('--task-file', action='store', dest='task_file', required=True,
                         help="The task file input")
-    parser.add_argument('--db-file', action='store', dest='db_file', required=True,
-                        help="The database file input")
-    parser.add_argument('--message-level', action='store', dest='message_level', required=False,
-                        help="The logging message level", default="INFO", choices=["DEBUG","INFO","WARNING","ERROR","CRITICAL"])
+    return parser
+
+
+def watch_parser():
+
+    parser = argparse.ArgumentParser(description = '', add_help = False, parents=[db_parser()])
+    parser.add_argument('--interval', action='store', dest='interval', required=False, type=float, default=2,
+                        help="The time (seconds) between two journal reads")
+    parser.add_argument('--batch-size', action='store', dest='batch_size', required=False, type=int, default=10000,
+                        help="The maximum number of journal entries read per query")
+    parser.add_argument('--once', action='store_true', dest='once', required=False,
+                        help="Show the table once and exit")
+    parser.add_argument('--follow', action='store_true', dest='follow', required=False,
+                        help="Keep watching after all tasks reached a final status")
+    parser.add_argument('--task-file', action='store', dest='task_file', required=False, default=None,
+                        help="The task file of the flow. The status boards of the running tasks are then reconciled with the database")
+    parser.add_argument('--reconcile-interval', action='store', dest='reconcile_interval', required=False, type=float, default=60,
+                        help="The time (seconds) between two status board reconciliations")
+    return parser
+
+
+def compact_parser():
+
+    parser = argparse.ArgumentParser(description = '', add_help = False, parents=[db_parser()])
+    parser.add_argument('--task', action='append', dest='tasks', required=False, default=[],
+                        help="The name of the task to compact (may be repeated). Defaults to all finished tasks")
+    parser.add_argument('--skip-vacuum', action='store_true', dest='skip_vacuum', required=False,
+                        help="Do not vacuum the databases after archiving the jobs")
+    return parser
+
+
+def export_parser():
+
+    parser = argparse.ArgumentParser(description = '', add_help = False, parents=[db_parser()])
+    parser.add_argument('-o','--output', action='store', dest='output', required=True,
+                        help="The output file, Parquet or Arrow (.arrow, .feather or .ipc)")
+    parser.add_argument('--task', action='append', dest='tasks', required=False, default=[],
+                        help="The name of the task to export (may be repeated). Defaults to all tasks")
+    parser.add_argument('--chunk-size', action='store', dest='chunk_size', required=False, type=int, default=100000,
+                        help="The maximum number of jobs read and written per chunk")
     return parser
 
 
@@ -167,6 +361,9 @@ def run():
     mode = parser.add_subparsers(dest='mode')
     mode.add_parser( "init", parents=[args_parser()], help="",formatter_class=formatter_class)
     mode.add_parser( "close", parents=[args_parser()], help="",formatter_class=formatter_class)
+    mode.add_parser( "watch", parents=[watch_parser()], help="",formatter_class=formatter_class)
+    mode.add_parser( "compact", parents=[compact_parser()], help="",formatter_class=formatter_class)
+    mode.add_parser( "export", parents=[export_parser()], help="",formatter_class=formatter_class)
     
     if len(sys.argv)==1:
         print(parser.print_help())
@@ -177,6 +374,12 @@ def run():
         init(args)
     elif args.mode == "close":
         close(args)
+    elif args.mode == "watch":
+        watch(args)
+    elif args.mode == "compact":
+        compact(args)
+    elif args.mode == "export":
+        export(args)
        
 
 if __name__ == "__main__":
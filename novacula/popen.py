@@ -1,32 +1,77 @@
 __all__ = ["Popen"]
 
 
-import nvsmi
+import os
 import psutil
+import select
+import signal
 import traceback
 import threading
 import subprocess
 
 from loguru import logger
 from time   import sleep, time
+from typing import Union
+from novacula.accounting import get_accounting
+from novacula.gpu        import GPUSampler, get_gpu_sampler
+from novacula.series     import ResourceSeries
 
 
+MIN_INTERVAL       = 0.5  # seconds
+MAX_INTERVAL       = 30   # seconds
+WARMUP             = 60   # seconds sampled at the minimum interval
+BACKOFF            = 1.5  # interval growth between two stable samples
+STABLE_CPU_PERCENT = 10   # cpu percent points
+STABLE_MEMORY      = 0.05 # relative memory change
+GRACE_PERIOD       = 2    # seconds to detect a broken start
 
-def get_gpu_processes():
+
+
+def open_pidfd( pid : int ) -> Union[int, None]:
+    """
+    Return a file descriptor which becomes readable when the process exits (linux 5.3+).
+
+    Returns:
+        Union[int, None]: The pidfd or None if not supported by the platform.
+    """
     try:
-        return nvsmi.get_gpu_processes()
-    except:
-        return []
-      
+        return os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return None
+
+
 
 class Monitor(threading.Thread):
    
-    def __init__(self, process , max_retry : int=5):
+    def __init__(self, process , max_retry : int=5, accounting : str="auto", gpu_sampler : GPUSampler=None,
+                 min_interval : float=MIN_INTERVAL, max_interval : float=MAX_INTERVAL, warmup : float=WARMUP,
+                 proc_stat : psutil.Process=None, shared : bool=False):
+      """
+      Initializes the monitor of the job process.
+
+      Parameters:
+      ----------
+      proc_stat : psutil.Process, optional
+          The handle of the job process, taken by the caller right after the spawn. Otherwise
+          the handle is taken here (the process may be already gone).
+      shared : bool, optional
+          The job cgroup also holds other jobs of the allocation (see CgroupAccounting).
+      min_interval : float, optional
+          The sampling interval (seconds) used early in the job and after any change of usage.
+      max_interval : float, optional
+          The longest sampling interval, reached by long-running jobs with a stable usage.
+      warmup : float, optional
+          The time (seconds) sampled at the minimum interval after the job start.
+      """
       threading.Thread.__init__(self)
       self.__proc     = process
+      self.gpu_sampler = gpu_sampler or get_gpu_sampler()
+      self.min_interval = min_interval
+      self.max_interval = max_interval
+      self.warmup       = warmup
       retry=0
-      self.proc_stat=None
-      while retry<max_retry:
+      self.proc_stat=proc_stat
+      while self.proc_stat is None and retry<max_retry:
         try:
           self.proc_stat = psutil.Process(process.pid)
           break
@@ -35,6 +80,7 @@ class Monitor(threading.Thread):
            self.proc_stat=None
            retry+=1
 
+      self.accounting = get_accounting(self.proc_stat, accounting, shared=shared) if self.proc_stat else None
       self.__lock     = threading.Lock()
       self.__cpu_percent_avg     = 0
       self.__cpu_percent_peak    = 0
@@ -43,74 +89,149 @@ class Monitor(threading.Thread):
       self.__sys_memory_mb_avg   = 0
       self.__sys_memory_mb_peak  = 0
       self.__exec_time           = 0
+      self.__cpu_time            = 0
+      self.__io_read_mb          = 0
+      self.__io_write_mb         = 0
+      self.__sampled_time        = 0 # time covered by the averages
+      self.__last                = None
+      self.__pidfd               = None
+      self.num_samples           = 0
+      # NOTE: fixed-size buffer, the memory used by the monitor does not grow with the job runtime
+      self.series                = ResourceSeries()
  
 
     def run(self):
         self.start_time = time()
-        loop_num = 1
-        self.update(loop_num)
-        def is_alive(proc) -> bool:
-          return (True if (proc and proc.poll() is None) else False) if type(proc) == subprocess.Popen else proc.is_alive()
+        interval = self.min_interval
         # NOTE: only start the monitoring if we are able to get the process
-        if self.__proc:
-          while is_alive(self.__proc):
-              self.__lock.acquire()
-              self.update(loop_num)
-              sleep(1)
-              self.__lock.release()
+        if self.__proc and self.accounting:
+          self.__pidfd = open_pidfd(self.proc_stat.pid)
+          while True:
+              changed = self.update()
+              if self.wait(interval):
+                  break
+              # NOTE: back off while the usage is stable, sample fast again on any change
+              if changed or (time() - self.start_time) < self.warmup:
+                  interval = self.min_interval
+              else:
+                  interval = min( interval * BACKOFF, self.max_interval )
+          if self.__pidfd is not None:
+            os.close(self.__pidfd)
+          # NOTE: the cumulative counters (cpu time, io and cgroup memory peak) include the children finished after the last sample
+          self.update(final=True)
+          self.accounting.close()
         else:
            logger.warning("the constructor not be able to get the process from the reference pid. We will not be able to monitor it.")
-        self.__exec_time = time() - self.start_time
-        
+        with self.__lock:
+          self.__exec_time = time() - self.start_time
 
-    def update(self, loop_num):
 
-        def get_average(curr_avg, new_sample, num) -> float:
-            return (curr_avg * (num-1) + new_sample) / num
+    def process_alive(self) -> bool:
+        proc = self.__proc
+        return (True if (proc and proc.poll() is None) else False) if type(proc) == subprocess.Popen else proc.is_alive()
 
+
+    def wait(self, timeout : float) -> bool:
+        """
+        Wait for the end of the process up to the timeout, returning True if it finished.
+        """
+        if self.__pidfd is not None:
+          # NOTE: the pidfd becomes readable when the process exits, no polling in between
+          select.select([self.__pidfd], [], [], timeout)
+        else:
+          end = time() + timeout
+          while self.process_alive() and time() < end:
+            sleep( min(self.min_interval, max(end - time(), 0)) )
+        return not self.process_alive()
+        
+
+    def update(self, final : bool=False) -> bool:
+        """
+        Take one sample of the job and publish it, returning True if the usage changed
+        since the previous sample.
+        """
         try:
-          children = self.proc_stat.children(recursive=True)
-          # NOTE: if not children, use the parent for measurements...
-          if len(children)==0:
-            children=[self.proc_stat]
-          else:
-            children=[psutil.Process(child.pid) for child in children]
-
-          gpu_children = get_gpu_processes()
-          sys_used_memory_mb = 0; cpu_percent = 0; gpu_used_memory_mb = 0
-
-          for child in children:
-            sys_used_memory_mb += child.memory_info().rss/1024**2
-            cpu_percent += child.cpu_percent()
-            for gpu_child in gpu_children:
-              gpu_used_memory_mb += (gpu_child.used_memory/1024**2) if gpu_child.pid==child.pid else 0
-
-            self.__cpu_percent_avg     = get_average( self.__cpu_percent_avg   , cpu_percent       , loop_num)
-            self.__sys_memory_mb_avg   = get_average( self.__sys_memory_mb_avg , sys_used_memory_mb, loop_num)
-            self.__gpu_memory_mb_avg   = get_average( self.__gpu_memory_mb_avg , gpu_used_memory_mb, loop_num)
-            self.__cpu_percent_peak    = cpu_percent if cpu_percent > self.__cpu_percent_peak else self.__cpu_percent_peak
-            self.__sys_memory_mb_peak  = sys_used_memory_mb if sys_used_memory_mb > self.__sys_memory_mb_peak else self.__sys_memory_mb_peak
-            self.__gpu_memory_mb_peak  = gpu_used_memory_mb if gpu_used_memory_mb > self.__gpu_memory_mb_peak else self.__gpu_memory_mb_peak
-            self.__exec_time           = time() - self.start_time
+          sample = self.accounting.sample()
+          # NOTE: exact peak kept by the cgroup, otherwise the highest sampled usage
+          sys_memory_mb_peak = sample["sys_memory_mb_peak"] or sample["sys_memory_mb"]
+          if final:
+            with self.__lock:
+              self.__publish_counters(sample, sys_memory_mb_peak)
+            return False
+
+          pids = set(self.accounting.pids())
+          now  = time()
+          cpu_percent        = sample["cpu_percent"]
+          sys_used_memory_mb = sample["sys_memory_mb"]
+          gpu_used_memory_mb = sum( memory_mb for pid, memory_mb in self.gpu_sampler.processes().items() if pid in pids )
+          # NOTE: time-weighted averages, since the samples are not evenly spaced
+          elapsed = now - self.__last[0] if self.__last else 0
+          changed = self.__changed(cpu_percent, sys_used_memory_mb, gpu_used_memory_mb)
+
+          # NOTE: the lock is held only while publishing the sample
+          with self.__lock:
+            self.__publish_counters(sample, sys_memory_mb_peak)
+            total = self.__sampled_time + elapsed
+            if total > 0:
+              self.__cpu_percent_avg   = (self.__cpu_percent_avg   * self.__sampled_time + cpu_percent        * elapsed) / total
+              self.__sys_memory_mb_avg = (self.__sys_memory_mb_avg * self.__sampled_time + sys_used_memory_mb * elapsed) / total
+              self.__gpu_memory_mb_avg = (self.__gpu_memory_mb_avg * self.__sampled_time + gpu_used_memory_mb * elapsed) / total
+            else:
+              self.__sys_memory_mb_avg = sys_used_memory_mb
+              self.__gpu_memory_mb_avg = gpu_used_memory_mb
+            self.__sampled_time      = total
+            self.__cpu_percent_peak    = max( self.__cpu_percent_peak  , cpu_percent        )
+            self.__gpu_memory_mb_peak  = max( self.__gpu_memory_mb_peak, gpu_used_memory_mb )
+            self.__exec_time           = now - self.start_time
+            self.series.append( self.__exec_time, {
+                "cpu_percent"   : cpu_percent,
+                "sys_memory_mb" : sys_used_memory_mb,
+                "gpu_memory_mb" : gpu_used_memory_mb,
+            })
+            self.num_samples += 1
+          self.__last = (now, cpu_percent, sys_used_memory_mb, gpu_used_memory_mb)
+          return changed
         except:
           #traceback.print_exc()
           logger.debug("proc stat not available anymore.")
+          return False
+
+
+    def __publish_counters(self, sample, sys_memory_mb_peak):
+        self.__sys_memory_mb_peak  = max( self.__sys_memory_mb_peak, sys_memory_mb_peak    )
+        self.__cpu_time            = max( self.__cpu_time          , sample["cpu_time"]    )
+        self.__io_read_mb          = max( self.__io_read_mb        , sample["io_read_mb"]  )
+        self.__io_write_mb         = max( self.__io_write_mb       , sample["io_write_mb"] )
+
+
+    def __changed(self, cpu_percent, sys_memory_mb, gpu_memory_mb) -> bool:
+        if not self.__last:
+          return True
+        _, last_cpu_percent, last_sys_memory_mb, last_gpu_memory_mb = self.__last
+        # NOTE: cpu percent in absolute points, memory relative to the previous sample
+        return ( abs(cpu_percent - last_cpu_percent) > STABLE_CPU_PERCENT or
+                 abs(sys_memory_mb - last_sys_memory_mb) > STABLE_MEMORY * max(last_sys_memory_mb, 1) or
+                 abs(gpu_memory_mb - last_gpu_memory_mb) > STABLE_MEMORY * max(last_gpu_memory_mb, 1) )
 
 
     def __call__(self):
-        # NOTE: using lock to avoid access this region at same writting time in the monitor loop...
-        self.__lock.acquire()
-        metrics = {
-            "exec_time"           : self.__exec_time            ,     
-            "cpu_percent_avg"     : self.__cpu_percent_avg      ,
-            "cpu_percent_peak"    : self.__cpu_percent_peak     ,
-            "sys_memory_mb_avg"   : self.__sys_memory_mb_avg    ,
-            "sys_memory_mb_peak"  : self.__sys_memory_mb_peak   ,
-            "gpu_memory_mb_avg"   : self.__gpu_memory_mb_avg    ,
-            "gpu_memory_mb_peak"  : self.__gpu_memory_mb_peak   ,
-        }
-        self.__lock.release()
-        return metrics
+        with self.__lock:
+          return {
+              "exec_time"           : self.__exec_time            ,     
+              "cpu_percent_avg"     : self.__cpu_percent_avg      ,
+              "cpu_percent_peak"    : self.__cpu_percent_peak     ,
+              "sys_memory_mb_avg"   : self.__sys_memory_mb_avg    ,
+              "sys_memory_mb_peak"  : self.__sys_memory_mb_peak   ,
+              "gpu_memory_mb_avg"   : self.__gpu_memory_mb_avg    ,
+              "gpu_memory_mb_peak"  : self.__gpu_memory_mb_peak   ,
+              "cpu_time"            : self.__cpu_time             ,
+              "io_read_mb"          : self.__io_read_mb           ,
+              "io_write_mb"         : self.__io_write_mb          ,
+          }
+
+    def encode_series(self) -> bytes:
+        with self.__lock:
+            return self.series.to_bytes()
 
 
 class Popen:
@@ -118,16 +239,36 @@ class Popen:
   def __init__(self, 
                command       : str,
                envs          : dict={},
+               accounting    : str="auto",
+               gpu_sampler   : GPUSampler=None,
+               grace_period  : float=GRACE_PERIOD,
+               shared        : bool=False,
                ):
-
-    self.command     = "sleep 2\n"+command
+    """
+    Initializes the job process.
+
+    Parameters:
+    ----------
+    grace_period : float, optional
+        The early failure probe (seconds). `run_async` returns as soon as the process
+        exits or survives this window, the command itself is started without delay.
+    shared : bool, optional
+        The job cgroup also holds other jobs of the allocation (bundles and pilots).
+    """
+    self.command     = command
+    self.grace_period= grace_period
     self.__pending   = True
     self.__broken    = False
     self.__killed    = False
     self.env         = envs
+    self.accounting  = accounting
+    self.shared      = shared
+    # NOTE: no gpu sampling when the job does not see any device
+    self.gpu_sampler = gpu_sampler or get_gpu_sampler(visible_devices=envs.get("CUDA_VISIBLE_DEVICES", os.environ.get("CUDA_VISIBLE_DEVICES")))
     self.__proc      = None
     self.__proc_stat = None
     self.__mon_thread= None
+    self.__pidfd     = None
  
 
   def run_async(self, verbose : bool=False):
@@ -135,14 +276,23 @@ class Popen:
     try:
       self.__killed=False
       self.__broken=False
-      self.__proc = subprocess.Popen(self.command, env=self.env, shell=True)
-      self.__mon_thread = Monitor(self.__proc)
-      self.__mon_thread.start()
-      self.__proc_stat = psutil.Process(self.__proc.pid)
+      # NOTE: own process group, so the job can be killed as a whole
+      self.__proc = subprocess.Popen(self.command, env=self.env, shell=True, start_new_session=True)
       self.__pending=False
+      self.__pidfd = open_pidfd(self.__proc.pid)
+      # NOTE: the handle is taken before the monitor starts, since the monitor may reap a short command
+      # (the process stays a zombie until then, so the handle is available even if it already exited)
+      try:
+        self.__proc_stat = psutil.Process(self.__proc.pid)
+      except psutil.NoSuchProcess:
+        self.__proc_stat = None
+      self.__mon_thread = Monitor(self.__proc, accounting=self.accounting, gpu_sampler=self.gpu_sampler, proc_stat=self.__proc_stat, shared=self.shared)
+      self.__mon_thread.start()
+      # NOTE: a process which fails within the grace window is considered broken (e.g. bad command or image)
+      self.wait(timeout=self.grace_period)
       broken = self.status() == "failed"
       self.__broken = broken
-      return not broken # Lets considering the first seconds as broken
+      return not broken
 
     except Exception as e:
       traceback.print_exc()
@@ -170,13 +320,48 @@ class Popen:
             "sys_memory_mb_peak"  : 0 ,
             "gpu_memory_mb_avg"   : 0 ,
             "gpu_memory_mb_peak"  : 0 ,
+            "cpu_time"            : 0 ,
+            "io_read_mb"          : 0 ,
+            "io_write_mb"         : 0 ,
         }
          return metrics
+
+
+  def series(self) -> Union[bytes, None]:
+      """
+      Return the resource time series of the job, encoded by ResourceSeries.to_bytes().
+      """
+      return self.__mon_thread.encode_series() if self.__mon_thread else None
    
    
   def join(self):
-    while self.is_alive():
-      sleep(5)
+    self.wait()
+
+
+  def wait(self, timeout : float=None) -> bool:
+    """
+    Wait for the end of the process, returning True if it finished within the timeout.
+
+    Parameters:
+        timeout (float, optional): The maximum time (seconds) to wait. Defaults to no limit.
+    """
+    if not self.__proc:
+      return True
+    if self.__pidfd is not None:
+      # NOTE: the pidfd becomes readable when the process exits, no polling in between
+      readable, _, _ = select.select([self.__pidfd], [], [], timeout)
+      if not readable:
+        return False
+      os.close(self.__pidfd)
+      self.__pidfd = None
+    try:
+      self.__proc.wait(timeout)
+    except subprocess.TimeoutExpired:
+      return False
+    # NOTE: the monitor publishes the final counters right after the process exit
+    if self.__mon_thread:
+      self.__mon_thread.join()
+    return True
 
 
   def is_alive(self):
@@ -185,12 +370,24 @@ class Popen:
 
   def kill(self):
     if self.is_alive() and self.__proc:
-      children = self.__proc_stat.children(recursive=True)
+      # NOTE: the job may exit (and be reaped by the monitor) right after the kill request
+      try:
+        children = self.__proc_stat.children(recursive=True) if self.__proc_stat else []
+      except psutil.NoSuchProcess:
+        children = []
+      # NOTE: the process group first, it also reaches the processes spawned after the children lookup
+      try:
+        os.killpg(self.__proc.pid, signal.SIGKILL)
+      except ProcessLookupError:
+        pass
       for child in children:
-        p=psutil.Process(child.pid)
-        p.kill()
+        try:
+          child.kill()
+        except psutil.NoSuchProcess:
+          pass
       self.__proc.kill()
       self.__killed=True
+      self.wait()
     else:
       self.__killed=True
 
@@ -0,0 +1,104 @@
+__all__ = [
+    "retry_on_lock",
+    "get_lock_stats",
+    "reset_lock_stats",
+]
+
+import sqlite3
+import random
+import threading
+
+from time      import sleep, time
+from functools import wraps
+from typing    import Dict
+
+
+
+class LockStats:
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.retries   = 0 # number of retries caused by a locked database
+        self.failures  = 0 # number of calls which gave up after all retries
+        self.wait_time = 0 # total time (seconds) spent waiting for the lock
+
+    def add(self, wait_time : float=0, failed : bool=False):
+        with self.__lock:
+            self.retries   += 0 if failed else 1
+            self.failures  += 1 if failed else 0
+            self.wait_time += wait_time
+
+    def __call__(self) -> Dict[str, float]:
+        with self.__lock:
+            return {
+                "retries"   : self.retries,
+                "failures"  : self.failures,
+                "wait_time" : self.wait_time,
+            }
+
+
+__lock_stats = LockStats()
+
+
+def get_lock_stats() -> Dict[str, float]:
+    """
+    Return the lock-wait counters of the current process.
+
+    Returns:
+        Dict[str, float]: The number of retries, the number of calls which gave up and
+        the total time (seconds) spent waiting for a locked database.
+    """
+    return __lock_stats()
+
+
+def reset_lock_stats():
+    __lock_stats.reset()
+
+
+def is_lock_error( e : Exception ) -> bool:
+    """
+    Check if the exception is a transient SQLite lock error ("database is locked/busy").
+    SQLAlchemy errors are unwrapped through the `orig` attribute.
+    """
+    e = getattr(e, "orig", None) or e
+    if not isinstance(e, sqlite3.OperationalError):
+        return False
+    message = str(e).lower()
+    return ("locked" in message) or ("busy" in message)
+
+
+def retry_on_lock( method=None, max_retry : int=10, base_delay : float=0.05, max_delay : float=5.0 ):
+    """
+    Decorator that retries a database call when SQLite reports a transient lock error.
+
+    The delay between attempts follows an exponential backoff with full jitter, so
+    thousands of concurrent writers do not retry in lockstep. Every wait is accounted
+    into the lock-wait counters returned by `get_lock_stats`.
+
+    Parameters:
+        max_retry (int): The maximum number of retries before raising the error.
+        base_delay (float): The backoff base delay in seconds.
+        max_delay (float): The maximum delay between two attempts in seconds.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            retry = 0
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if not is_lock_error(e):
+                        raise e
+                    if retry >= max_retry:
+                        __lock_stats.add(failed=True)
+                        raise e
+                    start = time()
+                    sleep( random.uniform(0, min(max_delay, base_delay * 2**retry)) )
+                    __lock_stats.add(wait_time=time()-start)
+                    retry += 1
+        return wrapper
+    return decorator(method) if method else decorator
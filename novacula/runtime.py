@@ -0,0 +1,228 @@
+"""
+This module implements the execution runtimes used by the job runner to build the
+command of each job.
+
+Runtimes:
+- `Runtime` (native): runs the job entrypoint directly on the node, with the environment
+  of the runner (e.g. the flow virtualenv activated by the sbatch script).
+- `SingularityRuntime`: runs the entrypoint inside the task image. In exec mode, each
+  job starts its own container (`singularity exec ... image bash entrypoint`). In
+  instance mode, one persistent container instance is started per image the first
+  time a job needs it, each job joins it (`singularity exec instance://name ...`),
+  so the container setup (namespaces, overlay and tmpfs) is paid once per runner.
+  The instances are stopped by `stop()` when the runner exits (the runtime is a context
+  manager, so they are stopped on errors as well). The apptainer runtime
+  is the same runtime with the apptainer binary.
+- `TemplateRuntime`: a generic command template with the {entrypoint}, {image} and
+  {binds} placeholders (e.g. "podman run --rm -v /data:/data {image} bash {entrypoint}").
+
+The container binary is configurable (e.g. a fake binary used to exercise the instance
+mode on machines without singularity).
+
+The startup latency of a runtime is the time between the launch of the job command and
+the first line of the entrypoint. The entrypoint writes the bash clock ($EPOCHREALTIME)
+into a marker file of the workarea (see `startup_marker`), read back by the runner once
+the job finished (see `startup_time`).
+"""
+
+__all__ = [
+    "Runtime",
+    "SingularityRuntime",
+    "TemplateRuntime",
+    "RUNTIMES",
+    "get_runtime",
+    "startup_marker",
+    "startup_time",
+]
+
+import os
+import re
+import shlex
+import threading
+import subprocess
+
+from typing import Dict, Tuple, Union
+from loguru import logger
+
+
+RUNTIMES       = ["native", "singularity", "apptainer"]
+STARTUP_MARKER = ".novacula_started"
+PLACEHOLDER    = re.compile(r"\{(entrypoint|image|binds)\}")
+
+
+class Runtime:
+
+    name = "native"
+
+    def command(self, entrypoint : str, image : str=None, binds : Dict[str, str]={}) -> str:
+        """
+        Return the shell command running the job entrypoint.
+
+        Parameters:
+            entrypoint (str): The job script.
+            image (str, optional): The container image of the task.
+            binds (Dict[str, str], optional): The host paths mounted into the container.
+        """
+        return f"bash {entrypoint}"
+
+    def environ(self, envs : Dict[str, str]) -> Dict[str, str]:
+        """
+        Return the environment of the job command given the job variables. The native
+        runtime keeps the runner environment (PATH, virtualenv, Slurm variables).
+        """
+        return {**os.environ, **envs}
+
+    def stop(self):
+        """
+        Release the resources kept between jobs.
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        # NOTE: also on errors, so no container instance outlives the runner
+        self.stop()
+
+
+
+class SingularityRuntime(Runtime):
+
+    name = "singularity"
+
+    def __init__(self, binary : str="singularity", instance : bool=False, options : str="--nv --writable-tmpfs"):
+        """
+        Initializes the singularity runtime.
+
+        Parameters:
+        ----------
+        binary : str, optional
+            The container binary (singularity or apptainer).
+        instance : bool, optional
+            Run the jobs inside one persistent instance per image. Defaults to False.
+        options : str, optional
+            The container options used to exec the job or to start the instance.
+        """
+        self.binary     = binary
+        self.instance   = instance
+        self.options    = options
+        self.__lock     = threading.Lock()
+        self.__instances: Dict[Tuple[str, str], str] = {}
+        self.__broken   = set() # images whose instance could not be started
+
+    def __binds(self, binds : Dict[str, str]) -> str:
+        return " ".join( f"--bind {key}:{value}" for key, value in binds.items() )
+
+    def environ(self, envs : Dict[str, str]) -> Dict[str, str]:
+        # NOTE: the container only receives the job variables
+        return dict(envs)
+
+    def command(self, entrypoint : str, image : str=None, binds : Dict[str, str]={}) -> str:
+        bind = self.__binds(binds)
+        if self.instance:
+            name = self.__instance(image, bind)
+            if name:
+                return f"{self.binary} exec instance://{name} bash {entrypoint}"
+        return " ".join( part for part in [self.binary, "exec", self.options, bind, image, "bash", entrypoint] if part )
+
+    def __instance(self, image : str, bind : str) -> str:
+        # NOTE: the jobs link the image into their own workarea, the instance is shared by the real image
+        key = (os.path.realpath(image), bind)
+        with self.__lock:
+            if key in self.__instances:
+                return self.__instances[key]
+            if key in self.__broken:
+                return None
+            name    = f"novacula_{os.getpid()}_{len(self.__instances)}"
+            command = [self.binary, "instance", "start", *shlex.split(self.options), *shlex.split(bind), key[0], name]
+            logger.info(f"starting the container instance {name} for image {key[0]}.")
+            try:
+                subprocess.run(command, check=True, capture_output=True, text=True)
+            except (OSError, subprocess.CalledProcessError) as e:
+                # NOTE: the jobs of this image start their own container instead
+                logger.warning(f"not able to start the container instance for image {key[0]} ({getattr(e, 'stderr', None) or e}). using exec mode.")
+                self.__broken.add(key)
+                return None
+            self.__instances[key] = name
+            return name
+
+    def stop(self):
+        with self.__lock:
+            for name in self.__instances.values():
+                logger.info(f"stopping the container instance {name}.")
+                result = subprocess.run([self.binary, "instance", "stop", name], capture_output=True, text=True)
+                if result.returncode != 0:
+                    logger.warning(f"not able to stop the container instance {name}: {result.stderr.strip()}")
+            self.__instances.clear()
+
+
+
+class TemplateRuntime(Runtime):
+
+    name = "template"
+
+    def __init__(self, template : str):
+        """
+        Initializes a runtime from a command template.
+
+        Parameters:
+        ----------
+        template : str
+            The job command with the {entrypoint} placeholder and optionally {image} and
+            {binds} (the binds joined by commas, as host:container).
+        """
+        if "{entrypoint}" not in template:
+            raise ValueError(f"runtime template must contain the {{entrypoint}} placeholder, got {template!r}.")
+        self.template = template
+
+    def command(self, entrypoint : str, image : str=None, binds : Dict[str, str]={}) -> str:
+        bind = ",".join( f"{key}:{value}" for key, value in binds.items() )
+        # NOTE: only the named placeholders, any other brace belongs to the shell (e.g. ${HOME} or {a,b})
+        values = {"entrypoint":entrypoint, "image":image or "", "binds":bind}
+        return PLACEHOLDER.sub( lambda match : values[match.group(1)], self.template )
+
+
+
+def get_runtime( runtime : str, binary : str=None, instance : bool=False ) -> Runtime:
+    """
+    Return the execution runtime given its name or command template.
+
+    Parameters:
+        runtime (str): native, singularity, apptainer or a command template with the {entrypoint} placeholder.
+        binary (str, optional): Override the container binary of the singularity and apptainer runtimes.
+        instance (bool, optional): Run the jobs inside one persistent container instance per image.
+
+    Raises:
+        ValueError: If the runtime is unknown.
+    """
+    if runtime == "native":
+        return Runtime()
+    if runtime in ("singularity", "apptainer"):
+        return SingularityRuntime( binary=binary or runtime, instance=instance )
+    if "{" in runtime:
+        return TemplateRuntime( runtime )
+    raise ValueError(f"runtime {runtime} is not supported. use {', '.join(RUNTIMES)} or a command template with the {{entrypoint}} placeholder.")
+
+
+def startup_marker( workarea : str ) -> str:
+    """
+    Return the first line of the job entrypoint, which records when the entrypoint started.
+    """
+    # NOTE: a bash builtin, so it works inside any image. the workarea may not be visible from a template runtime
+    return f"printf '%s' \"$EPOCHREALTIME\" > {workarea}/{STARTUP_MARKER} 2>/dev/null"
+
+
+def startup_time( workarea : str, launched : float ) -> Union[float, None]:
+    """
+    Return the startup latency (seconds) of the job command launched at the given time,
+    or None if the entrypoint did not record its start (e.g. bash older than 5).
+    """
+    path = f"{workarea}/{STARTUP_MARKER}"
+    try:
+        with open(path) as f:
+            started = float(f.read().strip().replace(",", "."))
+        os.remove(path)
+    except (OSError, ValueError):
+        return None
+    return max( started - launched, 0.0 )
@@ -1,15 +1,74 @@
 __all__ = [
-    "sbatch"
+    "sbatch",
+    "array_ranges",
+    "split_array",
+    "scancel",
 ]
 
 import subprocess
 import shlex
 
-from typing import Union, Dict
+from typing import Union, Dict, List, Tuple, Iterable
 from loguru import logger
 
 
 
+def array_ranges( indices : Iterable[int], throttle : int=0 ) -> str:
+    """
+    Build the value of the sbatch --array option, with the consecutive indices compressed
+    into ranges (e.g. 0-9999,10005).
+
+    Parameters:
+        indices (Iterable[int]): The array indices.
+        throttle (int, optional): The maximum number of elements running at the same time (%N), zero for no limit.
+    """
+    ranges = []
+    for index in sorted(set(indices)):
+        if ranges and index == ranges[-1][1] + 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    value = ",".join( f"{first}" if first == last else f"{first}-{last}" for first, last in ranges )
+    return f"{value}%{throttle}" if throttle else value
+
+
+def split_array( indices : Iterable[int], max_array_size : int ) -> List[Tuple[int, List[int]]]:
+    """
+    Split the array indices into arrays accepted by Slurm (indices lower than MaxArraySize).
+
+    Returns:
+        List[Tuple[int, List[int]]]: One (base, indices) pair per array, where the element
+                                     `index` of the array stands for the index `base + index`.
+    """
+    arrays = {}
+    for index in sorted(set(indices)):
+        base = (index // max_array_size) * max_array_size
+        arrays.setdefault(base, []).append(index - base)
+    return list(arrays.items())
+
+
+def scancel( job_ids : Iterable[int] ) -> bool:
+    """
+    Cancel the given Slurm jobs (whole arrays when given the array job ids).
+
+    Returns:
+        bool: True if scancel accepted the request.
+    """
+    job_ids = [ str(job_id) for job_id in job_ids ]
+    if not job_ids:
+        return True
+    try:
+        subprocess.run( ["scancel", *job_ids], capture_output=True, text=True, check=True )
+        return True
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Error cancelling jobs {','.join(job_ids)} (Exit Code {e.returncode}): {e.stderr.strip()}")
+        return False
+    except FileNotFoundError:
+        logger.error("Error: 'scancel' command not found. Is Slurm installed and in your PATH?")
+        return False
+
+
+
 
 class sbatch:
     def __init__(self, 
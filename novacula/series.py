@@ -0,0 +1,161 @@
+"""
+This module implements the bounded resource time series recorded by the job monitor.
+
+The samples are kept in fixed-size arrays (one per field), so the memory used by a
+monitored job does not depend on its runtime. When the arrays are full, adjacent
+samples are merged in pairs (the mean for the CPU usage, the maximum for the memory
+fields, so spikes are kept) and the number of raw samples merged into each new point
+is doubled. The series always covers the whole job, with a resolution that decreases
+as the job runs longer.
+
+Binary layout (little-endian), used to store the series into the database:
+- header : magic (4s), version (B), number of fields (B), size (I), stride (I)
+- names  : the field names joined by commas, with a length prefix (H)
+- time   : `size` float64, seconds since the job start
+- fields : `size` float32 per field, in the order of the names
+"""
+
+__all__ = [
+    "ResourceSeries",
+    "SERIES_FIELDS",
+    "decode_series",
+]
+
+import struct
+
+from array  import array
+from typing import Dict, List
+
+
+SERIES_FIELDS   = {"cpu_percent":"mean", "sys_memory_mb":"max", "gpu_memory_mb":"max"}
+SERIES_CAPACITY = 512
+SERIES_MAGIC    = b"NVTS"
+SERIES_VERSION  = 1
+HEADER          = struct.Struct("<4sBBII")
+NAMES           = struct.Struct("<H")
+
+
+class ResourceSeries:
+
+    def __init__(self, capacity : int=SERIES_CAPACITY, fields : Dict[str, str]=SERIES_FIELDS):
+        """
+        Initializes an empty series.
+
+        Parameters:
+        ----------
+        capacity : int, optional
+            The maximum number of points kept (must be even). Defaults to 512.
+        fields : Dict[str, str], optional
+            The recorded fields and how two points are merged ("mean" or "max").
+        """
+        if capacity < 2 or capacity % 2:
+            raise ValueError(f"series capacity must be an even number greater than zero, got {capacity}.")
+        self.capacity  = capacity
+        self.fields    = dict(fields)
+        self.stride    = 1 # raw samples per point
+        self.__size    = 0
+        self.__time    = array('d', bytes(8 * capacity))
+        self.__values  = { name : array('d', bytes(8 * capacity)) for name in self.fields }
+        self.__pending = None
+        self.__count   = 0
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def append(self, time : float, sample : Dict[str, float]):
+        """
+        Record one raw sample taken at the given time (seconds since the job start).
+        """
+        if self.__count == 0:
+            self.__pending = { "time" : time, **{ name : sample.get(name, 0) for name in self.fields } }
+        else:
+            for name, merge in self.fields.items():
+                value = sample.get(name, 0)
+                self.__pending[name] = max(self.__pending[name], value) if merge == "max" else self.__pending[name] + value
+        self.__count += 1
+        if self.__count == self.stride:
+            self.__push()
+
+    def __push(self):
+        if self.__size == self.capacity:
+            self.__downsample()
+        index = self.__size
+        self.__time[index] = self.__pending["time"]
+        for name, merge in self.fields.items():
+            value = self.__pending[name]
+            self.__values[name][index] = value / self.__count if merge == "mean" else value
+        self.__size   += 1
+        self.__count   = 0
+        self.__pending = None
+
+    def __downsample(self):
+        half = self.capacity // 2
+        for index in range(half):
+            self.__time[index] = self.__time[2*index]
+        for name, merge in self.fields.items():
+            values = self.__values[name]
+            for index in range(half):
+                first, second = values[2*index], values[2*index+1]
+                values[index] = max(first, second) if merge == "max" else (first + second) / 2
+        self.__size  = half
+        self.stride *= 2
+
+    def __points(self):
+        # NOTE: the point still being accumulated is included (merged from fewer raw samples than
+        # the stride), so the last samples and the final peak of the job are never left out
+        time   = self.__time[:self.__size]
+        values = { name : values[:self.__size] for name, values in self.__values.items() }
+        if self.__count:
+            time.append( self.__pending["time"] )
+            for name, merge in self.fields.items():
+                value = self.__pending[name]
+                values[name].append( value / self.__count if merge == "mean" else value )
+        return time, values
+
+    def columns(self) -> Dict[str, List[float]]:
+        """
+        Return the recorded points (time plus one list per field).
+        """
+        time, values = self.__points()
+        return {
+            "time" : time.tolist(),
+            **{ name : column.tolist() for name, column in values.items() },
+        }
+
+    def to_bytes(self) -> bytes:
+        """
+        Encode the recorded points into the compact binary layout.
+        """
+        time, values = self.__points()
+        names = ",".join(self.fields).encode()
+        data  = [
+            HEADER.pack(SERIES_MAGIC, SERIES_VERSION, len(self.fields), len(time), self.stride),
+            NAMES.pack(len(names)), names,
+            time.tobytes(),
+        ]
+        data.extend( array('f', column).tobytes() for column in values.values() )
+        return b"".join(data)
+
+
+
+def decode_series( data : bytes ) -> Dict[str, List[float]]:
+    """
+    Decode a series encoded by `ResourceSeries.to_bytes`.
+
+    Returns:
+        Dict[str, List[float]]: The time (seconds since the job start) plus one list per field.
+    """
+    magic, version, nfields, size, stride = HEADER.unpack_from(data, 0)
+    if magic != SERIES_MAGIC or version != SERIES_VERSION:
+        raise ValueError(f"unknown series format (magic {magic}, version {version}).")
+    offset   = HEADER.size
+    (length,)= NAMES.unpack_from(data, offset)
+    offset  += NAMES.size
+    names    = data[offset:offset+length].decode().split(",")
+    offset  += length
+    columns  = { "time" : array('d', data[offset:offset+8*size]).tolist() }
+    offset  += 8 * size
+    for name in names[:nfields]:
+        columns[name] = array('f', data[offset:offset+4*size]).tolist()
+        offset += 4 * size
+    return columns
@@ -0,0 +1,36 @@
+__all__ = [
+    "JobStatus",
+    "TaskStatus",
+    "job_status",
+    "job_metrics",
+    ]
+
+import enum 
+
+
+
+class JobStatus(enum.Enum):
+
+    ASSIGNED    = "assigned"
+    PENDING     = "pending"
+    RUNNING     = "running"
+    COMPLETED   = "completed"
+    FAILED      = "failed"
+    KILL        = "kill"
+    KILLED      = "killed"
+    
+job_status = [JobStatus.ASSIGNED, JobStatus.PENDING, JobStatus.RUNNING, JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.KILL, JobStatus.KILLED]
+
+# NOTE: resource metrics measured by the job runner (see Popen.metrics) and stored into the job table
+job_metrics = ["exec_time", "cpu_percent_avg", "cpu_percent_peak", "sys_memory_mb_avg", "sys_memory_mb_peak", "gpu_memory_mb_avg", "gpu_memory_mb_peak",
+               "cpu_time", "io_read_mb", "io_write_mb", "startup_time"]
+
+
+class TaskStatus(enum.Enum):
+
+    ASSIGNED       = "assigned"
+    RUNNING        = "running"
+    COMPLETED      = "completed"
+    FINALIZED      = "finalized"
+    FAILED         = "failed"
+    CANCELED       = "canceled"
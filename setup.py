@@ -34,6 +34,7 @@ setup(
         'console_scripts' : [
             'njob  = novacula.parsers.job:run',
             'ntask = novacula.parsers.task:run',
+            'nagent = novacula.parsers.agent:run',
         ]
     }
 )
\ No newline at end of file
@@ -0,0 +1,69 @@
+import os
+import glob
+import shutil
+import pytest
+import subprocess
+
+from sqlalchemy import insert
+
+from novacula.db import DBService, upgrade_db, models
+
+
+def create_task_db( path : str, task_name : str="task", njobs : int=100 ) -> str:
+    """
+    Create a database holding one task with `njobs` assigned jobs (filenames f<job_id>).
+    """
+    db_service = DBService(path, high_concurrency=True)
+    upgrade_db(db_service.engine())
+    with db_service() as session:
+        session.add( models.Task(task_id=0, name=task_name, status=models.TaskStatus.RUNNING) )
+        session.execute( insert(models.Job), [
+            { "job_id":job_id, "taskid":0, "task_name":task_name, "filename":f"f{job_id}", "status":models.JobStatus.ASSIGNED }
+            for job_id in range(njobs)
+        ])
+        models.add_to_counter(session, task_name, models.JobStatus.ASSIGNED, njobs)
+        session.commit()
+    db_service.engine().dispose()
+    return path
+
+
+def postgres_bindir():
+    """
+    Return the directory of the PostgreSQL server binaries (initdb and pg_ctl), or None.
+    """
+    if shutil.which("initdb") and shutil.which("pg_ctl"):
+        return os.path.dirname(shutil.which("initdb"))
+    if shutil.which("pg_config"):
+        bindir = subprocess.run(["pg_config", "--bindir"], capture_output=True, text=True).stdout.strip()
+        if os.path.exists(f"{bindir}/initdb"):
+            return bindir
+    # NOTE: the debian packages do not put the server binaries on the PATH
+    candidates = sorted( glob.glob("/usr/lib/postgresql/*/bin/initdb") )
+    return os.path.dirname(candidates[-1]) if candidates else None
+
+
+@pytest.fixture(scope="session")
+def postgres_url( tmp_path_factory ):
+    """
+    The URL of a throwaway PostgreSQL server, started from the local binaries for the test
+    session. NOVACULA_TEST_POSTGRES_URL points the tests to an existing server instead.
+    """
+    pytest.importorskip("psycopg2")
+    if os.environ.get("NOVACULA_TEST_POSTGRES_URL"):
+        yield os.environ["NOVACULA_TEST_POSTGRES_URL"]
+        return
+    bindir = postgres_bindir()
+    if not bindir:
+        pytest.skip("PostgreSQL server binaries (initdb, pg_ctl) not found")
+    if os.geteuid() == 0:
+        pytest.skip("the PostgreSQL server can not run as root")
+    base = tmp_path_factory.mktemp("postgres")
+    data = str(base / "data")
+    subprocess.run([f"{bindir}/initdb", "-D", data, "-A", "trust", "-U", "novacula", "--no-sync"], check=True, capture_output=True)
+    # NOTE: only a unix socket inside the temporary directory, no TCP port to collide with
+    options = f"-k {base} -c listen_addresses='' -c fsync=off"
+    subprocess.run([f"{bindir}/pg_ctl", "-D", data, "-o", options, "-l", str(base / "server.log"), "-w", "start"], check=True, capture_output=True)
+    try:
+        yield f"postgresql://novacula@/postgres?host={base}"
+    finally:
+        subprocess.run([f"{bindir}/pg_ctl", "-D", data, "-m", "immediate", "stop"], capture_output=True)
@@ -0,0 +1,22 @@
+from novacula.accounting import CgroupAccounting, MB
+
+
+def write_cgroup( path, usage_usec : int, rbytes : int, wbytes : int, current : int ):
+    (path / "cpu.stat").write_text(f"usage_usec {usage_usec}\nuser_usec {usage_usec}\n")
+    (path / "io.stat").write_text(f"8:0 rbytes={rbytes} wbytes={wbytes} rios=1 wios=1\n")
+    (path / "memory.current").write_text(f"{current}\n")
+
+
+def test_cgroup_counters_from_job_start( tmp_path ):
+    # NOTE: the runner and the previous jobs of the allocation already used this cgroup
+    write_cgroup( tmp_path, usage_usec=50_000_000, rbytes=100*MB, wbytes=10*MB, current=64*MB )
+    accounting = CgroupAccounting( str(tmp_path), shared=True )
+    write_cgroup( tmp_path, usage_usec=52_000_000, rbytes=103*MB, wbytes=11*MB, current=80*MB )
+    sample = accounting.sample()
+    assert sample["cpu_time"]      == 2
+    assert sample["io_read_mb"]    == 3
+    assert sample["io_write_mb"]   == 1
+    assert sample["sys_memory_mb"] == 80
+    # NOTE: the memory peak of a shared cgroup can not be reset here, the monitor keeps the sampled peak
+    assert sample["sys_memory_mb_peak"] is None
+    accounting.close()
@@ -0,0 +1,33 @@
+import sqlite3
+
+from conftest        import create_task_db
+from novacula.agent  import Agent
+from novacula.client import StatusClient
+
+
+def event( db_file, name, job_id=0, **kwargs ):
+    return {"event":name, "db_file":db_file, "task_name":"task", "job_id":job_id, "time":kwargs.pop("time", "t0"), **kwargs}
+
+
+def test_failed_flush_is_retried( tmp_path, monkeypatch ):
+    db_file = create_task_db( str(tmp_path / "agent.db"), njobs=2 )
+    agent   = Agent( path=str(tmp_path / "agent.sock") )
+    agent.receive( event(db_file, "start") )
+    agent.receive( event(db_file, "status", status="RUNNING") )
+    agent.receive( event(db_file, "status", job_id=1, status="PENDING") )
+
+    apply = StatusClient.apply
+    def broken( self, updates ):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(StatusClient, "apply", broken)
+    agent.flush()
+    monkeypatch.setattr(StatusClient, "apply", apply)
+
+    # NOTE: the job restarted and moved on while the database was not available
+    agent.receive( event(db_file, "start", time="t1") )
+    agent.flush()
+    with sqlite3.connect(db_file) as conn:
+        rows = dict( (job_id, (status, retry, start_time)) for job_id, status, retry, start_time in
+                     conn.execute("SELECT job_id, status, retry, start_time FROM job WHERE job_id < 2") )
+    assert rows[0] == ("RUNNING", 1, "t1") # two starts from the initial -1
+    assert rows[1][0] == "PENDING"
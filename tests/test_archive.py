@@ -0,0 +1,44 @@
+from conftest    import create_task_db
+from novacula.db import DBService, models
+from novacula.db.models import archive
+
+
+def test_next_job_id_after_compact( tmp_path ):
+    db_service = DBService( create_task_db( str(tmp_path / "archive.db"), njobs=10 ) )
+    with db_service() as session:
+        assert models.fetch_next_job_id(session, "task") == 10
+        models.archive_jobs(session, "task")
+        session.commit()
+        # NOTE: the archived ids are never reused, nor their input files materialized again
+        assert session.query(models.Job).count() == 0
+        assert models.fetch_next_job_id(session, "task") == 10
+        assert models.fetch_archived_filenames(session, "task") == { f"f{job_id}" for job_id in range(10) }
+        assert models.fetch_next_job_id(session, "other") == 0
+
+
+def test_journal_kept_after_compact( tmp_path ):
+    db_service = DBService( create_task_db( str(tmp_path / "journal.db"), njobs=2 ) )
+    with db_service() as session:
+        cursor, _ = models.fetch_counters(session)
+        models.record_event(session, "job", "task", models.JobStatus.ASSIGNED, models.JobStatus.COMPLETED, job_id=1)
+        session.commit()
+        models.archive_jobs(session, "task")
+        session.commit()
+        # NOTE: a reader behind the compaction still pulls the last transitions of the task
+        events = models.fetch_events(session, "job", cursor)
+        assert [ (event.job_id, event.new_status) for event in events ] == [(1, models.JobStatus.COMPLETED.value)]
+
+
+def test_archived_job_ids_by_status( tmp_path, monkeypatch ):
+    db_service = DBService( create_task_db( str(tmp_path / "status.db"), njobs=4 ) )
+    with db_service() as session:
+        session.query(models.Job).filter(models.Job.job_id >= 2).update({"status":models.JobStatus.COMPLETED})
+        models.archive_jobs(session, "task", chunk_size=2)
+        session.commit()
+    task = db_service.task("task")
+    assert task.fetch_job_ids(models.JobStatus.COMPLETED) == [2, 3]
+    # NOTE: only the chunk holding completed jobs is decoded, none for the assigned lookup
+    decoded = []
+    monkeypatch.setattr(archive, "_decode", lambda data : decoded.append(data) or [])
+    assert task.fetch_job_ids(models.JobStatus.FAILED) == []
+    assert task.fetch_job_ids(models.JobStatus.COMPLETED) == [] and len(decoded) == 1
@@ -0,0 +1,55 @@
+import socket
+
+from conftest        import create_task_db
+from novacula.board  import StatusBoard, BoardJob
+from novacula.agent  import AgentClient
+from novacula.client import StatusClient
+from novacula.status import JobStatus
+
+
+def test_reconcile_keeps_newer_runner_writes( tmp_path ):
+    board = StatusBoard( str(tmp_path / "status.board") )
+    board.resize(10)
+    before = board.load()
+    # NOTE: a runner moves job 3 to RUNNING after the snapshot, the database read below is older
+    board[3] = JobStatus.RUNNING
+    statuses = [ (job_id, JobStatus.ASSIGNED) for job_id in range(10) ]
+    statuses[3] = (3, JobStatus.PENDING)
+    statuses[5] = (5, JobStatus.COMPLETED)
+    assert board.reconcile(statuses, before) == 2
+    assert board[3] == JobStatus.RUNNING
+    assert board[5] == JobStatus.COMPLETED
+    assert board.histogram()[JobStatus.ASSIGNED.value] == 8
+
+
+def test_reconcile_grows_the_board( tmp_path ):
+    board = StatusBoard( str(tmp_path / "status.board") )
+    board.resize(2)
+    assert board.reconcile([ (0, JobStatus.FAILED), (1, JobStatus.ASSIGNED), (4, JobStatus.KILLED) ]) == 2
+    assert len(board) == 5
+    assert board.job_ids(JobStatus.ASSIGNED) == [1, 2, 3]
+    assert board.reconcile([ (0, JobStatus.FAILED), (4, JobStatus.KILLED) ]) == 0
+
+
+def test_board_follows_the_database( tmp_path ):
+    db_file = create_task_db( str(tmp_path / "board.db"), njobs=2 )
+    board   = StatusBoard( str(tmp_path / "status.board") )
+    board.resize(2)
+    # NOTE: a node agent receiving the events, never flushed here
+    agent   = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    agent.bind( str(tmp_path / "agent.sock") )
+    client  = StatusClient(db_file)
+    try:
+        job = BoardJob( AgentClient(client, str(tmp_path / "agent.sock")).job("task", 0), board )
+        job.update_status(JobStatus.RUNNING)
+        assert board[0] == JobStatus.ASSIGNED
+        assert job.fetch_status() == JobStatus.ASSIGNED
+        job.update_status(JobStatus.COMPLETED)
+        assert board[0] == JobStatus.COMPLETED
+        # NOTE: written directly when no agent is running
+        job = BoardJob( AgentClient(client, str(tmp_path / "none.sock")).job("task", 1), board )
+        job.update_status(JobStatus.RUNNING)
+        assert board[1] == JobStatus.RUNNING
+    finally:
+        client.close()
+        agent.close()
@@ -0,0 +1,46 @@
+import multiprocessing
+
+from conftest    import create_task_db
+from novacula    import StatusClient
+from novacula.db import DBService, models
+
+
+NJOBS     = 300
+PROCESSES = 8
+
+
+def claim_all( args ):
+    # NOTE: the job is started once claimed, as the pilots do, so a job claimed twice would have retry 1
+    db_file, orm = args
+    if orm:
+        db_service = DBService(db_file)
+        task       = db_service.task("task")
+        claim      = task.claim_job
+        start      = lambda job_id : db_service.job("task", job_id).start()
+    else:
+        client     = StatusClient(db_file)
+        claim      = lambda : client.claim("task")
+        start      = lambda job_id : client.job("task", job_id).start()
+    claimed = []
+    while (job_id := claim()) is not None:
+        start(job_id)
+        claimed.append(job_id)
+    return claimed
+
+
+def test_concurrent_claims_are_disjoint( tmp_path ):
+    db_file = create_task_db( str(tmp_path / "claim.db"), njobs=NJOBS )
+    # NOTE: half of the processes claim through the sqlite client, the other half through the ORM
+    with multiprocessing.get_context("fork").Pool(PROCESSES) as pool:
+        results = pool.map( claim_all, [ (db_file, index % 2 == 1) for index in range(PROCESSES) ] )
+
+    claimed = [ job_id for result in results for job_id in result ]
+    assert len(claimed) == len(set(claimed))
+    assert sorted(claimed) == list(range(NJOBS))
+
+    db_service = DBService(db_file)
+    with db_service() as session:
+        retries = [ retry for (retry,) in session.query(models.Job.retry) ]
+    assert max(retries) == 0
+    summary = db_service.task("task").fetch_summary()["summary"]
+    assert summary[models.JobStatus.PENDING.value] == NJOBS
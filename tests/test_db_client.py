@@ -0,0 +1,101 @@
+import pytest
+
+from sqlalchemy  import text
+from concurrent.futures import ThreadPoolExecutor
+from conftest    import create_task_db
+from novacula.db import DBService, get_db_service, get_db_url, upgrade_db, models
+from novacula.db import db_client
+
+
+def pragma( db_service : DBService, name : str ):
+    with db_service.engine().connect() as connection:
+        return connection.execute( text(f"PRAGMA {name}") ).scalar()
+
+
+def test_db_url():
+    assert get_db_url("/tmp/flow/local.db") == "sqlite:////tmp/flow/local.db"
+    assert get_db_url("postgresql://user@host/db") == "postgresql://user@host/db"
+
+
+def test_sqlite_pragmas( tmp_path ):
+    db_service = DBService( str(tmp_path / "wal.db"), high_concurrency=True, busy_timeout=12.5 )
+    assert pragma(db_service, "journal_mode") == "wal"
+    assert pragma(db_service, "busy_timeout") == 12500
+    assert pragma(db_service, "synchronous")  == 1 # NORMAL
+    # NOTE: the journaling mode is persistent, later connections (e.g. njob) keep it
+    assert pragma(DBService( str(tmp_path / "wal.db") ), "journal_mode") == "wal"
+
+
+def test_sqlite_default_journal( tmp_path ):
+    db_service = DBService( str(tmp_path / "default.db") )
+    assert pragma(db_service, "journal_mode") == "delete"
+    assert pragma(db_service, "busy_timeout") == 30000
+
+
+def test_sqlite_ignores_server_pool( tmp_path ):
+    # NOTE: the pool limits only apply to server databases, sqlite sessions are not capped
+    db_service = DBService( create_task_db( str(tmp_path / "pool.db"), njobs=3 ), pool_size=1, max_overflow=0 )
+    sessions   = [ db_service() for _ in range(3) ]
+    try:
+        assert [ session.query(models.Job).count() for session in sessions ] == [3, 3, 3]
+    finally:
+        [ session.close() for session in sessions ]
+
+
+def test_sharded_requires_sqlite():
+    with pytest.raises(ValueError):
+        DBService("postgresql://user@localhost/novacula", sharded=True)
+
+
+def test_postgres_pool( postgres_url ):
+    db_service = DBService(postgres_url, pool_size=2, max_overflow=1, pool_recycle=10)
+    pool       = db_service.engine().pool
+    assert pool.size() == 2
+    assert pool._max_overflow == 1
+    assert pool._recycle == 10
+    assert db_service.job_db_file("task") == postgres_url
+    # NOTE: the sessions above the pool size and overflow wait for a free connection
+    sessions = [ db_service() for _ in range(3) ]
+    try:
+        [ session.execute( text("SELECT 1") ) for session in sessions ]
+        assert pool.checkedout() == 3
+    finally:
+        [ session.close() for session in sessions ]
+    db_service.engine().dispose()
+
+
+def test_postgres_claim( postgres_url ):
+    db_service = DBService(postgres_url, pool_size=4, max_overflow=4)
+    upgrade_db(db_service.engine())
+    njobs = 40
+    with db_service() as session:
+        session.query(models.Job).filter_by(task_name="novacula_test").delete()
+        session.query(models.Task).filter_by(name="novacula_test").delete()
+        session.add( models.Task(task_id=0, name="novacula_test", status=models.TaskStatus.RUNNING) )
+        session.add_all([ models.Job(job_id=job_id, taskid=0, task_name="novacula_test", filename=f"f{job_id}", status=models.JobStatus.ASSIGNED)
+                          for job_id in range(njobs) ])
+        session.commit()
+    task = db_service.task("novacula_test")
+    # NOTE: concurrent runners, the compare-and-set on the status never hands a job out twice
+    def claim(_):
+        claimed = []
+        while (job_id := task.claim_job()) is not None:
+            claimed.append(job_id)
+        return claimed
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        claimed = sum( pool.map(claim, range(4)), [] )
+    assert sorted(claimed) == list(range(njobs))
+    db_service.engine().dispose()
+
+
+def test_db_service_arguments( tmp_path, monkeypatch ):
+    monkeypatch.setitem(vars(db_client), "__db_service", None)
+    db_service = get_db_service( str(tmp_path / "flow.db"), high_concurrency=True )
+    assert get_db_service() is db_service
+    assert get_db_service( str(tmp_path / "flow.db"), high_concurrency=True ) is db_service
+    # NOTE: the same database, not the same options or another database
+    with pytest.raises(ValueError):
+        get_db_service( str(tmp_path / "flow.db"), busy_timeout=1 )
+    with pytest.raises(ValueError):
+        get_db_service( str(tmp_path / "other.db") )
+    db_service.engine().dispose()
@@ -0,0 +1,64 @@
+import os
+import pytest
+import subprocess
+
+from time import sleep
+
+from novacula.popen  import Monitor, Popen
+from novacula.gpu    import GPUSampler, FakeSampler, NullSampler, get_gpu_sampler
+from novacula.series import decode_series
+
+
+def monitor( command, sampler ):
+    proc = subprocess.Popen(command)
+    mon  = Monitor(proc, accounting="psutil", gpu_sampler=sampler, min_interval=0.05)
+    return proc, mon
+
+
+def test_gpu_usage_of_the_job_pids():
+    sampler   = FakeSampler()
+    proc, mon = monitor(["sleep", "0.6"], sampler)
+    # NOTE: the runner (not part of the job) also uses the device
+    sampler.set(proc.pid, 512)
+    sampler.set(os.getpid(), 9999)
+    mon.start()
+    mon.join()
+    metrics = mon()
+    assert mon.num_samples > 1
+    assert metrics["gpu_memory_mb_peak"] == 512
+    assert metrics["gpu_memory_mb_avg"]  == 512
+    assert set(decode_series(mon.encode_series())["gpu_memory_mb"]) == {512}
+
+
+def test_gpu_average_and_peak():
+    sampler   = FakeSampler()
+    proc, mon = monitor(["sleep", "1"], sampler)
+    sampler.set(proc.pid, 256)
+    mon.start()
+    sleep(0.5)
+    sampler.set(proc.pid, 1024)
+    mon.join()
+    metrics = mon()
+    assert metrics["gpu_memory_mb_peak"] == 1024
+    assert 256 < metrics["gpu_memory_mb_avg"] < 1024
+    column = decode_series(mon.encode_series())["gpu_memory_mb"]
+    assert column[0] == 256 and column[-1] == 1024
+
+
+def test_gpu_usage_outside_the_job():
+    proc = Popen("sleep 0.3", accounting="psutil", gpu_sampler=FakeSampler({os.getpid():9999}), grace_period=0.1)
+    proc.run_async()
+    proc.wait()
+    assert proc.metrics()["gpu_memory_mb_peak"] == 0
+    assert proc.metrics()["gpu_memory_mb_avg"]  == 0
+
+
+def test_no_visible_device():
+    assert isinstance(get_gpu_sampler(visible_devices="-1"), NullSampler)
+
+
+def test_incomplete_sampler():
+    class Sampler(GPUSampler):
+        pass
+    with pytest.raises(TypeError):
+        Sampler()
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import pytest
+
+from argparse             import Namespace
+from time                 import time
+from conftest             import create_task_db
+from novacula.status      import JobStatus
+from novacula.parsers.job import run_job, worker, worker_parser
+
+
+class FakeJob:
+
+    def __init__(self, kill_after : float=None):
+        self.statuses   = []
+        self.metrics    = None
+        self.kill_after = kill_after
+        self.started    = time()
+
+    def start(self):
+        self.started = time()
+
+    def update_status(self, status):
+        self.statuses.append(status)
+
+    def ping(self):
+        pass
+
+    def update_metrics(self, metrics, exitcode=None, series=None):
+        self.metrics = dict(metrics, exitcode=exitcode)
+
+    def fetch_status(self):
+        if self.kill_after is not None and time() - self.started > self.kill_after:
+            return JobStatus.KILL
+        return self.statuses[-1]
+
+
+def job_args( **kwargs ) -> Namespace:
+    return Namespace( accounting="psutil", grace_period=0.2, poll_interval=0.1, runtime="native",
+                      runtime_binary=None, instance="off", **kwargs )
+
+
+def job_spec( tmp_path, command : str ) -> dict:
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "input.txt").write_text("novacula")
+    (tmp_path / "target").mkdir()
+    return {
+        "job_name"   : "",
+        "command"    : command,
+        "job_id"     : 7,
+        "task_id"    : 0,
+        "image"      : str(tmp_path / "image.sif"),
+        "input_data" : str(tmp_path / "data" / "input.txt"),
+        "outputs"    : { "OUT" : { "name" : "out.txt", "target" : str(tmp_path / "target") } },
+        "binds"      : {},
+        "task_name"  : "task",
+    }
+
+
+def test_completed( tmp_path ):
+    job = FakeJob()
+    assert run_job( job_spec(tmp_path, "cat %IN > %OUT"), job, str(tmp_path / "works"), job_args() )
+    assert job.statuses[-1] == JobStatus.COMPLETED
+    assert (tmp_path / "target" / "out.7.txt").read_text() == "novacula"
+    assert job.metrics["exitcode"] == 0
+    assert job.metrics["startup_time"] is not None
+
+
+def test_exit_code( tmp_path ):
+    job = FakeJob()
+    assert not run_job( job_spec(tmp_path, "sleep 0.5; exit 3 # %IN %OUT"), job, str(tmp_path / "works"), job_args() )
+    assert job.statuses[-1] == JobStatus.FAILED
+    assert job.metrics["exitcode"] == 3
+
+
+def test_kill_request( tmp_path ):
+    job   = FakeJob(kill_after=0.5)
+    start = time()
+    assert not run_job( job_spec(tmp_path, "sleep 30 # %IN %OUT"), job, str(tmp_path / "works"), job_args() )
+    # NOTE: the kill request is honored within a few poll intervals
+    assert time() - start < 5
+    assert job.statuses[-1] == JobStatus.KILLED
+    assert JobStatus.RUNNING in job.statuses
+
+
+def test_worker_fails_claimed_jobs( tmp_path ):
+    db_file = create_task_db( str(tmp_path / "worker.db"), njobs=3 )
+    (tmp_path / "jobs").mkdir()
+    # NOTE: no job spec to load, each claimed job raises inside its slot
+    args = worker_parser().parse_args([ "-i", str(tmp_path / "jobs"), "-t", "task", "-o", str(tmp_path / "works"),
+                                        "-d", db_file, "--agent-socket", str(tmp_path / "none.sock"),
+                                        "--workers", "2", "--runtime", "native" ])
+    with pytest.raises(SystemExit) as exit:
+        worker(args)
+    assert exit.value.code == 0
+    with sqlite3.connect(db_file) as conn:
+        assert [ status for (status,) in conn.execute("SELECT status FROM job") ] == ["FAILED"] * 3
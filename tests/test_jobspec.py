@@ -0,0 +1,49 @@
+import pytest
+
+from novacula.jobspec import JobSpecStore, load_job_spec
+
+
+def store_of( tmp_path, njobs : int ) -> JobSpecStore:
+    store = JobSpecStore( str(tmp_path / "jobs") )
+    store.write_header({"command":"echo", "task_name":"task"})
+    store.append([ {"job_id":job_id, "input_data":f"f{job_id}"} for job_id in range(njobs) ])
+    return store
+
+
+def test_align_longer_index( tmp_path ):
+    # NOTE: records written by a materialization which was never committed into the database
+    store = store_of(tmp_path, 5)
+    store.align(3)
+    store.append([ {"job_id":3, "input_data":"g3"} ])
+    assert len(store) == 4
+    assert load_job_spec(store.path, 3)["input_data"] == "g3"
+
+
+def test_align_shorter_index( tmp_path ):
+    store = store_of(tmp_path, 5)
+    # NOTE: an append interrupted after the records were written, the index lost its last entries
+    with open(store.index_file, 'r+b') as f:
+        f.truncate(2 * 16)
+    with open(store.record_file, 'ab') as f:
+        f.write(b'{"job_id":5,"inp')
+    store.align(5)
+    store.append([ {"job_id":5, "input_data":"f5"} ])
+    assert [ load_job_spec(store.path, job_id)["input_data"] for job_id in range(6) ] == [ f"f{job_id}" for job_id in range(6) ]
+
+
+def test_align_missing_records( tmp_path ):
+    store = store_of(tmp_path, 2)
+    with pytest.raises(ValueError):
+        store.align(3)
+
+
+def test_spec_of_another_job( tmp_path ):
+    store = store_of(tmp_path, 3)
+    # NOTE: an index out of line with the job ids, job 1 reads the record of job 2
+    with open(store.index_file, 'r+b') as f:
+        entries = f.read()
+        f.seek(16)
+        f.write(entries[32:48])
+    with pytest.raises(ValueError):
+        load_job_spec(store.path, 1)
+    assert load_job_spec(store.path, 2)["input_data"] == "f2"
@@ -0,0 +1,20 @@
+import sys
+import importlib
+import subprocess
+
+import novacula
+
+
+def test_lazy_names():
+    # NOTE: the lists kept in the package match the modules
+    for module_name, names in novacula.__lazy_modules__.items():
+        assert names == importlib.import_module(f"novacula.{module_name}").__all__
+        assert set(names) <= set(novacula.__all__) and set(names) <= set(dir(novacula))
+    assert novacula.Task is importlib.import_module("novacula.models").Task
+    assert novacula.Flow is importlib.import_module("novacula.provider").Flow
+
+
+def test_missing_name_does_not_load_the_orm():
+    code = "import sys, novacula; assert not hasattr(novacula, 'missing'); print('sqlalchemy' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "False"
@@ -0,0 +1,57 @@
+import psutil
+
+from time               import time
+from concurrent.futures import ThreadPoolExecutor
+
+from novacula.popen import Popen
+from novacula.gpu   import NullSampler
+
+
+def run( command : str, grace_period : float=0.1 ) -> Popen:
+    proc = Popen(command, accounting="psutil", gpu_sampler=NullSampler(), grace_period=grace_period)
+    proc.run_async()
+    proc.wait()
+    return proc
+
+
+def test_short_commands_complete():
+    # NOTE: a command exiting right away may be reaped by the monitor before the job handle is taken
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list( pool.map(lambda _ : run("true").status(), range(200)) )
+    assert statuses.count("completed") == len(statuses)
+
+
+def test_exit_code():
+    proc = run("sleep 0.3; exit 3")
+    assert proc.exitcode == 3
+    assert proc.status() == "failed"
+
+
+def test_broken_start():
+    proc = Popen("exit 1", accounting="psutil", gpu_sampler=NullSampler(), grace_period=1)
+    assert not proc.run_async()
+    assert proc.status() == "broken"
+
+
+def test_wait_timeout_and_kill():
+    proc = Popen("sleep 30 & sleep 30; wait", accounting="psutil", gpu_sampler=NullSampler(), grace_period=0.1)
+    assert proc.run_async()
+    children = psutil.Process().children(recursive=True) # the job shell and its sleeps
+    start = time()
+    assert not proc.wait(timeout=0.3)
+    assert time() - start < 1
+    proc.kill()
+    assert proc.status() == "killed"
+    # NOTE: the whole process group is killed, no orphan is left behind
+    assert not [ child for child in children if child.is_running() and child.status() != psutil.STATUS_ZOMBIE ]
+
+
+def test_kill_while_exiting( monkeypatch ):
+    proc = Popen("sleep 30", accounting="psutil", gpu_sampler=NullSampler(), grace_period=0.1)
+    proc.run_async()
+    # NOTE: the job exits between the alive check and the children lookup
+    def children( self, recursive=False ):
+        raise psutil.NoSuchProcess(self.pid)
+    monkeypatch.setattr(psutil.Process, "children", children)
+    proc.kill()
+    assert proc.status() == "killed"
@@ -0,0 +1,23 @@
+import sqlite3
+import pytest
+
+from sqlalchemy.orm import Session
+from conftest       import create_task_db
+from novacula       import retry
+from novacula.db    import DBService
+
+
+def test_summary_retries_once( tmp_path, monkeypatch ):
+    db_service = DBService( create_task_db( str(tmp_path / "retry.db"), njobs=2 ) )
+    task = db_service.task("task")
+    assert task.fetch_summary()["summary"]["assigned"] == 2
+    def locked( self, *args, **kwargs ):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(Session, "query", locked)
+    monkeypatch.setattr(retry, "sleep", lambda _ : None)
+    retry.reset_lock_stats()
+    with pytest.raises(sqlite3.OperationalError):
+        task.fetch_summary()
+    # NOTE: a single retry loop, not one nested into another
+    assert retry.get_lock_stats()["retries"]  == 10
+    assert retry.get_lock_stats()["failures"] == 1
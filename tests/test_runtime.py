@@ -0,0 +1,75 @@
+import os
+import pytest
+
+from novacula.runtime import SingularityRuntime, get_runtime
+
+
+# NOTE: a fake runtime binary, logging each call. The instances of images named broken* fail to start
+STUB = """#!/bin/bash
+echo "$*" >> "$STUB_LOG"
+if [ "$1" == "instance" ] && [ "$2" == "start" ]; then
+    case "$(basename "${@: -2:1}")" in broken*) exit 255;; esac
+fi
+exit 0
+"""
+
+
+@pytest.fixture
+def stub( tmp_path, monkeypatch ):
+    bin = tmp_path / "bin"
+    bin.mkdir()
+    (bin / "singularity").write_text(STUB)
+    (bin / "singularity").chmod(0o755)
+    log = tmp_path / "calls.log"
+    monkeypatch.setenv("PATH", f"{bin}:{os.environ['PATH']}")
+    monkeypatch.setenv("STUB_LOG", str(log))
+    return lambda : log.read_text().splitlines() if log.exists() else []
+
+
+def test_one_instance_per_image_and_binds( stub, tmp_path ):
+    image = tmp_path / "image.sif"
+    image.write_text("")
+    link  = tmp_path / "job_1.sif"
+    link.symlink_to(image)
+    with SingularityRuntime(instance=True) as runtime:
+        first  = runtime.command("/works/job_0/entrypoint.sh", str(image), {"/data":"/data"})
+        # NOTE: the jobs link the image into their workarea, the instance is shared by the real image
+        second = runtime.command("/works/job_1/entrypoint.sh", str(link), {"/data":"/data"})
+        other  = runtime.command("/works/job_2/entrypoint.sh", str(image), {})
+    starts = [ call for call in stub() if call.startswith("instance start") ]
+    stops  = [ call for call in stub() if call.startswith("instance stop") ]
+    assert len(starts) == 2 and len(stops) == 2
+    assert starts[0] == f"instance start --nv --writable-tmpfs --bind /data:/data {image} {first.split('instance://')[1].split()[0]}"
+    assert first.split()[:2] == ["singularity", "exec"] and "instance://" in first
+    assert first.replace("job_0", "job_1") == second
+    assert other.split()[2] != first.split()[2]
+
+
+def test_exec_fallback( stub, tmp_path ):
+    image = tmp_path / "broken.sif"
+    image.write_text("")
+    with SingularityRuntime(instance=True) as runtime:
+        command = runtime.command("/works/job_0/entrypoint.sh", str(image), {"/a":"/b"})
+        assert command == f"singularity exec --nv --writable-tmpfs --bind /a:/b {image} bash /works/job_0/entrypoint.sh"
+        # NOTE: not retried for the next jobs of the same image
+        runtime.command("/works/job_1/entrypoint.sh", str(image), {"/a":"/b"})
+    assert [ call.split()[:2] for call in stub() ] == [["instance", "start"]]
+    assert get_runtime("singularity").command("/e.sh", "/i.sif") == "singularity exec --nv --writable-tmpfs /i.sif bash /e.sh"
+
+
+def test_instance_stopped_on_error( stub, tmp_path ):
+    image = tmp_path / "image.sif"
+    image.write_text("")
+    with pytest.raises(RuntimeError):
+        with SingularityRuntime(instance=True) as runtime:
+            runtime.command("/works/job_0/entrypoint.sh", str(image))
+            raise RuntimeError("job runner failure")
+    assert [ call.split()[:2] for call in stub() ] == [["instance", "start"], ["instance", "stop"]]
+
+
+def test_template_with_shell_braces():
+    runtime = get_runtime("podman run --rm -v ${HOME}:/home -v {binds} {image} bash -c 'echo {a,b}; bash {entrypoint}'")
+    command = runtime.command("/works/job_0/entrypoint.sh", "/images/{tag}.sif", {"/data":"/data"})
+    assert command == "podman run --rm -v ${HOME}:/home -v /data:/data /images/{tag}.sif bash -c 'echo {a,b}; bash /works/job_0/entrypoint.sh'"
+    with pytest.raises(ValueError):
+        get_runtime("podman run {image} ${HOME}")
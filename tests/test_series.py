@@ -0,0 +1,23 @@
+from novacula.series import ResourceSeries, decode_series
+
+
+def test_partial_point_is_kept():
+    series = ResourceSeries(capacity=4)
+    # NOTE: 4 points at stride 1, then the buffer is downsampled and the stride becomes 2
+    for index in range(5):
+        series.append(index, {"cpu_percent":10, "sys_memory_mb":100, "gpu_memory_mb":0})
+    # NOTE: half of the next point of stride 2, with the peak of the job
+    series.append(5, {"cpu_percent":90, "sys_memory_mb":500, "gpu_memory_mb":40})
+    columns = series.columns()
+    assert columns["time"][-1]          == 5
+    assert columns["cpu_percent"][-1]   == 90
+    assert max(columns["sys_memory_mb"]) == 500
+    assert max(columns["gpu_memory_mb"]) == 40
+    assert decode_series(series.to_bytes()) == columns
+
+
+def test_short_series():
+    series = ResourceSeries()
+    series.append(0.5, {"cpu_percent":25, "sys_memory_mb":12, "gpu_memory_mb":0})
+    assert decode_series(series.to_bytes())["sys_memory_mb"] == [12]
+    assert len(series) == 1